@@ -0,0 +1,8 @@
+import os
+
+# Скомпилированные numba функции librosa сохраняются между перезапусками воркеров.
+# Переменную нужно задать до первого импорта numba
+os.environ.setdefault(
+    "NUMBA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "similarity_service", "numba"),
+)
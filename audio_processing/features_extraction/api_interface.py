@@ -2,18 +2,99 @@
 
 import os
 import sys
+import threading
+import time
 from time import sleep
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
-import requests
+
+from .http_session import get_session
+from .metrics import Counter, Histogram
+from .token_cache import get_token_cache
 
 load_dotenv()
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
+# Ограничения Web API на количество id в одном запросе
+MAX_TRACK_IDS = 50
+MAX_ALBUM_IDS = 20
+MAX_PAGE_LIMIT = 50
+
+SPOTIFY_REQUEST_SECONDS = Histogram("spotify_request_seconds", "Spotify Web API request latency by response status", ["status"])
+SPOTIFY_RATE_LIMIT_WAIT_SECONDS = Histogram("spotify_rate_limit_wait_seconds", "Time spent waiting for the rate limiter before a request")
+SPOTIFY_RETRIES = Counter("spotify_retries_total", "Spotify requests retried, by reason", ["reason"])
+SPOTIFY_FAILURES = Counter("spotify_failures_total", "Spotify requests that failed after retries, by reason", ["reason"])
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all interface instances of the process.
+    Tokens refill at `rate` per second up to `capacity`; a 429 pauses the bucket for Retry-After seconds.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            # После паузы не отдаём накопленный запас разом
+            self.tokens = 0
+            self.updated = max(self.updated, self.paused_until)
+
+
+rate_limiter = RateLimiter(
+    rate=float(os.environ.get("SPOTIFY_RATE_LIMIT", 10)),
+    capacity=float(os.environ.get("SPOTIFY_RATE_BURST", 10)),
+)
+
+
+def chunked(items: List[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_id_from_href(href: str) -> str:
+    return href.rstrip("/").rsplit("/", maxsplit=1)[1].split("?", maxsplit=1)[0]
+
+
+def get_clean_track(track: dict) -> Dict[str, object]:
+    return {
+        "artists": [artist["name"] for artist in track.get("artists")],
+        "name": track.get("name"),
+        "preview_url": track.get("preview_url"),
+    }
+
+
 class BaseSpotifyApiInterface:
-    requests_count = 0
+    max_rate_limit_retries = 5
+    max_auth_retries = 2
     
     def __init__(self) -> None:
         self.client_id = os.environ.get("CLIENT_ID", None)
@@ -22,8 +103,10 @@ class BaseSpotifyApiInterface:
             raise ValueError("Should be set client id and client secret to env")
         self.authorization = None
         self.proxies: dict[str:str] = None
+        # Токен общий для всех экземпляров процесса, а не запрашивается на каждый Flask запрос
+        self.token_cache = get_token_cache(self.client_id, self._fetch_token)
 
-    def _set_token(self) -> None:
+    def _fetch_token(self) -> Tuple[str, float]:
         url = "https://accounts.spotify.com/api/token"
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         body = {
@@ -31,12 +114,15 @@ class BaseSpotifyApiInterface:
             "client_id": self.client_id,
             "client_secret": self.client_secret
         }
-        response = requests.post(url=url, headers=headers, data=body)
+        response = get_session().post(url=url, headers=headers, data=body)
         if response.status_code != 200:
             raise PermissionError("something went wrong")
         response_json = response.json()
         
-        self.authorization =  f"{response_json['token_type']} {response_json['access_token']}"
+        return f"{response_json['token_type']} {response_json['access_token']}", response_json.get("expires_in", 3600)
+
+    def _set_token(self) -> None:
+        self.authorization = self.token_cache.get()
 
     def _set_proxy(self):
         proxy_host = os.environ.get("PROXY_HOST")
@@ -50,6 +136,8 @@ class BaseSpotifyApiInterface:
         }
 
     def _get_headers(self) -> dict[str, str | None]:
+        # Долгий обход получает уже обновлённый в фоне токен
+        self._set_token()
         return {"Authorization": self.authorization}
 
     def _prepare_request(self):
@@ -58,83 +146,122 @@ class BaseSpotifyApiInterface:
         if self.proxies is None:
             self._set_proxy()
 
-    def _make_request(self, url: str, headers: dict, method="get"):
-        response = requests.request(method, url, headers=headers, proxies=self.proxies)
+    def _make_request(self, url: str, headers: dict, method="get", params: Optional[dict] = None,
+                      rate_limit_retries=0, auth_retries=0):
+        with SPOTIFY_RATE_LIMIT_WAIT_SECONDS.time():
+            rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, headers=headers, params=params, proxies=self.proxies)
+        except Exception:
+            SPOTIFY_FAILURES.inc(reason="connection")
+            raise
+        SPOTIFY_REQUEST_SECONDS.observe(time.perf_counter() - start, status=response.status_code)
         
         if response.status_code == 200:
             return response.json()
+        elif response.status_code == 429:
+            if rate_limit_retries >= self.max_rate_limit_retries:
+                SPOTIFY_FAILURES.inc(reason="rate_limit")
+                raise ConnectionError("Spotify rate limit exceeded")
+            SPOTIFY_RETRIES.inc(reason="rate_limit")
+            rate_limiter.pause(float(response.headers.get("Retry-After", 1)))
+            return self._make_request(url, headers, method, params, rate_limit_retries + 1, auth_retries)
         elif response.status_code == 401:
-            if not self.requests_count == 2:
-                self.requests_count += 1
-                self._set_token()
-                sleep(2)
-                return self._make_request(url, headers, method)
-            else:
+            # Счётчик попыток свой у каждого вызова, а не общий на весь процесс
+            if auth_retries >= self.max_auth_retries:
+                SPOTIFY_FAILURES.inc(reason="unauthorized")
                 raise PermissionError(f"Spotify service not working: {response.status_code}")
+            SPOTIFY_RETRIES.inc(reason="unauthorized")
+            self.token_cache.invalidate(headers.get("Authorization"))
+            return self._make_request(url, self._get_headers(), method, params, rate_limit_retries, auth_retries + 1)
         elif response.status_code == 403:
+            SPOTIFY_FAILURES.inc(reason="forbidden")
             raise PermissionError("Bad proxies")
         else:
+            SPOTIFY_FAILURES.inc(reason="unknown")
             raise ConnectionError(f"Unknown error: {response.status_code}")
         
 
 class SpotifyApiInterface(BaseSpotifyApiInterface):
 
+    def _iter_pages(self, url: str, params: Optional[dict] = None) -> Iterator[dict]:
+        """Follows `next` links of a paging object"""
+        while url:
+            page = self._make_request(url=url, headers=self._get_headers(), params=params)
+            yield page
+            url, params = page.get("next"), None
+
     def get_all_albums_by_atrist_id(self, artist_id: str):
         self._prepare_request()
         url = f"https://api.spotify.com/v1/artists/{artist_id}/albums"
-        headers = self._get_headers()
-        return self._make_request(url=url, headers=headers)
+        items = []
+        for page in self._iter_pages(url, params={"limit": MAX_PAGE_LIMIT}):
+            items.extend(page.get("items"))
+        return {"items": items}
         
     def get_links_from_albums_list(self, json_data):
         return [album.get("href") for album in json_data["items"]]
 
-    def get_data_for_tracks(self, albums_list: List[str]):
+    def get_albums(self, album_ids: List[str]) -> Iterator[dict]:
+        """Full album objects, up to MAX_ALBUM_IDS per request"""
         self._prepare_request()
-        headers = self._get_headers()
-    
-        headers = {"Authorization": self.authorization}
+        url = "https://api.spotify.com/v1/albums"
+        for batch in chunked(album_ids, MAX_ALBUM_IDS):
+            response_json = self._make_request(url=url, headers=self._get_headers(), params={"ids": ",".join(batch)})
+            yield from (album for album in response_json.get("albums") if album)
 
-        tracks_credentials = []
-        for album in albums_list:
-            album_id = album.rsplit("/", maxsplit=1)[1]
-            url = f"https://api.spotify.com/v1/albums/{album_id}/tracks"
-            track_json = self._make_request(url, headers)
-            
-            for track in track_json.get("items"):
-                tracks_credentials.append(track.get("href"))
+    def get_album_tracks(self, album: dict) -> List[dict]:
+        """Tracks embedded in an album payload, remaining pages only for albums longer than one page"""
+        tracks = list(album["tracks"].get("items"))
+        next_url = album["tracks"].get("next")
+        if next_url:
+            for page in self._iter_pages(next_url):
+                tracks.extend(page.get("items"))
+        return tracks
 
-        return tracks_credentials
+    def get_data_for_tracks(self, albums_list: List[str]):
+        album_ids = [get_id_from_href(album) for album in albums_list]
+        return [
+            track.get("href")
+            for album in self.get_albums(album_ids)
+            for track in self.get_album_tracks(album)
+        ]
+
+    def get_preview_tracks_by_albums(self, albums_list: List[str]):
+        """Preview data straight from album payloads, without a request per track"""
+        album_ids = [get_id_from_href(album) for album in albums_list]
+        return [
+            get_clean_track(track)
+            for album in self.get_albums(album_ids)
+            for track in self.get_album_tracks(album)
+        ]
         
     def get_preview_tracks_by_hrefs(self, tracks_href):
         self._prepare_request()
+        url = "https://api.spotify.com/v1/tracks"
+        track_ids = [get_id_from_href(href) for href in tracks_href]
         tracks_credentials = []
-        for href in tracks_href:
+        for batch in chunked(track_ids, MAX_TRACK_IDS):
             response_json = self._make_request(
-                url=href,
+                url=url,
                 headers=self._get_headers(),
-                method="get"
+                method="get",
+                params={"ids": ",".join(batch)},
             )
-            tracks_credentials.append({
-                "artists": [artist["name"] for artist in response_json.get("artists")],
-                "name": response_json.get("name"),
-                "preview_url": response_json.get("preview_url"),
-            })
+            tracks_credentials.extend(get_clean_track(track) for track in response_json.get("tracks") if track)
         return tracks_credentials
     
     def get_preview_tracks_from_album(self, album_id):
         self._prepare_request()
         url = f"https://api.spotify.com/v1/albums/{album_id}/tracks"
-        return self._make_request(url=url, headers=self._get_headers())
+        items = []
+        for page in self._iter_pages(url, params={"limit": MAX_PAGE_LIMIT}):
+            items.extend(page.get("items"))
+        return {"items": items}
     
     def get_clean_data_from_preview_json(self, json_data):
-        tracks_credentials = []
-        for track in json_data:
-            tracks_credentials.append({
-                "artists": [artist["name"] for artist in track.get("artists")],
-                "name": track.get("name"),
-                "preview_url": track.get("preview_url"),
-            })
-        return tracks_credentials
+        return [get_clean_track(track) for track in json_data]
 
 # interface = SpotifyApiInterface()
 # albums_list = interface.get_all_albums_by_atrist_id("1F8usyx5PbYGWxf0bwdXwA")
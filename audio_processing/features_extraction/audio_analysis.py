@@ -1,21 +1,41 @@
+import io
+import time
+from contextlib import contextmanager
 from tempfile import NamedTemporaryFile
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import librosa
 import numpy as np
+import soundfile
 
-import requests
-from scipy.spatial import distance
-from scipy.fftpack import dct
-from mutagen.mp3 import MP3
+from .http_session import get_session
+from .signature_store import from_bytes, to_bytes
+
+# scipy.spatial, scipy.fftpack и mutagen импортируются в методах, которые их используют:
+# только они стоят ~0.5s при импорте модуля, а воркеру сигнатур нужна лишь часть из них
+
+# Политики ресемплинга при загрузке: целевая частота и метод librosa.resample.
+# "hq" даёт сигнатуры v 1.3.0, остальные быстрее, расхождение меряет scripts/benchmark_resampling.py
+RESAMPLING_POLICIES = {
+    "hq": {"sr": 15500, "res_type": "soxr_hq"},
+    "fast": {"sr": 15500, "res_type": "soxr_lq"},
+    "decimate_11025": {"sr": 11025, "res_type": "polyphase"},
+    "decimate_22050": {"sr": 22050, "res_type": "polyphase"},
+    "native": {"sr": None, "res_type": None},
+}
 
 class AudioProcessing:
-    """v 1.2.1"""
+    """v 1.3.0"""
+    VERSION = __doc__
+    SAMPLE_RATE = 15500
     HOP_LENGTH = 512
     N_FFT = None
 
-    def __init__(self, filename) -> None:
+    def __init__(self, filename, resampling="hq") -> None:
+        if resampling not in RESAMPLING_POLICIES:
+            raise ValueError("Unknown resampling policy")
         self.filename = filename
+        self.resampling = resampling
 
         self.y: Optional[np.ndarray] = None
         self.sr: Optional[int] = None
@@ -31,64 +51,274 @@ class AudioProcessing:
         self.mel_spectrogram: Optional[np.ndarray] = None
         self.tonnetz: Optional[np.ndarray] = None
 
-    def get_duration(self):
-        return MP3(self.filename).info.length
-
-    def load_file(self, duration=None, is_url=False) -> None:
-            try:
+        # Гармоническая / перкуссионная составляющие (комплексные STFT после HPSS)
+        self.stft_harmonic: Optional[np.ndarray] = None
+        self.stft_percussive: Optional[np.ndarray] = None
+
+        # Время выполнения каждой стадии, секунды
+        self.timings: Dict[str, float] = {}
+
+        # Промежуточные представления, общие для всех признаков трека
+        self._stft: Optional[np.ndarray] = None
+        self._stft_magnitude: Optional[np.ndarray] = None
+        self._mel_power: Optional[np.ndarray] = None
+        self._onset_envelope: Optional[np.ndarray] = None
+
+    def get_extraction_params(self) -> dict:
+        """Everything besides the audio itself that determines the extracted features"""
+        return {
+            "version": self.VERSION,
+            "resampling": self.resampling,
+            "sample_rate": RESAMPLING_POLICIES[self.resampling]["sr"],
+            "hop_length": self.HOP_LENGTH,
+            "n_fft": self.N_FFT,
+        }
+
+    def get_duration(self) -> float:
+        """Duration from the stream header only: Xing/VBRI frame or bitrate for mp3, soundfile info for other formats"""
+        if self.filename.lower().endswith(".mp3"):
+            # MP3 начинает поиск кадра после ID3v2 по размеру тега, а не перебором синхрослов:
+            # в большой обложке найдётся ложный заголовок кадра и с ним неверная длительность
+            from mutagen.mp3 import MP3
+            return MP3(self.filename).info.length
+        return soundfile.info(self.filename).duration
+
+    @staticmethod
+    def get_excerpts(total_duration: float, n_excerpts=3, excerpt_duration=10.0) -> List[Tuple[float, float]]:
+        """Evenly spread (offset, duration) windows across the track"""
+        if total_duration <= n_excerpts * excerpt_duration:
+            return [(0.0, total_duration)]
+        step = (total_duration - excerpt_duration) / (n_excerpts - 1) if n_excerpts > 1 else 0.0
+        return [(i * step, excerpt_duration) for i in range(n_excerpts)]
+
+    def load_file(self, duration=None, is_url=False, offset=0.0, excerpts: Optional[Sequence[Tuple[float, float]]] = None) -> None:
+        """
+        :param duration: seconds to decode starting at `offset`, whole track if None.
+        :param excerpts: (offset, duration) windows to decode instead, joined into one signal.
+            Windows are reached by seeking in the compressed stream, the skipped audio is never decoded.
+        """
+        self._reset_intermediates()
+        try:
+            with self._timed("load"):
                 if not is_url:
-                    self.y, self.sr = librosa.load(self.filename, duration=duration, sr=15500)
+                    self.y, self.sr = self._decode(self.filename, duration=duration, offset=offset, excerpts=excerpts)
                 else:
-                    with requests.get(self.filename, stream=True) as response:
+                    with get_session().get(self.filename) as response:
                         response.raise_for_status()
-                        with NamedTemporaryFile(delete=True, suffix=".mp3") as tmp_file:
-                            for chunk in response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    tmp_file.write(chunk)
-                            tmp_file.flush()
-                            self.y, self.sr = librosa.load(tmp_file.name, duration=duration, sr=15500)
-            except Exception as ex:
-                raise ValueError(f"Error loading file: {ex}")
+                        self._decode_bytes(response.content, duration=duration, offset=offset, excerpts=excerpts)
+        except Exception as ex:
+            raise ValueError(f"Error loading file: {ex}")
+
+    def load_bytes(self, data: bytes, duration=None, offset=0.0, excerpts: Optional[Sequence[Tuple[float, float]]] = None) -> None:
+        """Loads an already downloaded file from memory, same windowing options as `load_file`"""
+        self._reset_intermediates()
+        try:
+            with self._timed("load"):
+                self._decode_bytes(data, duration=duration, offset=offset, excerpts=excerpts)
+        except Exception as ex:
+            raise ValueError(f"Error loading file: {ex}")
+
+    def _decode_bytes(self, data: bytes, **window) -> None:
+        """
+        Decodes straight from an in-memory buffer through soundfile (libsndfile >= 1.1 reads mp3).
+        Only codecs soundfile can't handle are spooled to a temporary file for audioread, which needs a path.
+        """
+        try:
+            self.y, self.sr = self._decode(io.BytesIO(data), **window)
+        except soundfile.SoundFileRuntimeError:
+            with NamedTemporaryFile(delete=True, suffix=".mp3") as tmp_file:
+                tmp_file.write(data)
+                tmp_file.flush()
+                self.y, self.sr = self._decode(tmp_file.name, **window)
+
+    def _decode(self, source, duration=None, offset=0.0, excerpts=None):
+        policy = RESAMPLING_POLICIES[self.resampling]
+        if excerpts is None:
+            excerpts = [(offset, duration)]
+
+        try:
+            y, sr_native = self._read_excerpts(source, excerpts)
+        except soundfile.SoundFileRuntimeError:
+            if not isinstance(source, str):
+                raise
+            # audioread не умеет seek и декодирует файл последовательно до каждого окна
+            chunks = [librosa.load(source, offset=o, duration=d, sr=None, mono=True) for o, d in excerpts]
+            y, sr_native = np.concatenate([chunk for chunk, _ in chunks]), chunks[0][1]
+
+        if policy["sr"] is None:
+            return y, sr_native
+        # Входит и в "load": декодирование = load - resample
+        with self._timed("resample"):
+            y = librosa.resample(y, orig_sr=sr_native, target_sr=policy["sr"], res_type=policy["res_type"])
+        return y, policy["sr"]
+
+    @staticmethod
+    def _read_excerpts(source, excerpts):
+        with soundfile.SoundFile(source) as sound_file:
+            sr_native = sound_file.samplerate
+            chunks = []
+            for offset, duration in excerpts:
+                sound_file.seek(int(round(offset * sr_native)))
+                frames = -1 if duration is None else int(round(duration * sr_native))
+                chunks.append(sound_file.read(frames=frames, dtype="float32", always_2d=True))
+        y = librosa.to_mono(np.concatenate(chunks).T)
+        return y, sr_native
+
+    def _reset_intermediates(self) -> None:
+        self.stft_harmonic = None
+        self.stft_percussive = None
+        self.timings = {}
+        self._stft = None
+        self._stft_magnitude = None
+        self._mel_power = None
+        self._onset_envelope = None
+
+    # HOP_LENGTH / N_FFT are set for SAMPLE_RATE. At other rates frames are rescaled to the same duration
+    # and the analysed band is capped at SAMPLE_RATE / 2, so features stay comparable with the "hq" policy.
+    @property
+    def hop_length(self) -> int:
+        return int(round(self.HOP_LENGTH * self.sr / self.SAMPLE_RATE))
+
+    @property
+    def n_fft(self) -> int:
+        n_fft = self.N_FFT if self.N_FFT is not None else 2048
+        return int(round(n_fft * self.sr / self.SAMPLE_RATE))
+
+    @property
+    def fmax(self) -> float:
+        return min(self.sr, self.SAMPLE_RATE) / 2
+
+    @contextmanager
+    def _timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def get_stft(self) -> np.ndarray:
+        """Complex STFT of the loaded signal, computed once per track"""
+        if self._stft is None:
+            with self._timed("stft"):
+                self._stft = librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length)
+                if self.sr != self.SAMPLE_RATE:
+                    # Амплитуда бинов растёт с длиной окна, приводим к окну при SAMPLE_RATE
+                    self._stft *= self.SAMPLE_RATE / self.sr
+        return self._stft
+
+    def get_stft_magnitude(self) -> np.ndarray:
+        """Magnitude STFT of the loaded signal"""
+        if self._stft_magnitude is None:
+            self._stft_magnitude = np.abs(self.get_stft())
+        return self._stft_magnitude
+
+    def set_hpss(self) -> None:
+        """
+        Single harmonic/percussive separation stage on the shared STFT.
+        The masked spectrograms are kept in the spectral domain: chroma, tonnetz and beat tracking read them directly
+        instead of going through istft and a new stft as `librosa.effects.hpss` + `chroma_stft(y=...)` did.
+        """
+        if self.stft_harmonic is None or self.stft_percussive is None:
+            stft = self.get_stft()
+            with self._timed("hpss"):
+                self.stft_harmonic, self.stft_percussive = librosa.decompose.hpss(stft)
+
+    def get_mel_power(self) -> np.ndarray:
+        """Power mel spectrogram built from the shared STFT"""
+        if self._mel_power is None:
+            stft_magnitude = self.get_stft_magnitude()
+            with self._timed("mel"):
+                self._mel_power = librosa.feature.melspectrogram(S=stft_magnitude ** 2, sr=self.sr, n_fft=self.n_fft, fmax=self.fmax)
+        return self._mel_power
+
+    def get_onset_envelope(self) -> np.ndarray:
+        """Onset strength envelope of the percussive component, as beat_track would build it"""
+        if self._onset_envelope is None:
+            self.set_hpss()
+            with self._timed("onset"):
+                mel_percussive = librosa.feature.melspectrogram(S=np.abs(self.stft_percussive) ** 2, sr=self.sr, n_fft=self.n_fft, fmax=self.fmax)
+                self._onset_envelope = librosa.onset.onset_strength(
+                    S=librosa.power_to_db(mel_percussive),
+                    sr=self.sr,
+                    hop_length=self.hop_length,
+                    aggregate=np.median
+                )
+        return self._onset_envelope
+
+    def get_harmonic_chroma(self) -> np.ndarray:
+        """Chromagram of the harmonic component"""
+        self.set_hpss()
+        with self._timed("chroma"):
+            return librosa.feature.chroma_stft(S=np.abs(self.stft_harmonic) ** 2, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length)
 
     def set_features_base(self, use_mfcc=True, use_chromagram=True, use_rms=True, use_mel_spectrogram=True, use_tempo=True) -> None:
-        """Extraction of basic features with usage options"""
+        """
+        Extraction of basic features with usage options.
+
+        MFCC and mel spectrogram are derived from the shared STFT / mel intermediates and match the per-feature
+        librosa calls on `y` up to float rounding (rtol=1e-5, atol=1e-6).
+        Chroma uses the harmonic part and tempo the percussive part of the single HPSS stage (see `set_hpss`).
+        """
         if self.y is None or self.sr is None:
             raise ValueError("Audio file not loaded")
-        
-        y_harmonic, _ = librosa.effects.hpss(self.y)
 
         if use_mfcc:
-            self.mfcc = librosa.feature.mfcc(y=self.y, sr=self.sr, hop_length=self.HOP_LENGTH)
+            mel_power = self.get_mel_power()
+            with self._timed("mfcc"):
+                self.mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel_power), sr=self.sr)
         
         if use_chromagram:
-            self.chromagram = librosa.feature.chroma_stft(y=y_harmonic, sr=self.sr)
+            self.chromagram = self.get_harmonic_chroma()
 
         if use_rms:
-            self.rms = librosa.feature.rms(y=self.y)
+            with self._timed("rms"):
+                self.rms = librosa.feature.rms(y=self.y, frame_length=self.n_fft, hop_length=self.hop_length)
         
         if use_mel_spectrogram:
-            self.mel_spectrogram = librosa.feature.melspectrogram(y=self.y, sr=self.sr)
+            self.mel_spectrogram = self.get_mel_power()
 
         if use_tempo:
-            self.tempo, _ = librosa.beat.beat_track(y=self.y, sr=self.sr)
+            onset_envelope = self.get_onset_envelope()
+            with self._timed("tempo"):
+                self.tempo, _ = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=self.sr, hop_length=self.hop_length)
 
         if (use_mfcc and self.mfcc.size == 0) or (use_chromagram and self.chromagram.size == 0):
             raise ValueError("Some features are missing in the file")
 
-    def set_features_advanced(self, use_spectral=True, use_zcr=True, use_tonnetz=True) -> None:
-        """Advanced feature extraction with usage options"""
+    def set_features_advanced(self, use_spectral=True, use_zcr=True, use_tonnetz=True, tonnetz_source="chroma") -> None:
+        """
+        Advanced feature extraction with usage options. Spectral statistics reuse the shared magnitude STFT.
+
+        :param tonnetz_source: "chroma" projects the harmonic chromagram already computed for the base features,
+            "cqt" runs librosa's own CQT chroma on the unseparated signal (signatures up to v 1.2.1).
+        """
         if self.y is None or self.sr is None:
             raise ValueError("Audio file not loaded")
 
         if use_spectral:
-            self.spectral_centroid = librosa.feature.spectral_centroid(y=self.y, sr=self.sr)
-            self.spectral_bandwidth = librosa.feature.spectral_bandwidth(y=self.y, sr=self.sr)
+            stft_magnitude = self.get_stft_magnitude()
+            with self._timed("spectral"):
+                freq = librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft)
+                band = freq <= self.fmax
+                self.spectral_centroid = librosa.feature.spectral_centroid(S=stft_magnitude[band], sr=self.sr, freq=freq[band])
+                self.spectral_bandwidth = librosa.feature.spectral_bandwidth(S=stft_magnitude[band], sr=self.sr, freq=freq[band])
 
         if use_zcr:
-            self.zcr = librosa.feature.zero_crossing_rate(self.y)
+            with self._timed("zcr"):
+                # Доля пересечений нуля на отсчёт зависит от частоты, приводим к SAMPLE_RATE
+                zcr = librosa.feature.zero_crossing_rate(self.y, frame_length=self.n_fft, hop_length=self.hop_length)
+                self.zcr = zcr * (self.sr / self.SAMPLE_RATE)
 
         if use_tonnetz:
-            self.tonnetz = librosa.feature.tonnetz(y=self.y, sr=self.sr)
+            if tonnetz_source == "chroma":
+                chroma = self.chromagram if self.chromagram is not None else self.get_harmonic_chroma()
+                with self._timed("tonnetz"):
+                    self.tonnetz = librosa.feature.tonnetz(chroma=chroma, sr=self.sr)
+            elif tonnetz_source == "cqt":
+                with self._timed("tonnetz"):
+                    self.tonnetz = librosa.feature.tonnetz(y=self.y, sr=self.sr)
+            else:
+                raise ValueError("Unknown tonnetz source")
 
         if (use_spectral and (self.spectral_centroid.size == 0 or self.spectral_bandwidth.size == 0)) or \
            (use_zcr and self.zcr.size == 0) or (use_tonnetz and self.tonnetz.size == 0):
@@ -105,8 +335,8 @@ class AudioProcessing:
             raise ValueError("Unknown normalization type")
 
 
-    def get_file_signature(self, normalize=False, normalization_type="z-score") -> List[float]:
-        """Signuture extraction"""
+    def get_file_signature(self, normalize=False, normalization_type="z-score") -> np.ndarray:
+        """Signuture extraction, float32 vector"""
         if self.mfcc is None or self.chromagram is None:
             raise ValueError("Base features were not loaded")
 
@@ -151,8 +381,121 @@ class AudioProcessing:
         if normalize:
             signature = self.__normalize_signature(signature, normalization_type)
 
-        return signature.tolist()
-    
+        return signature.astype(np.float32)
+
+
+def _power_to_db_batch(S: np.ndarray, n_frames: np.ndarray, top_db=80.0) -> np.ndarray:
+    """librosa.power_to_db over a (N, bins, frames) batch with top_db taken per track, on its own frames only"""
+    log_spec = librosa.power_to_db(S, top_db=None)
+    valid = np.arange(S.shape[-1]) < n_frames[:, None, None]
+    peak = np.where(valid, log_spec, -np.inf).max(axis=(-2, -1), keepdims=True)
+    return np.maximum(log_spec, peak - top_db)
+
+
+def set_features_batch(audios: Sequence[AudioProcessing], tonnetz_source="chroma") -> Dict[str, float]:
+    """
+    Base and advanced features for several loaded tracks at once, same values as
+    set_features_base() + set_features_advanced() track by track.
+
+    Signals of one sample rate are zero padded into an (N, samples) matrix. STFT, mel, MFCC, RMS and ZCR
+    are single vectorised calls over the batch, each track then keeps its own 1 + len // hop frames:
+    with center padding by zeros these frames don't see the padding.
+    HPSS (median filters along time) runs batched only over tracks of equal length; chroma (tuning is
+    estimated per signal), onset envelope, beat tracking and spectral statistics stay per track.
+    :return: timings of the batched stages, seconds.
+    """
+    if not audios:
+        return {}
+    if any(audio.y is None for audio in audios):
+        raise ValueError("Audio file not loaded")
+    head = audios[0]
+    if any(audio.sr != head.sr for audio in audios):
+        raise ValueError("All tracks of a batch must have the same sample rate")
+
+    timings: Dict[str, float] = {}
+
+    @contextmanager
+    def timed(stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+    sr, n_fft, hop_length = head.sr, head.n_fft, head.hop_length
+    lengths = np.array([len(audio.y) for audio in audios])
+    n_frames = 1 + lengths // hop_length
+    y = np.zeros((len(audios), lengths.max()), dtype=np.float32)
+    for i, audio in enumerate(audios):
+        # Время загрузки трека остаётся в его timings, сбрасываются только промежуточные представления
+        load_timings = {stage: audio.timings[stage] for stage in ("load", "resample") if stage in audio.timings}
+        audio._reset_intermediates()
+        audio.timings.update(load_timings)
+        y[i, :lengths[i]] = audio.y
+
+    with timed("stft"):
+        stft = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+        if sr != head.SAMPLE_RATE:
+            stft *= head.SAMPLE_RATE / sr
+        stft_magnitude = np.abs(stft)
+
+    with timed("mel"):
+        mel_power = librosa.feature.melspectrogram(S=stft_magnitude ** 2, sr=sr, n_fft=n_fft, fmax=head.fmax)
+
+    with timed("mfcc"):
+        mfcc = librosa.feature.mfcc(S=_power_to_db_batch(mel_power, n_frames), sr=sr)
+
+    with timed("rms"):
+        rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)
+
+    with timed("zcr"):
+        # zero_crossing_rate дополняет края повтором последнего отсчёта, а не нулями
+        y_edge = y.copy()
+        for i, length in enumerate(lengths):
+            y_edge[i, length:] = y[i, length - 1]
+        zcr = librosa.feature.zero_crossing_rate(y_edge, frame_length=n_fft, hop_length=hop_length) * (sr / head.SAMPLE_RATE)
+
+    freq = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    # Полоса до fmax - префикс бинов, срез не копирует спектр
+    band = int(np.count_nonzero(freq <= head.fmax))
+    for i, audio in enumerate(audios):
+        frames = n_frames[i]
+        audio._stft = stft[i, :, :frames]
+        audio._stft_magnitude = stft_magnitude[i, :, :frames]
+        audio._mel_power = mel_power[i, :, :frames]
+        audio.mfcc = mfcc[i, :, :frames]
+        audio.mel_spectrogram = audio._mel_power
+        audio.rms = rms[i, :, :frames]
+        audio.zcr = zcr[i, :, :frames]
+        # Статистики по кадрам на всём батче упираются в память, на одном треке спектр помещается в кэш
+        with timed("spectral"):
+            audio.spectral_centroid = librosa.feature.spectral_centroid(S=audio._stft_magnitude[:band], sr=sr, freq=freq[:band])
+            audio.spectral_bandwidth = librosa.feature.spectral_bandwidth(S=audio._stft_magnitude[:band], sr=sr, freq=freq[:band])
+
+    with timed("hpss"):
+        for length in np.unique(lengths):
+            group = np.flatnonzero(lengths == length)
+            harmonic, percussive = librosa.decompose.hpss(np.stack([audios[i]._stft for i in group]))
+            for j, i in enumerate(group):
+                audios[i].stft_harmonic, audios[i].stft_percussive = harmonic[j], percussive[j]
+
+    for audio in audios:
+        audio.chromagram = audio.get_harmonic_chroma()
+        onset_envelope = audio.get_onset_envelope()
+        with audio._timed("tempo"):
+            audio.tempo, _ = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=sr, hop_length=hop_length)
+        with audio._timed("tonnetz"):
+            if tonnetz_source == "chroma":
+                audio.tonnetz = librosa.feature.tonnetz(chroma=audio.chromagram, sr=sr)
+            elif tonnetz_source == "cqt":
+                audio.tonnetz = librosa.feature.tonnetz(y=audio.y, sr=sr)
+            else:
+                raise ValueError("Unknown tonnetz source")
+        if audio.mfcc.size == 0 or audio.chromagram.size == 0 or audio.tonnetz.size == 0:
+            raise ValueError("Some features are missing in the file")
+    timings["per_track"] = sum(sum(audio.timings.values()) for audio in audios)
+    return timings
+
 
 class AudioTools:
     """
@@ -165,51 +508,159 @@ class AudioTools:
     Chebyshev Distance подходит, если вам важно знать максимальное индивидуальное отличие между признаками.
     """
 
-    def serialize_signature(self, signature_array: List[float]) -> str:
-        return ','.join(map(str, signature_array))
-
+    def serialize_signature(self, signature_array: np.ndarray) -> bytes:
+        """Raw little-endian float32, see signature_store for the pgvector binary form"""
+        return to_bytes(signature_array)
 
-    def deserialize_signature(self, signature_str: str) -> List[float]:
-        return list(map(float, signature_str.split(',')))
+    def deserialize_signature(self, signature_bytes: bytes) -> np.ndarray:
+        return from_bytes(signature_bytes)
 
-    def reduce_with_dct(self, signature: List[float], n_components: int) -> List[float]:
+    def reduce_with_dct(self, signature: np.ndarray, n_components: int) -> np.ndarray:
         """
         Снижает размерность вектора признаков с помощью DCT, сохраняя первые n_components коэффициентов.
 
-        :param signature: исходный вектор признаков.
+        :param signature: исходный вектор признаков (или матрица, по строке на трек).
         :param n_components: количество коэффициентов для сохранения.
-        :return: вектор признаков уменьшенной размерности.
+        :return: float32 вектор признаков уменьшенной размерности.
         """
-        signature_array = np.array(signature)
-        dct_coefficients = dct(signature_array, norm='ortho')
-        reduced_signature = dct_coefficients[:n_components]
-        return reduced_signature.tolist()
+        from scipy.fftpack import dct
+        # DCT считается в float64, хранится результат в float32
+        dct_coefficients = dct(np.asarray(signature, dtype=np.float64), norm='ortho', axis=-1)
+        return dct_coefficients[..., :n_components].astype(np.float32)
 
     def get_cos_similarity(self, signature1: List[float], signature2: List[float]):
+        from scipy.spatial import distance
         cos_sim = distance.cosine(signature1, signature2)
         return cos_sim
 
 
     def get_euclidean_distance(self, signature1: List[float], signature2: List[float]):
+        from scipy.spatial import distance
         dist = distance.euclidean(signature1, signature2)
         return dist
 
 
     def get_manhattan_distance(self, signature1: List[float], signature2: List[float]):
+        from scipy.spatial import distance
         dist = distance.cityblock(signature1, signature2)
         return dist
 
 
     def get_chebyshev_distance(self, signature1: List[float], signature2: List[float]):
+        from scipy.spatial import distance
         dist = distance.chebyshev(signature1, signature2)
         return dist
 
 
     def get_minkowski_distance(self, signature1: List[float], signature2: List[float]):
+        from scipy.spatial import distance
         dist = distance.minkowski(signature1, signature2)
         return dist
 
 
     def get_correlation_distance(self, signature1: List[float], signature2: List[float]):
+        from scipy.spatial import distance
         dist = distance.correlation(signature1, signature2)
-        return dist
\ No newline at end of file
+        return dist
+
+    # Пакетные версии метрик: одна сигнатура (D,) или матрица запросов (M, D) против матрицы сигнатур (N, D)
+    BATCH_METRICS = ("cosine", "euclidean", "manhattan", "chebyshev", "minkowski", "correlation")
+
+    def get_batch_distances(self, query: np.ndarray, signatures: np.ndarray, metric="manhattan", p=2, dtype=np.float32) -> np.ndarray:
+        """
+        All distances at once, same values as the pairwise get_*_distance methods up to float32 rounding
+        (euclidean goes through |q|^2 + |s|^2 - 2 q.s, so near-zero distances are only accurate to ~1e-3).
+
+        :param query: signature (D,) or query matrix (M, D).
+        :param signatures: signature matrix (N, D).
+        :param metric: one of BATCH_METRICS.
+        :param p: order of the minkowski distance.
+        :return: distances (N,) for a single query, (M, N) for a query matrix.
+        """
+        if metric not in self.BATCH_METRICS:
+            raise ValueError("Unknown metric")
+        signatures = np.asarray(signatures, dtype=dtype)
+        queries = np.atleast_2d(np.asarray(query, dtype=dtype))
+
+        if metric in ("euclidean", "cosine", "correlation"):
+            # Через матричное произведение (BLAS) без промежуточного массива (M, N, D)
+            if metric == "correlation":
+                queries = queries - queries.mean(axis=1, keepdims=True)
+                signatures = signatures - signatures.mean(axis=1, keepdims=True)
+            dot = queries @ signatures.T
+            query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+            signature_norms = np.einsum("ij,ij->i", signatures, signatures)[None, :]
+            if metric == "euclidean":
+                distances = np.sqrt(np.maximum(query_norms + signature_norms - 2 * dot, 0))
+            else:
+                distances = 1 - dot / np.sqrt(query_norms * signature_norms)
+        elif queries.shape[0] == 1:
+            diff = np.abs(signatures - queries[0])
+            if metric == "manhattan":
+                distances = diff.sum(axis=1)[None, :]
+            elif metric == "chebyshev":
+                distances = diff.max(axis=1)[None, :]
+            else:
+                distances = (diff ** p).sum(axis=1)[None, :] ** (1 / p)
+        else:
+            from scipy.spatial import distance
+            scipy_metric = "cityblock" if metric == "manhattan" else metric
+            kwargs = {"p": p} if metric == "minkowski" else {}
+            distances = distance.cdist(queries, signatures, metric=scipy_metric, **kwargs).astype(dtype)
+
+        return distances[0] if np.ndim(query) == 1 else distances
+
+    def get_top_k(self, query: np.ndarray, signatures: np.ndarray, k=20, metric="manhattan", p=2) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest signatures to a single query, argpartition instead of a full sort.
+
+        :return: (indices, distances) sorted by distance.
+        :raise ValueError: query is not a single vector.
+        """
+        query = np.asarray(query)
+        if query.ndim != 1:
+            raise ValueError(f"get_top_k expects a single query vector, got shape {query.shape}")
+        distances = self.get_batch_distances(query, signatures, metric=metric, p=p)
+        k = min(k, distances.shape[-1])
+        if k == 0:
+            return np.empty(0, dtype=np.int64), distances[:0]
+        indices = np.argpartition(distances, k - 1)[:k]
+        indices = indices[np.argsort(distances[indices], kind="stable")]
+        return indices, distances[indices]
+
+
+# Процесс уже прогрет (сам или унаследовал это через fork)
+_warmed_up = False
+
+
+def warm_up(seconds: float = 3.0) -> Dict[str, float]:
+    """
+    Runs the whole signature path once on a synthetic signal: decoding, resampling, every feature, DCT.
+
+    The first call in a fresh process imports librosa submodules and compiles their numba functions,
+    which otherwise lands on the first real track. Called before forking (gunicorn master, pool parent),
+    children inherit the compiled code; compiled functions are also cached in NUMBA_CACHE_DIR.
+    :return: per-stage timings of the warm-up run.
+    """
+    start = time.perf_counter()
+    sr = 22050
+    t = np.arange(int(sr * seconds)) / sr
+    # Свип с щелчками каждые 0.5s, чтобы beat_track и hpss прошли по всем веткам
+    y = 0.5 * np.sin(2 * np.pi * (220 + 220 * t / seconds) * t)
+    y[(t % 0.5) < 0.01] += 0.8
+    buffer = io.BytesIO()
+    soundfile.write(buffer, y.astype(np.float32), sr, format="WAV")
+
+    audio = AudioProcessing("warm_up.wav")
+    audio.load_bytes(buffer.getvalue())
+    audio.set_features_base()
+    audio.set_features_advanced()
+    AudioTools().reduce_with_dct(audio.get_file_signature(normalize=True, normalization_type="min-max"), n_components=110)
+    global _warmed_up
+    _warmed_up = True
+    return {**audio.timings, "total": time.perf_counter() - start}
+
+
+def ensure_warm() -> None:
+    if not _warmed_up:
+        warm_up()
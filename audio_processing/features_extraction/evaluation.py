@@ -0,0 +1,40 @@
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from .audio_analysis import AudioTools
+
+
+def evaluate_retrieval(signatures: np.ndarray, labels: Sequence[Optional[str]], ks: Sequence[int] = (1, 5, 10),
+                       metric: str = "manhattan") -> Dict[str, float]:
+    """
+    Retrieval quality of signatures over labelled groups: every track of a group with at least two
+    members queries the whole corpus (itself excluded), the other members of its group are relevant.
+    Tracks without a label (None) take part only as distractors.
+
+    :return: {"recall@k": mean share of the relevant tracks found in the top k, "map": mean average precision,
+        "queries": number of queries}.
+    """
+    labels = np.array([label if label is not None else "" for label in labels], dtype=object)
+    queries = [i for i, label in enumerate(labels) if label and np.count_nonzero(labels == label) > 1]
+    result = {f"recall@{k}": 0.0 for k in ks}
+    result.update({"map": 0.0, "queries": len(queries)})
+    if not queries:
+        return result
+
+    distances = AudioTools().get_batch_distances(signatures[queries], signatures, metric=metric)
+    for row, query in enumerate(queries):
+        order = np.argsort(distances[row], kind="stable")
+        order = order[order != query]
+        relevant = labels[order] == labels[query]
+        n_relevant = np.count_nonzero(relevant)
+        for k in ks:
+            result[f"recall@{k}"] += np.count_nonzero(relevant[:k]) / n_relevant
+        # AP: средняя точность на позициях релевантных треков
+        ranks = np.flatnonzero(relevant) + 1
+        result["map"] += float(np.mean(np.arange(1, n_relevant + 1) / ranks))
+
+    for name in result:
+        if name != "queries":
+            result[name] /= len(queries)
+    return result
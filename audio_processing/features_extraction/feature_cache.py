@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import zipfile
+from tempfile import NamedTemporaryFile
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class FeatureCache:
+    """
+    On-disk cache of per-frame feature matrices.
+
+    Entries are keyed by the sha1 of the audio file content plus the extraction parameters
+    (AudioProcessing version, resampling policy, sample rate, hop / n_fft, analysis window, feature flags),
+    so a signature with different normalization or DCT settings is re-derived without decoding the audio.
+    Matrices are stored as float32 in uncompressed .npz files, the least recently used ones are evicted
+    once the directory grows beyond max_bytes, down to low_water * max_bytes.
+    The directory size is tracked from this process's own writes and rescanned only when the estimate
+    crosses max_bytes or every rescan_interval puts (other processes write into the same directory).
+    """
+    FEATURES = (
+        "mfcc", "chromagram", "spectral_centroid", "spectral_bandwidth",
+        "zcr", "tempo", "rms", "mel_spectrogram", "tonnetz",
+    )
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3, low_water: float = 0.9, rescan_interval: int = 1000) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.rescan_interval = rescan_interval
+        # Оценка размера каталога, None - ещё не сканировался
+        self._size: Optional[int] = None
+        self._puts_since_scan = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def hash_content(filename: Optional[str] = None, data: Optional[bytes] = None) -> str:
+        content_hash = hashlib.sha1()
+        if data is not None:
+            content_hash.update(data)
+        else:
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def get_key(self, audio, data: Optional[bytes] = None, **params) -> str:
+        """
+        :param audio: AudioProcessing object, supplies version and extraction parameters.
+        :param data: file content if it's already in memory, otherwise audio.filename is read.
+        :param params: anything else that changes the features: window, feature flags.
+        """
+        content_hash = self.hash_content(audio.filename, data)
+        key_params = json.dumps({**audio.get_extraction_params(), **params}, sort_keys=True, default=str)
+        return hashlib.sha1(f"{content_hash}:{key_params}".encode()).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._get_path(key)
+        try:
+            with np.load(path) as entry:
+                features = {name: entry[name] for name in entry.files}
+            # mtime служит отметкой последнего использования для LRU
+            os.utime(path)
+        except (zipfile.BadZipFile, EOFError, ValueError) as ex:
+            # Повреждённая или обрезанная запись: удаляем, следующий put запишет её заново
+            print(f"Removing corrupt feature cache entry {path}: {ex}", flush=True)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        except OSError:
+            # Записи нет или её вытеснил другой процесс между чтением и utime
+            return None
+        return features
+
+    def put(self, key: str, features: Dict[str, np.ndarray]) -> None:
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        arrays = {name: np.asarray(value, dtype=np.float32) for name, value in features.items() if value is not None}
+        # Пишем во временный файл и переименовываем, чтобы параллельные воркеры не читали недописанную запись
+        with NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as tmp_file:
+            np.savez(tmp_file, **arrays)
+        os.replace(tmp_file.name, path)
+
+        self._puts_since_scan += 1
+        if self._size is None or self._puts_since_scan >= self.rescan_interval:
+            self._evict()
+            return
+        self._size += os.path.getsize(path) - replaced_size
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def load(self, audio, data: Optional[bytes] = None, **params) -> bool:
+        """Sets cached features on the audio object, returns False on a cache miss"""
+        features = self.get(self.get_key(audio, data, **params))
+        if features is None:
+            return False
+        for name in self.FEATURES:
+            setattr(audio, name, features.get(name))
+        return True
+
+    def store(self, audio, data: Optional[bytes] = None, **params) -> None:
+        self.put(
+            self.get_key(audio, data, **params),
+            {name: getattr(audio, name) for name in self.FEATURES}
+        )
+
+    def _evict(self) -> None:
+        """Scans the directory; above max_bytes removes the least recently used entries down to the low-water mark"""
+        self._puts_since_scan = 0
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                if not file.endswith(".npz"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, file))
+                except FileNotFoundError:
+                    # Вытеснена другим процессом во время обхода
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+                total_size += stat.st_size
+
+        if total_size > self.max_bytes:
+            # Удаляем с запасом до low_water, иначе каждая следующая запись снова запускала бы обход каталога
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_bytes * self.low_water:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+        self._size = total_size
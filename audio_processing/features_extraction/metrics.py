@@ -0,0 +1,309 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Метрики без внешних зависимостей: счётчики и гистограммы в памяти процесса, вывод в текстовом формате Prometheus.
+# Процессы пула сигнатур отдают накопленное родителю вместе с результатом задачи (drain / merge),
+# воркеры gunicorn сбрасывают снимки в METRICS_DIR, /metrics любого воркера суммирует их все.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    """
+    Metrics of one process. Values are dropped in a forked child (pid changes), so a pool process or
+    a gunicorn worker never re-reports what the parent had counted before fork.
+    """
+
+    def __init__(self, state_dir: Optional[str] = None, persist_interval: float = 1.0) -> None:
+        self.state_dir = state_dir
+        self.persist_interval = persist_interval
+        self._metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._persisted_at = 0.0
+        self._flush_timer: Optional[threading.Timer] = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def register(self, metric: "Metric") -> "Metric":
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._persisted_at = 0.0
+            # Поток таймера не переживает fork
+            self._flush_timer = None
+            for metric in self._metrics.values():
+                metric.values.clear()
+
+    def update(self, metric: "Metric", labels: Tuple[str, ...], update) -> None:
+        with self._lock:
+            self._check_pid()
+            update(metric.values, labels)
+            persist = self._should_persist()
+        if persist:
+            self.persist()
+
+    def _should_persist(self) -> bool:
+        """Called under the lock: persist now, or schedule a flush so an idle worker's file doesn't stay stale"""
+        if not self.state_dir:
+            return False
+        remaining = self._persisted_at + self.persist_interval - time.monotonic()
+        if remaining <= 0:
+            return True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(remaining, self.persist)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+        return False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_pid()
+            return {name: metric.dump() for name, metric in self._metrics.items() if metric.values}
+
+    def drain(self) -> dict:
+        """Snapshot and reset, for sending the values of a pool process to the parent"""
+        with self._lock:
+            self._check_pid()
+            snapshot = {name: metric.dump() for name, metric in self._metrics.items() if metric.values}
+            for metric in self._metrics.values():
+                metric.values.clear()
+            return snapshot
+
+    def merge(self, snapshot: dict) -> None:
+        with self._lock:
+            self._check_pid()
+            for name, dumped in snapshot.items():
+                if name in self._metrics:
+                    self._metrics[name].merge(dumped["values"])
+            persist = self._should_persist()
+        if persist:
+            self.persist()
+
+    def _get_state_path(self, pid: int) -> str:
+        return os.path.join(self.state_dir, f"{pid}.json")
+
+    def persist(self) -> None:
+        if not self.state_dir:
+            return
+        with self._lock:
+            self._persisted_at = time.monotonic()
+            self._flush_timer = None
+        snapshot = self.snapshot()
+        with NamedTemporaryFile("w", dir=self.state_dir, suffix=".tmp", delete=False) as f:
+            json.dump(snapshot, f)
+        os.replace(f.name, self._get_state_path(self._pid))
+
+    def collect(self) -> dict:
+        """Values of this process plus the snapshots other workers left in state_dir"""
+        snapshots = [self.snapshot()]
+        if self.state_dir:
+            own = f"{self._pid}.json"
+            for file_name in os.listdir(self.state_dir):
+                if not file_name.endswith(".json") or file_name == own:
+                    continue
+                try:
+                    with open(os.path.join(self.state_dir, file_name), encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        collected = {}
+        for snapshot in snapshots:
+            for name, dumped in snapshot.items():
+                if name not in self._metrics:
+                    continue
+                metric = collected.setdefault(name, type(self._metrics[name])(name, "", self._metrics[name].labelnames, registry=None, **self._metrics[name].options))
+                metric.merge(dumped["values"])
+        return collected
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        collected = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            if name in collected:
+                lines.extend(collected[name].render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(state_dir=os.environ.get("METRICS_DIR"))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = registry, **options) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.options = options
+        self.values: Dict[Tuple[str, ...], object] = {}
+        self.registry = registry
+        if registry is not None:
+            registry.register(self)
+
+    def _labels(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self) -> dict:
+        return {"values": [[list(labels), value] for labels, value in self.values.items()]}
+
+    def merge(self, values: Iterable) -> None:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        def update(values, key):
+            values[key] = values.get(key, 0.0) + amount
+        self.registry.update(self, self._labels(labels), update)
+
+    def merge(self, values: Iterable) -> None:
+        for labels, value in values:
+            key = tuple(labels)
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    """Per label set: counts per bucket (not cumulative, the last one is +Inf), sum, count"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = registry,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames, registry, buckets=tuple(buckets))
+        self.buckets = tuple(buckets)
+
+    def _empty(self) -> list:
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value: float, **labels) -> None:
+        def update(values, key):
+            counts, _, _ = state = values.setdefault(key, self._empty())
+            counts[next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))] += 1
+            state[1] += value
+            state[2] += 1
+        self.registry.update(self, self._labels(labels), update)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def dump(self) -> dict:
+        # Копия: снимок сериализуется вне блокировки, пока observe меняет списки
+        return {"values": [[list(labels), [list(counts), total, count]] for labels, (counts, total, count) in self.values.items()]}
+
+    def merge(self, values: Iterable) -> None:
+        for labels, (counts, total, count) in values:
+            state = self.values.setdefault(tuple(labels), self._empty())
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [math.inf], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class SamplingProfiler:
+    """
+    Opt-in statistical profiler: a background thread records the Python stack of every other thread
+    of this process each `interval` seconds. Output is collapsed stacks ("a;b;c count"), the input of
+    flamegraph.pl / speedscope. Pool processes are separate interpreters and are not sampled.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: StackCounter = StackCounter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.collapsed()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def profile(self, seconds: float) -> str:
+        self.start()
+        time.sleep(seconds)
+        return self.stop()
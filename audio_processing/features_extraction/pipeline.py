@@ -0,0 +1,278 @@
+import concurrent.futures
+import queue
+import signal
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Optional
+
+from .metrics import Counter, Histogram, registry
+
+# Конвейер download -> extract -> write: загрузки в потоках (сеть отпускает GIL), извлечение признаков
+# в пуле процессов, запись в БД батчами в отдельном потоке. Очереди между стадиями ограничены:
+# медленная стадия останавливает предыдущие, а не копит в памяти всё, что они успели сделать.
+
+PIPELINE_ITEMS = Counter("pipeline_items_total", "Items leaving a pipeline stage, by stage and result", ["stage", "result"])
+PIPELINE_BLOCKED_SECONDS = Histogram("pipeline_blocked_seconds", "Time a stage waited for room downstream (backpressure)", ["stage"])
+
+_DONE = object()
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("extraction timed out")
+
+
+def _run_task(extract: Callable, batch: list, timeout: Optional[float]):
+    """
+    Runs in a pool process. SIGALRM interrupts a task stuck longer than `timeout`: the exception is raised
+    at the next Python bytecode, a long call into C finishes first. Metrics travel back with the result.
+    """
+    if timeout:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = extract(batch)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return result, registry.drain()
+
+
+class Pipeline:
+    """
+    Streams items through three stages connected by bounded queues:
+
+    - download(item) -> data, in `download_workers` threads (skipped without download, data is None);
+    - extract([(item, data), ...]) -> (results, [(item, exception), ...]), tasks of `items_per_task` items
+      in a pool of `extract_workers` processes, at most 2 tasks per process in flight;
+    - write([result, ...]), one thread, a batch is written when it has `write_batch_size` results
+      or `write_interval` seconds after its first one.
+
+    A failure of one item is reported to on_failure(item, stage, exception) and doesn't stop the others.
+    extract must be picklable (a module level function or a partial of one).
+    """
+
+    def __init__(self, extract: Callable, write: Callable[[list], None], download: Optional[Callable] = None,
+                 download_workers: int = 8, extract_workers: int = 1, items_per_task: int = 1,
+                 queue_size: Optional[int] = None, write_batch_size: int = 10, write_interval: float = 5.0,
+                 extract_timeout: Optional[float] = None,
+                 on_failure: Optional[Callable[[object, str, Exception], None]] = None,
+                 is_cancelled: Optional[Callable[[], bool]] = None, initializer: Optional[Callable] = None) -> None:
+        self.extract = extract
+        self.write = write
+        self.download = download
+        self.download_workers = download_workers
+        self.extract_workers = extract_workers
+        self.items_per_task = items_per_task
+        self.max_in_flight = extract_workers * 2
+        self.queue_size = queue_size or self.max_in_flight * items_per_task
+        self.write_batch_size = write_batch_size
+        self.write_interval = write_interval
+        self.extract_timeout = extract_timeout
+        self.on_failure = on_failure
+        self.is_cancelled = is_cancelled
+        self.initializer = initializer
+
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+    def _count(self, stage: str, result: str, amount: int = 1) -> None:
+        if not amount:
+            return
+        PIPELINE_ITEMS.inc(amount, stage=stage, result=result)
+        with self._stats_lock:
+            key = f"{stage}_{result}"
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def _fail(self, item, stage: str, ex: Exception) -> None:
+        self._count(stage, "failed")
+        if self.on_failure is not None:
+            try:
+                self.on_failure(item, stage, ex)
+            except Exception as callback_ex:
+                print(f"Error reporting failure of {item}: {callback_ex}", flush=True)
+
+    def _put(self, target: queue.Queue, entry, stage: str) -> bool:
+        """Blocks while the next stage is behind; False once the pipeline is stopping"""
+        try:
+            target.put_nowait(entry)
+            return True
+        except queue.Full:
+            pass
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    target.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            PIPELINE_BLOCKED_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+    def _create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.extract_workers, initializer=self.initializer)
+
+    def run(self, items: Iterable) -> Dict[str, int]:
+        """Processes every item (or stops taking new ones once is_cancelled()), returns counts per stage and result"""
+        items = iter(items)
+        items_lock = threading.Lock()
+        downloaded: queue.Queue = queue.Queue(self.queue_size)
+        # Размер completed ограничен семафором: слот освобождается только после обработки результата
+        completed: queue.Queue = queue.Queue()
+        results: queue.Queue = queue.Queue(self.queue_size)
+        slots = threading.Semaphore(self.max_in_flight)
+        downloaders_left = [self.download_workers]
+        self._stop.clear()
+        self.stats = {}
+
+        def take():
+            with items_lock:
+                if self.is_cancelled is not None and self.is_cancelled():
+                    return _DONE
+                return next(items, _DONE)
+
+        def download_loop():
+            try:
+                while not self._stop.is_set():
+                    item = take()
+                    if item is _DONE:
+                        return
+                    try:
+                        data = self.download(item) if self.download is not None else None
+                    except Exception as ex:
+                        self._fail(item, "download", ex)
+                        continue
+                    self._count("download", "ok")
+                    if not self._put(downloaded, (item, data), "download"):
+                        return
+            finally:
+                with items_lock:
+                    downloaders_left[0] -= 1
+                    last = downloaders_left[0] == 0
+                # При остановке очередь может быть полна и никем не читаться, _put не ждёт её вечно
+                if last:
+                    self._put(downloaded, _DONE, "download")
+
+        def get_downloaded():
+            while True:
+                try:
+                    return downloaded.get(timeout=0.1)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return _DONE
+
+        def acquire_slot() -> bool:
+            # После остановки слоты больше никто не освобождает
+            while not slots.acquire(timeout=0.1):
+                if self._stop.is_set():
+                    return False
+            return True
+
+        def submit_loop():
+            executor = self._create_executor()
+            try:
+                finished = False
+                while not finished:
+                    entry = get_downloaded()
+                    if entry is _DONE:
+                        break
+                    batch = [entry]
+                    # Батч добирается тем, что уже скачано, без ожидания медленных загрузок
+                    while len(batch) < self.items_per_task:
+                        try:
+                            entry = downloaded.get_nowait()
+                        except queue.Empty:
+                            break
+                        if entry is _DONE:
+                            finished = True
+                            break
+                        batch.append(entry)
+
+                    if not slots.acquire(blocking=False):
+                        start = time.perf_counter()
+                        acquired = acquire_slot()
+                        PIPELINE_BLOCKED_SECONDS.observe(time.perf_counter() - start, stage="submit")
+                        if not acquired:
+                            break
+                    if self._stop.is_set():
+                        break
+                    try:
+                        future = executor.submit(_run_task, self.extract, batch, self.extract_timeout and self.extract_timeout * len(batch))
+                    except BrokenProcessPool:
+                        # Процесс пула упал (OOM, segfault в декодере): задачи в нём уже помечены ошибкой, пул пересоздаётся
+                        executor.shutdown(wait=False)
+                        executor = self._create_executor()
+                        future = executor.submit(_run_task, self.extract, batch, self.extract_timeout and self.extract_timeout * len(batch))
+                    future.add_done_callback(lambda f, batch=batch: completed.put((batch, f)))
+                # Все слоты свободны - все результаты обработаны
+                for _ in range(self.max_in_flight):
+                    if not acquire_slot():
+                        break
+            finally:
+                completed.put(_DONE)
+                executor.shutdown()
+
+        def write_loop():
+            batch: list = []
+            deadline = None
+            while True:
+                timeout = max(deadline - time.monotonic(), 0.0) if deadline is not None else None
+                try:
+                    entry = results.get(timeout=timeout)
+                    timed_out = False
+                except queue.Empty:
+                    entry, timed_out = None, True
+                if not timed_out and entry is not _DONE:
+                    batch.append(entry)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.write_interval
+                if batch and (timed_out or entry is _DONE or len(batch) >= self.write_batch_size):
+                    try:
+                        self.write(batch)
+                        self._count("write", "ok", len(batch))
+                    except Exception as ex:
+                        self._count("write", "failed", len(batch))
+                        print(f"Error writing {len(batch)} results: {ex}", flush=True)
+                    batch, deadline = [], None
+                if entry is _DONE:
+                    return
+
+        threads = [threading.Thread(target=download_loop, name=f"pipeline-download-{i}", daemon=True) for i in range(self.download_workers)]
+        threads.append(threading.Thread(target=submit_loop, name="pipeline-submit", daemon=True))
+        writer = threading.Thread(target=write_loop, name="pipeline-write", daemon=True)
+        for thread in threads + [writer]:
+            thread.start()
+
+        try:
+            while True:
+                entry = completed.get()
+                if entry is _DONE:
+                    break
+                batch, future = entry
+                try:
+                    (task_results, failures), metrics = future.result()
+                    registry.merge(metrics)
+                except Exception as ex:
+                    task_results, failures = [], [(item, ex) for item, _ in batch]
+                for item, ex in failures:
+                    self._fail(item, "extract", ex)
+                self._count("extract", "ok", len(task_results))
+                for result in task_results:
+                    self._put(results, result, "extract")
+                slots.release()
+        finally:
+            self._stop.set()
+            while writer.is_alive():
+                try:
+                    results.put(_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            writer.join()
+            for thread in threads:
+                thread.join()
+        return dict(self.stats)
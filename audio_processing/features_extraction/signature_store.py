@@ -0,0 +1,158 @@
+import os
+import struct
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Сигнатуры хранятся и передаются как float32: столько же точности у pgvector,
+# а текстовое представление в 3-4 раза больше и требует разбора
+
+SIGNATURE_DTYPE = np.dtype("<f4")
+PGVECTOR_DTYPE = np.dtype(">f4")
+# Заголовок бинарного формата pgvector (vector_send / vector_recv): int16 dim, int16 unused
+PGVECTOR_HEADER = struct.Struct(">hh")
+
+
+def to_bytes(signature: np.ndarray) -> bytes:
+    """Raw little-endian float32"""
+    return np.asarray(signature, dtype=SIGNATURE_DTYPE).tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    """Read-only float32 view of the buffer, no copy"""
+    return np.frombuffer(data, dtype=SIGNATURE_DTYPE)
+
+
+def to_pgvector_binary(signature: np.ndarray) -> bytes:
+    """pgvector binary form, what COPY ... (FORMAT binary) and vector_recv expect"""
+    values = np.asarray(signature, dtype=PGVECTOR_DTYPE)
+    return PGVECTOR_HEADER.pack(len(values), 0) + values.tobytes()
+
+
+def from_pgvector_binary(data: bytes) -> np.ndarray:
+    """pgvector binary form (vector_send(signature) in SQL) -> float32 array"""
+    data = bytes(data)
+    dim, _ = PGVECTOR_HEADER.unpack_from(data)
+    values = np.frombuffer(data, dtype=PGVECTOR_DTYPE, count=dim, offset=PGVECTOR_HEADER.size)
+    return values.astype(np.float32)
+
+
+class SignatureStore:
+    """
+    Memory-mapped file of float32 signatures addressed by track id.
+
+    Layout: 64 byte header (magic, format version, dim, count), the (count, dim) little-endian float32
+    matrix, then the int64 track ids in write order and their stable argsort. Opening the file maps it
+    without reading, get() is a binary search over the sorted ids and returns a view into the mapping.
+    If an id was written several times the last signature wins.
+    Written by SignatureStoreWriter.
+    """
+    MAGIC = b"SIGSTORE"
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct("<8sIIQ")
+    HEADER_SIZE = 64
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, dim, count = self.HEADER.unpack(f.read(self.HEADER.size))
+        if magic != self.MAGIC or version != self.FORMAT_VERSION:
+            raise ValueError(f"{path} is not a signature store v{self.FORMAT_VERSION}")
+        self.dim = dim
+        if count == 0:
+            self.vectors = np.empty((0, dim), dtype=SIGNATURE_DTYPE)
+            self.ids = self._order = np.empty(0, dtype="<i8")
+        else:
+            ids_offset = self.HEADER_SIZE + count * dim * SIGNATURE_DTYPE.itemsize
+            self.vectors = np.memmap(path, dtype=SIGNATURE_DTYPE, mode="r", offset=self.HEADER_SIZE, shape=(count, dim))
+            self.ids = np.memmap(path, dtype="<i8", mode="r", offset=ids_offset, shape=(count,))
+            self._order = np.memmap(path, dtype="<i8", mode="r", offset=ids_offset + count * 8, shape=(count,))
+        self._sorted_ids = self.ids[self._order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, track_id: int) -> bool:
+        return self._find(track_id) is not None
+
+    def _find(self, track_id: int) -> Optional[int]:
+        # side="right" и стабильная сортировка: при повторах берётся последняя запись
+        position = int(np.searchsorted(self._sorted_ids, track_id, side="right")) - 1
+        if position < 0 or self._sorted_ids[position] != track_id:
+            return None
+        return int(self._order[position])
+
+    def get(self, track_id: int) -> Optional[np.ndarray]:
+        row = self._find(track_id)
+        return None if row is None else self.vectors[row]
+
+    def get_many(self, track_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """:return: (found ids, their signatures as one (n, dim) matrix)"""
+        track_ids = np.asarray(list(track_ids), dtype=np.int64)
+        if len(self) == 0:
+            return track_ids[:0], self.vectors[:0]
+        positions = np.searchsorted(self._sorted_ids, track_ids, side="right") - 1
+        found = (positions >= 0) & (self._sorted_ids[np.maximum(positions, 0)] == track_ids)
+        rows = self._order[positions[found]]
+        return track_ids[found], np.asarray(self.vectors[rows])
+
+    def items(self) -> Iterator[Tuple[int, np.ndarray]]:
+        for track_id, signature in zip(self.ids, self.vectors):
+            yield int(track_id), signature
+
+
+class SignatureStoreWriter:
+    """
+    Streams signatures into a SignatureStore file: rows go straight to disk, only the ids are kept
+    in memory. The file is written under a temporary name and renamed on close.
+
+        with SignatureStoreWriter("signatures.sig", dim=110) as writer:
+            for track_id, signature in signatures:
+                writer.add(track_id, signature)
+    """
+
+    def __init__(self, path: str, dim: int) -> None:
+        self.path = path
+        self.dim = dim
+        self._ids = []
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * SignatureStore.HEADER_SIZE)
+
+    def add(self, track_id: int, signature: np.ndarray) -> None:
+        signature = np.asarray(signature, dtype=SIGNATURE_DTYPE)
+        if signature.shape != (self.dim,):
+            raise ValueError(f"Signature of track {track_id} has shape {signature.shape}, expected ({self.dim},)")
+        self._file.write(signature.tobytes())
+        self._ids.append(track_id)
+
+    def add_many(self, track_ids: Iterable[int], signatures: np.ndarray) -> None:
+        track_ids = list(track_ids)
+        signatures = np.asarray(signatures, dtype=SIGNATURE_DTYPE)
+        if signatures.shape != (len(track_ids), self.dim):
+            raise ValueError(f"Signatures have shape {signatures.shape}, expected ({len(track_ids)}, {self.dim})")
+        self._file.write(signatures.tobytes())
+        self._ids.extend(track_ids)
+
+    def close(self) -> SignatureStore:
+        ids = np.asarray(self._ids, dtype="<i8")
+        self._file.write(ids.tobytes())
+        self._file.write(np.argsort(ids, kind="stable").astype("<i8").tobytes())
+        self._file.seek(0)
+        self._file.write(SignatureStore.HEADER.pack(SignatureStore.MAGIC, SignatureStore.FORMAT_VERSION, self.dim, len(ids)))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return SignatureStore(self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self) -> "SignatureStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
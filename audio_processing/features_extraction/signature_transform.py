@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+import numpy as np
+
+
+def determine_optimal_components(signature_matrix: np.ndarray, variance_threshold: float = 0.95) -> int:
+    """
+    Определяет оптимальное количество компонент PCA, чтобы сохранить заданную долю дисперсии.
+
+    :param signature_matrix: матрица векторов признаков всех аудиофайлов (уже стандартизованных, если нужно).
+    :param variance_threshold: доля общей дисперсии, которую нужно сохранить.
+    :return: оптимальное количество компонент.
+    """
+    explained_variance = _principal_axes(np.asarray(signature_matrix, dtype=np.float64))[1]
+    cumulative_variance = np.cumsum(explained_variance) / np.sum(explained_variance)
+    return int(min(np.searchsorted(cumulative_variance, variance_threshold) + 1, len(explained_variance)))
+
+
+def _principal_axes(centered: np.ndarray):
+    """:return: (components (k, dim), explained variance (k,)) by decreasing variance"""
+    centered = centered - centered.mean(axis=0)
+    # SVD центрированной матрицы вместо ковариации: точнее, если признаков больше, чем треков
+    _, singular_values, components = np.linalg.svd(centered, full_matrices=False)
+    explained_variance = singular_values ** 2 / max(len(centered) - 1, 1)
+    # Знак компонент фиксируется, чтобы повторное обучение на тех же данных давало ту же матрицу
+    signs = np.sign(components[np.arange(len(components)), np.argmax(np.abs(components), axis=1)])
+    return components * signs[:, None], explained_variance
+
+
+class SignatureTransform:
+    """
+    Fitted projection of raw signatures (AudioProcessing.get_file_signature() without normalization)
+    to the stored vectors.
+
+    Raw features mix scales: tempo in BPM, spectral centroid in Hz, MFCC means. Each dimension is
+    standardised with the corpus mean / std, then projected on the first n_components principal axes,
+    optionally whitened (every component scaled to unit variance). All three steps are folded into
+    one (dim, n_components) matrix and an offset, so apply() is a single matrix multiply.
+
+    The version identifies the fitted parameters, signatures made by different transforms are not comparable.
+    """
+    FORMAT_VERSION = 1
+    # Не даёт почти нулевым компонентам раздуться при whitening
+    EPSILON = 1e-6
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, components: np.ndarray,
+                 explained_variance: np.ndarray, whiten: bool = True, feature_version: Optional[str] = None) -> None:
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.components = np.asarray(components, dtype=np.float64)
+        self.explained_variance = np.asarray(explained_variance, dtype=np.float64)
+        self.whiten = whiten
+        self.feature_version = feature_version
+
+        projection = self.components.T / self.scale[:, None]
+        if whiten:
+            projection = projection / np.sqrt(self.explained_variance + self.EPSILON)
+        # Сдвиг на среднее вынесен в offset, поэтому произведение в float64: в float32 при признаках
+        # порядка тысяч (Hz) вычитание offset теряет значащие разряды
+        self.projection = projection
+        self.offset = -self.mean @ projection
+
+    @property
+    def input_dim(self) -> int:
+        return len(self.mean)
+
+    @property
+    def n_components(self) -> int:
+        return len(self.components)
+
+    @property
+    def version(self) -> str:
+        content_hash = hashlib.sha1()
+        for array in (self.mean, self.scale, self.components, self.explained_variance):
+            content_hash.update(np.ascontiguousarray(array, dtype="<f8").tobytes())
+        content_hash = content_hash.hexdigest()
+        return f"pca{self.n_components}{'w' if self.whiten else ''}-{content_hash[:12]}"
+
+    @classmethod
+    def fit(cls, signature_matrix: np.ndarray, n_components: Optional[int] = None, variance_threshold: float = 0.95,
+            whiten: bool = True, feature_version: Optional[str] = None) -> "SignatureTransform":
+        """
+        :param signature_matrix: (tracks, dim) raw signatures of the corpus.
+        :param n_components: kept components, by default as many as needed for variance_threshold.
+        :param feature_version: AudioProcessing.VERSION of the raw signatures, checked by the caller when applying.
+        """
+        signature_matrix = np.asarray(signature_matrix, dtype=np.float64)
+        if signature_matrix.ndim != 2 or len(signature_matrix) < 2:
+            raise ValueError("At least two signatures are needed to fit a transform")
+        mean = signature_matrix.mean(axis=0)
+        scale = signature_matrix.std(axis=0)
+        # Постоянные по корпусу признаки ничего не различают, деление на 0 не нужно
+        scale[scale == 0] = 1.0
+        standardized = (signature_matrix - mean) / scale
+
+        if n_components is None:
+            n_components = determine_optimal_components(standardized, variance_threshold)
+        components, explained_variance = _principal_axes(standardized)
+        if n_components > len(components):
+            raise ValueError(f"n_components={n_components}, but at most {len(components)} can be fitted on this matrix")
+        return cls(mean, scale, components[:n_components], explained_variance[:n_components], whiten, feature_version)
+
+    def apply(self, signatures: np.ndarray) -> np.ndarray:
+        """Raw signature (dim,) or matrix (n, dim) -> float32 (n_components,) / (n, n_components)"""
+        signatures = np.asarray(signatures, dtype=np.float64)
+        if signatures.shape[-1] != self.input_dim:
+            raise ValueError(f"Signature has {signatures.shape[-1]} features, the transform {self.version} expects {self.input_dim}")
+        return (signatures @ self.projection + self.offset).astype(np.float32)
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        with NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as f:
+            np.savez(
+                f,
+                params=np.array(json.dumps({
+                    "format_version": self.FORMAT_VERSION,
+                    "whiten": self.whiten,
+                    "feature_version": self.feature_version,
+                    "version": self.version,
+                })),
+                mean=self.mean,
+                scale=self.scale,
+                components=self.components,
+                explained_variance=self.explained_variance,
+            )
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SignatureTransform":
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            if params["format_version"] != cls.FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported transform format {params['format_version']}")
+            transform = cls(data["mean"], data["scale"], data["components"], data["explained_variance"],
+                            params["whiten"], params["feature_version"])
+        if transform.version != params["version"]:
+            raise ValueError(f"{path}: stored version {params['version']} doesn't match the parameters ({transform.version})")
+        return transform
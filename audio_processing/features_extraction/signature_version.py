@@ -0,0 +1,38 @@
+import hashlib
+import json
+from typing import Optional
+
+from .signature_transform import SignatureTransform
+
+# Сигнатуры разных версий несравнимы: версия и хэш параметров хранятся рядом с каждой сигнатурой в БД,
+# устаревшие пересчитываются в фоне, а индекс поиска переключается на новую версию целиком
+
+DCT_COMPONENTS = 110
+
+
+def get_signature_params(extraction_params: dict, transform: Optional[SignatureTransform] = None,
+                         n_components: int = DCT_COMPONENTS) -> dict:
+    """Everything that determines a stored signature: feature extraction plus the reduction applied to it"""
+    if transform is not None:
+        reduction = {"type": "transform", "version": transform.version, "dim": transform.n_components}
+    else:
+        reduction = {"type": "dct", "normalization": "min-max", "dim": n_components}
+    return {"features": extraction_params, "reduction": reduction}
+
+
+def get_params_hash(params: dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_signature_version(params: dict) -> str:
+    """
+    Readable and unique label, e.g. "1.3.0-dct110-1a2b3c4d" or "1.3.0-pca24w-<transform hash>-1a2b3c4d":
+    the feature version, the reduction and the head of the params hash. Fits VARCHAR(64).
+    """
+    feature_version = str(params["features"]["version"]).split()[-1]
+    reduction = params["reduction"]
+    if reduction["type"] == "transform":
+        reduction_label = reduction["version"]
+    else:
+        reduction_label = f"{reduction['type']}{reduction['dim']}"
+    return f"{feature_version}-{reduction_label}-{get_params_hash(params)[:8]}"
@@ -0,0 +1,453 @@
+import heapq
+import json
+import math
+import os
+import threading
+from tempfile import NamedTemporaryFile
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from .audio_analysis import AudioTools
+
+
+class BaseSimilarityIndex:
+    """
+    In-memory index over track signatures.
+
+    Vectors are kept in one growable float32 matrix, track ids map to rows. Re-adding an id
+    marks the old row as deleted and appends a new one, so inserts never rebuild the structure.
+    Searching with a metric other than the one the index was built for falls back to an exact scan.
+    """
+    kind = "base"
+
+    def __init__(self, metric="manhattan") -> None:
+        if metric not in AudioTools.BATCH_METRICS:
+            raise ValueError("Unknown metric")
+        self.metric = metric
+        self.tools = AudioTools()
+
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._size = 0
+        self._rows: Dict[int, int] = {}
+        # Flask отвечает из нескольких потоков, пока save_signatures_to_db добавляет векторы
+        self._lock = threading.RLock()
+
+    def get_params(self) -> dict:
+        return {"metric": self.metric}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    def __contains__(self, track_id) -> bool:
+        return int(track_id) in self._rows
+
+    def get_vector(self, track_id) -> np.ndarray:
+        return self._vectors[self._rows[int(track_id)]]
+
+    @classmethod
+    def build(cls, ids, vectors, **params) -> "BaseSimilarityIndex":
+        index = cls(**params)
+        index.add(ids, vectors)
+        return index
+
+    def add(self, ids, vectors) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        with self._lock:
+            rows = self._append(ids, vectors)
+            self._index_rows(rows)
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        if self._vectors.shape[1] == 0:
+            self._vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        elif vectors.shape[1] != self._vectors.shape[1]:
+            raise ValueError(f"Expected {self._vectors.shape[1]}-dim vectors, got {vectors.shape[1]}")
+
+        required = self._size + len(ids)
+        if required > len(self._vectors):
+            capacity = max(required, 2 * len(self._vectors), 1024)
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._ids = np.resize(self._ids, capacity)
+            self._alive = np.resize(self._alive, capacity)
+
+        rows = np.arange(self._size, required)
+        for track_id, row in zip(ids.tolist(), rows.tolist()):
+            old_row = self._rows.get(track_id)
+            if old_row is not None:
+                self._alive[old_row] = False
+            self._rows[track_id] = row
+        self._vectors[rows] = vectors
+        self._ids[rows] = ids
+        self._alive[rows] = True
+        self._size = required
+        return rows
+
+    def _index_rows(self, rows: np.ndarray) -> None:
+        pass
+
+    def _exact_search(self, query: np.ndarray, k: int, metric: str, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = self.vectors if rows is None else self._vectors[rows]
+        distances = self.tools.get_batch_distances(query, vectors, metric=metric)
+        alive = self._alive[:self._size] if rows is None else self._alive[rows]
+        distances[~alive] = np.inf
+        top, top_distances = self._top_k(distances, k)
+        top_rows = top if rows is None else rows[top]
+        finite = np.isfinite(top_distances)
+        return self._ids[top_rows[finite]], top_distances[finite]
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return top, distances[top]
+
+    def _search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self._exact_search(query, k, self.metric)
+
+    def search(self, query, k=20, metric: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (track ids, distances) of the k nearest signatures, closest first.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            if metric is not None and metric != self.metric:
+                return self._exact_search(query, k, metric)
+            return self._search(query, k)
+
+    def search_by_id(self, track_id, k=20, metric: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Neighbours of an indexed track, the track itself excluded"""
+        with self._lock:
+            ids, distances = self.search(self.get_vector(track_id), k + 1, metric)
+        keep = ids != int(track_id)
+        return ids[keep][:k], distances[keep][:k]
+
+    def _get_state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def _set_state(self, state: Dict[str, np.ndarray]) -> None:
+        pass
+
+    def save(self, path: str) -> None:
+        """Written to a temporary file and renamed, a worker reloading the index never sees half of it"""
+        with self._lock, NamedTemporaryFile(dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False) as f:
+            np.savez(
+                f,
+                kind=np.array(self.kind),
+                params=np.array(json.dumps(self.get_params())),
+                vectors=self.vectors,
+                ids=self.ids,
+                alive=self._alive[:self._size],
+                **self._get_state()
+            )
+        os.replace(f.name, path)
+
+    @staticmethod
+    def load(path: str) -> "BaseSimilarityIndex":
+        with np.load(path) as data:
+            index = INDEX_TYPES[str(data["kind"])](**json.loads(str(data["params"])))
+            vectors, ids, alive = data["vectors"], data["ids"], data["alive"]
+            index._vectors, index._ids, index._alive = vectors.copy(), ids.copy(), alive.copy()
+            index._size = len(ids)
+            index._rows = {int(track_id): row for row, track_id in enumerate(ids.tolist()) if alive[row]}
+            index._set_state({name: data[name] for name in data.files})
+        return index
+
+
+class BruteForceIndex(BaseSimilarityIndex):
+    """Exact scan over all signatures, one BLAS / vectorised pass per query"""
+    kind = "brute_force"
+
+
+class IVFIndex(BaseSimilarityIndex):
+    """
+    Inverted file index: k-means centroids split the signatures into n_lists cells,
+    a query scans only the n_probe cells with the closest centroids.
+    Until there are enough vectors to train the centroids, search is exact.
+    Without n_lists the number of cells follows the catalogue, about sqrt(n). Centroids are retrained
+    once the index grows retrain_factor times past its size at training, otherwise new tracks pile up
+    in cells fitted to the old catalogue.
+    """
+    kind = "ivf"
+
+    def __init__(self, metric="manhattan", n_lists=None, n_probe=8, n_iter=20, seed=0, retrain_factor=2.0) -> None:
+        super().__init__(metric)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.retrain_factor = retrain_factor
+        self.centroids: Optional[np.ndarray] = None
+        # Число векторов при последнем обучении центроидов
+        self.trained_size = 0
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "n_lists": self.n_lists, "n_probe": self.n_probe, "n_iter": self.n_iter, "seed": self.seed,
+                "retrain_factor": self.retrain_factor}
+
+    def get_n_lists(self, n: int) -> int:
+        """Cells for n vectors: n_lists if set, otherwise sqrt(n)"""
+        return self.n_lists or max(int(round(math.sqrt(n))), 1)
+
+    def train(self, vectors: Optional[np.ndarray] = None, sample_size=50000) -> None:
+        """
+        Lloyd's k-means on a sample of the vectors under the index metric (k-medians for manhattan),
+        then every stored vector is reassigned. Cells are probed with the same metric, so a vector sits
+        in the cell of its nearest centroid.
+        """
+        with self._lock:
+            vectors = self.vectors[self._alive[:self._size]] if vectors is None else np.asarray(vectors, dtype=np.float32)
+            rng = np.random.default_rng(self.seed)
+            n_lists = min(self.get_n_lists(max(len(self), len(vectors))), len(vectors))
+            if len(vectors) > sample_size:
+                vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+            n_lists = min(n_lists, len(vectors))
+            centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+            # Медиана минимизирует сумму L1 расстояний до членов ячейки, среднее - сумму квадратов L2
+            center = np.median if self.metric == "manhattan" else np.mean
+            for _ in range(self.n_iter):
+                assignments = np.argmin(self.tools.get_batch_distances(vectors, centroids, metric=self.metric), axis=1)
+                for cell in range(n_lists):
+                    members = vectors[assignments == cell]
+                    if len(members):
+                        centroids[cell] = center(members, axis=0)
+            self.centroids = centroids
+            self.trained_size = len(self)
+            self._lists = [[] for _ in range(n_lists)]
+            self._list_arrays = {}
+            self._assign(np.flatnonzero(self._alive[:self._size]))
+
+    def _assign(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        # Частями: матрица расстояний до центроидов на миллион векторов не помещается в память
+        cells = np.concatenate([
+            np.argmin(self.tools.get_batch_distances(self._vectors[chunk], self.centroids, metric=self.metric), axis=1)
+            for chunk in np.array_split(rows, math.ceil(len(rows) / 16384))
+        ])
+        for row, cell in zip(rows.tolist(), cells.tolist()):
+            self._lists[cell].append(row)
+            self._list_arrays.pop(cell, None)
+
+    def _index_rows(self, rows: np.ndarray) -> None:
+        if self.centroids is None:
+            if len(self) >= self.get_n_lists(len(self)) * 39:
+                self.train()
+            return
+        if self.retrain_factor and len(self) >= self.trained_size * self.retrain_factor:
+            # Обучение заново распределяет все векторы, включая новые
+            self.train()
+            return
+        self._assign(rows)
+
+    def _get_list(self, cell: int) -> np.ndarray:
+        rows = self._list_arrays.get(cell)
+        if rows is None:
+            rows = np.array(self._lists[cell], dtype=np.int64)
+            rows = rows[self._alive[rows]]
+            self._lists[cell] = rows.tolist()
+            self._list_arrays[cell] = rows
+        return rows
+
+    def _search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.centroids is None:
+            return self._exact_search(query, k, self.metric)
+        centroid_distances = self.tools.get_batch_distances(query, self.centroids, metric=self.metric)
+        n_probe = min(self.n_probe, len(self.centroids))
+        cells = np.argpartition(centroid_distances, n_probe - 1)[:n_probe]
+        rows = np.concatenate([self._get_list(cell) for cell in cells.tolist()])
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._exact_search(query, k, self.metric, rows=rows)
+
+    def _get_state(self) -> Dict[str, np.ndarray]:
+        if self.centroids is None:
+            return {}
+        return {"centroids": self.centroids, "trained_size": np.array(self.trained_size)}
+
+    def _set_state(self, state: Dict[str, np.ndarray]) -> None:
+        if "centroids" in state:
+            self.centroids = state["centroids"].copy()
+            # Индекс, сохранённый до учёта размера обучения, считается обученным на текущем
+            self.trained_size = int(state["trained_size"]) if "trained_size" in state else len(self)
+            self._lists = [[] for _ in range(len(self.centroids))]
+            self._assign(np.flatnonzero(self._alive[:self._size]))
+
+
+class HNSWIndex(BaseSimilarityIndex):
+    """
+    Hierarchical navigable small world graph: every node gets a random level, upper layers
+    are sparse shortcuts, layer 0 links every node with up to 2 * m neighbours.
+    A query descends greedily and runs a best-first search with ef_search candidates on layer 0.
+    Inserts run at Python speed (thousands per second), so large catalogues are better served by IVFIndex
+    or by building this graph offline and loading it.
+    """
+    kind = "hnsw"
+
+    def __init__(self, metric="manhattan", m=16, ef_construction=100, ef_search=64, seed=0) -> None:
+        super().__init__(metric)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._level_mult = 1 / math.log(m)
+        self._layers: List[Dict[int, List[int]]] = []
+        self._entry_point: Optional[int] = None
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "m": self.m, "ef_construction": self.ef_construction, "ef_search": self.ef_search, "seed": self.seed}
+
+    def _distances(self, query: np.ndarray, rows: List[int]) -> np.ndarray:
+        return self.tools.get_batch_distances(query, self._vectors[rows], metric=self.metric)
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, layer: int) -> List[Tuple[float, int]]:
+        """Best-first search on one layer, returns up to ef (distance, row) pairs sorted by distance"""
+        graph = self._layers[layer]
+        visited = set(entry_points)
+        entry_distances = self._distances(query, entry_points)
+        candidates = [(float(d), row) for d, row in zip(entry_distances, entry_points)]
+        heapq.heapify(candidates)
+        nearest = [(-d, row) for d, row in candidates]
+        heapq.heapify(nearest)
+        while len(nearest) > ef:
+            heapq.heappop(nearest)
+
+        while candidates:
+            distance, row = heapq.heappop(candidates)
+            if distance > -nearest[0][0] and len(nearest) >= ef:
+                break
+            neighbours = [n for n in graph.get(row, ()) if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for neighbour_distance, neighbour in zip(self._distances(query, neighbours).tolist(), neighbours):
+                if len(nearest) < ef or neighbour_distance < -nearest[0][0]:
+                    heapq.heappush(candidates, (neighbour_distance, neighbour))
+                    heapq.heappush(nearest, (-neighbour_distance, neighbour))
+                    if len(nearest) > ef:
+                        heapq.heappop(nearest)
+        return sorted((-d, row) for d, row in nearest)
+
+    def _select_neighbours(self, candidates: List[Tuple[float, int]], max_links: int) -> List[int]:
+        """
+        Selection heuristic of the HNSW paper: a candidate is kept only if it is closer to the new node than to
+        every neighbour already kept. This preserves links between clusters; pruned candidates fill the remaining slots.
+        """
+        if len(candidates) <= 1:
+            return [row for _, row in candidates]
+        rows = [row for _, row in candidates]
+        pairwise = self.tools.get_batch_distances(self._vectors[rows], self._vectors[rows], metric=self.metric).tolist()
+        selected, pruned = [], []
+        for i, (distance, _) in enumerate(candidates):
+            if len(selected) >= max_links:
+                break
+            if all(distance < pairwise[i][j] for j in selected):
+                selected.append(i)
+            else:
+                pruned.append(i)
+        return [rows[i] for i in selected + pruned[:max_links - len(selected)]]
+
+    def _shrink(self, row: int, neighbours: List[int], max_links: int) -> List[int]:
+        if len(neighbours) <= max_links:
+            return neighbours
+        distances = self._distances(self._vectors[row], neighbours)
+        return self._select_neighbours(sorted(zip(distances.tolist(), neighbours)), max_links)
+
+    def _insert(self, row: int) -> None:
+        query = self._vectors[row]
+        level = int(-math.log(1 - self._rng.random()) * self._level_mult)
+        while len(self._layers) <= level:
+            self._layers.append({})
+
+        if self._entry_point is None:
+            for layer in range(level + 1):
+                self._layers[layer][row] = []
+            self._entry_point = row
+            return
+
+        top_level = self._node_level(self._entry_point)
+        entry_points = [self._entry_point]
+        for layer in range(top_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+
+        for layer in range(min(level, top_level), -1, -1):
+            found = self._search_layer(query, entry_points, self.ef_construction, layer)
+            max_links = 2 * self.m if layer == 0 else self.m
+            neighbours = self._select_neighbours(found, self.m)
+            self._layers[layer][row] = neighbours
+            for neighbour in neighbours:
+                links = self._layers[layer].setdefault(neighbour, [])
+                links.append(row)
+                self._layers[layer][neighbour] = self._shrink(neighbour, links, max_links)
+            entry_points = [n for _, n in found]
+
+        for layer in range(top_level + 1, level + 1):
+            self._layers[layer][row] = []
+        if level > top_level:
+            self._entry_point = row
+
+    def _node_level(self, row: int) -> int:
+        level = 0
+        while level + 1 < len(self._layers) and row in self._layers[level + 1]:
+            level += 1
+        return level
+
+    def _index_rows(self, rows: np.ndarray) -> None:
+        for row in rows.tolist():
+            self._insert(row)
+
+    def _search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        entry_points = [self._entry_point]
+        for layer in range(self._node_level(self._entry_point), 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        # Удалённые (перезаписанные) узлы остаются в графе для навигации, но не в выдаче
+        found = [(d, row) for d, row in self._search_layer(query, entry_points, max(self.ef_search, k), 0) if self._alive[row]]
+        found = found[:k]
+        rows = np.array([row for _, row in found], dtype=np.int64)
+        return self._ids[rows], np.array([d for d, _ in found], dtype=np.float32)
+
+    def _get_state(self) -> Dict[str, np.ndarray]:
+        state = {"entry_point": np.array(-1 if self._entry_point is None else self._entry_point)}
+        for layer, graph in enumerate(self._layers):
+            nodes = np.array(list(graph), dtype=np.int64)
+            lengths = np.array([len(graph[node]) for node in nodes], dtype=np.int64)
+            links = np.array([n for node in nodes for n in graph[node]], dtype=np.int64)
+            state[f"layer{layer}_nodes"] = nodes
+            state[f"layer{layer}_offsets"] = np.concatenate([[0], np.cumsum(lengths)])
+            state[f"layer{layer}_links"] = links
+        return state
+
+    def _set_state(self, state: Dict[str, np.ndarray]) -> None:
+        entry_point = int(state["entry_point"])
+        self._entry_point = None if entry_point < 0 else entry_point
+        self._layers = []
+        layer = 0
+        while f"layer{layer}_nodes" in state:
+            nodes = state[f"layer{layer}_nodes"].tolist()
+            offsets = state[f"layer{layer}_offsets"].tolist()
+            links = state[f"layer{layer}_links"].tolist()
+            self._layers.append({node: links[offsets[i]:offsets[i + 1]] for i, node in enumerate(nodes)})
+            layer += 1
+
+
+INDEX_TYPES: Dict[str, Type[BaseSimilarityIndex]] = {
+    index_type.kind: index_type for index_type in (BruteForceIndex, IVFIndex, HNSWIndex)
+}
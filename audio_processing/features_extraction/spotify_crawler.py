@@ -0,0 +1,118 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .api_interface import MAX_ALBUM_IDS, MAX_PAGE_LIMIT, SpotifyApiInterface, chunked, get_clean_track
+
+API_URL = "https://api.spotify.com/v1"
+
+
+class AsyncSpotifyCrawler(SpotifyApiInterface):
+    """
+    Crawls artists and labels concurrently.
+
+    Requests go through the blocking pooled session in worker threads, at most `concurrency` at a time,
+    paced by the shared rate limiter. Every paging object is followed to the end, and tracks are yielded
+    per album as soon as they arrive.
+    """
+
+    def __init__(self, concurrency: int = 8) -> None:
+        super().__init__()
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _request(self, url: str, params: Optional[dict] = None) -> dict:
+        # Семафор создаётся внутри цикла событий, в котором он используется
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await asyncio.to_thread(self._make_request, url, self._get_headers(), "get", params)
+
+    async def _iter_pages_async(self, url: str, params: Optional[dict] = None, key: Optional[str] = None) -> AsyncIterator[dict]:
+        """Follows `next` links, `key` selects a paging object nested in the response (search)"""
+        while url:
+            response_json = await self._request(url, params)
+            page = response_json[key] if key else response_json
+            yield page
+            url, params = page.get("next"), None
+
+    async def get_artist_album_ids(self, artist_id: str) -> List[str]:
+        url = f"{API_URL}/artists/{artist_id}/albums"
+        return [
+            album["id"]
+            async for page in self._iter_pages_async(url, {"limit": MAX_PAGE_LIMIT})
+            for album in page.get("items")
+        ]
+
+    async def get_label_album_ids(self, label: str) -> List[str]:
+        url = f"{API_URL}/search"
+        params = {"q": f'label:"{label}"', "type": "album", "limit": MAX_PAGE_LIMIT}
+        return [
+            album["id"]
+            async for page in self._iter_pages_async(url, params, key="albums")
+            for album in page.get("items")
+            if album
+        ]
+
+    async def _crawl_album_batch(self, album_ids: List[str], queue: asyncio.Queue) -> None:
+        response_json = await self._request(f"{API_URL}/albums", {"ids": ",".join(album_ids)})
+        for album in response_json.get("albums"):
+            if not album:
+                continue
+            tracks = list(album["tracks"].get("items"))
+            next_url = album["tracks"].get("next")
+            if next_url:
+                async for page in self._iter_pages_async(next_url):
+                    tracks.extend(page.get("items"))
+            await queue.put([get_clean_track(track) for track in tracks])
+
+    async def _crawl_albums(self, get_album_ids: Awaitable[List[str]], queue: asyncio.Queue, seen: set) -> None:
+        # Один альбом может прийти и от артиста, и от лейбла
+        album_ids = [album_id for album_id in await get_album_ids if album_id not in seen]
+        seen.update(album_ids)
+        await asyncio.gather(*(
+            self._crawl_album_batch(batch, queue) for batch in chunked(album_ids, MAX_ALBUM_IDS)
+        ))
+
+    async def crawl(self, artist_ids: Iterable[str] = (), labels: Iterable[str] = ()) -> AsyncIterator[List[Dict[str, object]]]:
+        """Yields the tracks of one album at a time while the rest of the crawl is still in flight"""
+        await asyncio.to_thread(self._prepare_request)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        seen: set = set()
+        sources = [self.get_artist_album_ids(artist_id) for artist_id in artist_ids]
+        sources += [self.get_label_album_ids(label) for label in labels]
+
+        async def produce() -> None:
+            try:
+                await asyncio.gather(*(self._crawl_albums(source, queue, seen) for source in sources))
+            finally:
+                await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (tracks := await queue.get()) is not None:
+                yield tracks
+            # Пробрасываем ошибку обхода, если она была
+            await producer
+        finally:
+            producer.cancel()
+
+
+async def crawl_to(save: Callable[[List[dict]], None], artist_ids: Iterable[str] = (), labels: Iterable[str] = (),
+                   concurrency: int = 8, batch_size: int = 500) -> int:
+    """
+    Runs the crawler and hands tracks to `save` in batches of about batch_size,
+    saving happens in a thread and slows the crawl down through the bounded queue.
+    """
+    crawler = AsyncSpotifyCrawler(concurrency=concurrency)
+    total = 0
+    batch: List[dict] = []
+    async for tracks in crawler.crawl(artist_ids=artist_ids, labels=labels):
+        batch.extend(tracks)
+        if len(batch) >= batch_size:
+            await asyncio.to_thread(save, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        await asyncio.to_thread(save, batch)
+        total += len(batch)
+    return total
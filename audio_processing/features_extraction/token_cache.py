@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from tempfile import NamedTemporaryFile
+from typing import Callable, Dict, Optional, Tuple
+
+# Функция получения токена возвращает (authorization, expires_in)
+TokenFetcher = Callable[[], Tuple[str, float]]
+
+
+class FileTokenBackend:
+    """Shares the token between processes of one host through a json file"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f).get(key)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, key: str, entry: dict) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entries = {}
+        entries[key] = entry
+        with NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as tmp_file:
+            json.dump(entries, tmp_file)
+        os.replace(tmp_file.name, self.path)
+
+
+class RedisTokenBackend:
+    """Shares the token between hosts, the key expires together with the token"""
+
+    def __init__(self, url: str, prefix: str = "spotify_token:") -> None:
+        try:
+            import redis
+        except ImportError as ex:
+            raise ImportError("redis package is required for a redis token cache") from ex
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, key: str) -> Optional[dict]:
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    def save(self, key: str, entry: dict) -> None:
+        ttl = max(int(entry["expires_at"] - time.time()), 1)
+        self.client.set(self.prefix + key, json.dumps(entry), ex=ttl)
+
+
+def get_backend(url: Optional[str]):
+    """SPOTIFY_TOKEN_CACHE: empty - memory only, redis://... or a file path"""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://")):
+        return RedisTokenBackend(url)
+    return FileTokenBackend(url[len("file://"):] if url.startswith("file://") else url)
+
+
+class TokenCache:
+    """
+    One token per client id for the whole process.
+
+    A valid token is returned without locking. Within refresh_margin seconds of expiry
+    a single background thread fetches the next one, and callers keep using the current token meanwhile.
+    Callers block only when there is no valid token at all (first request, token revoked).
+    """
+
+    def __init__(self, key: str, fetch: TokenFetcher, backend=None, refresh_margin: float = 300) -> None:
+        self.key = key
+        self.fetch = fetch
+        self.backend = backend
+        self.refresh_margin = refresh_margin
+        self.authorization: Optional[str] = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _is_valid(self, now: float) -> bool:
+        return self.authorization is not None and now < self.expires_at
+
+    def _set(self, entry: dict) -> None:
+        self.authorization, self.expires_at = entry["authorization"], entry["expires_at"]
+
+    def _refresh(self) -> None:
+        # Другой процесс мог уже обновить токен в общем хранилище
+        entry = self.backend.load(self.key) if self.backend else None
+        if not entry or entry["expires_at"] - time.time() <= self.refresh_margin:
+            authorization, expires_in = self.fetch()
+            entry = {"authorization": authorization, "expires_at": time.time() + float(expires_in)}
+            if self.backend:
+                self.backend.save(self.key, entry)
+        self._set(entry)
+
+    def _refresh_in_background(self) -> None:
+        try:
+            with self._lock:
+                self._refresh()
+        except Exception as ex:
+            # Текущий токен ещё действует, следующий вызов get попробует снова
+            print("Token refresh failed:", ex, flush=True)
+        finally:
+            self._refreshing = False
+
+    def get(self) -> str:
+        now = time.time()
+        if self._is_valid(now):
+            if self.expires_at - now <= self.refresh_margin and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return self.authorization
+
+        with self._lock:
+            if not self._is_valid(time.time()):
+                self._refresh()
+            return self.authorization
+
+    def invalidate(self, authorization: Optional[str]) -> None:
+        """Drops the token rejected with 401, unless it was already replaced by another thread"""
+        with self._lock:
+            if authorization == self.authorization:
+                self.authorization, self.expires_at = None, 0.0
+                if self.backend:
+                    entry = self.backend.load(self.key)
+                    if entry and entry["authorization"] == authorization:
+                        self.backend.save(self.key, {**entry, "expires_at": 0.0})
+
+
+_token_caches: Dict[str, TokenCache] = {}
+_token_caches_lock = threading.Lock()
+
+
+def get_token_cache(key: str, fetch: TokenFetcher) -> TokenCache:
+    with _token_caches_lock:
+        if key not in _token_caches:
+            _token_caches[key] = TokenCache(
+                key,
+                fetch,
+                backend=get_backend(os.environ.get("SPOTIFY_TOKEN_CACHE")),
+                refresh_margin=float(os.environ.get("SPOTIFY_TOKEN_REFRESH_MARGIN", 300)),
+            )
+        return _token_caches[key]
@@ -1,18 +1,51 @@
 import os
 import sys
-from flask import Flask, jsonify, request
+import time
+from flask import Flask, Response, g, jsonify, request
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask_interface.functions import install_preview_by_artist, install_preview_by_album, process_tracks_in_batches
+from flask_interface.functions import install_preview_by_artist, install_preview_by_album, install_preview_by_crawl, process_tracks_in_batches, find_similar_tracks, SIMILARITY_METRIC
+from flask_interface.functions import get_signature_version_coverage, list_signature_versions, switch_signature_version, SIGNATURE_VERSION
+from flask_interface.functions import list_signature_failures, retry_signature_failures
+from flask_interface.jobs import JobManager
+from features_extraction.metrics import Histogram, SamplingProfiler, registry
 
 app = Flask(__name__)
 
+# Долгие обходы и пересчёт сигнатур выполняются в фоне, HTTP запрос только ставит задачу.
+# JOBS_DIR нужен при нескольких воркерах gunicorn: /jobs/<id> может прийти не в тот воркер, где идёт задача
+job_manager = JobManager(max_workers=int(os.environ.get("JOB_WORKERS", 2)), state_dir=os.environ.get("JOBS_DIR"))
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "Flask request latency by route and status", ["route", "method", "status"])
+
+# Сэмплирующий профайлер включается только явно, /debug/profile без PROFILER_ENABLED=1 отдаёт 404
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "1"
+profiler = SamplingProfiler(interval=float(os.environ.get("PROFILER_INTERVAL", 0.01)))
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, route=route, method=request.method, status=response.status_code)
+    return response
+
 
 @app.route('/ping', methods=['get'])
 def process_track():
     return jsonify({"status": "pong"}), 200
 
+def submit_job(kind: str, func, **params):
+    try:
+        job = job_manager.submit(kind, func, **params)
+    except RuntimeError as ex:
+        return jsonify({"error": str(ex)}), 503
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}), 202
+
 @app.route('/install/artist', methods=['post'])
 def install_by_artist():
     print("Start flask route artist", flush=True)
@@ -22,14 +55,7 @@ def install_by_artist():
     if not artist_id:
         print("No id err", flush=True)
         return jsonify({"error": "request must have artist_id"}), 400
-    try:
-        print("Start loading tracks", flush=True)
-        install_preview_by_artist(artist_id)
-    except Exception as ex:
-        print(ex, flush=True)
-        return jsonify({"error": str(ex)}), 500
-    print("Success", flush=True)
-    return '', 200
+    return submit_job("install_artist", install_preview_by_artist, artist_id=artist_id)
     
 @app.route('/install/album', methods=['post'])
 def install_by_album():
@@ -39,24 +65,105 @@ def install_by_album():
     if not album_id:
         print("No id err", flush=True)
         return jsonify({"error": "request must have album_id"}), 400
-    try:
-        print("Start loading tracks", flush=True)
-        install_preview_by_album(album_id)
-    except Exception as ex:
-        print(ex, flush=True)
-        return jsonify({"error": str(ex)}), 500
-    print("Success", flush=True)
-    return '', 200
+    return submit_job("install_album", install_preview_by_album, album_id=album_id)
+
+@app.route('/install/crawl', methods=['post'])
+def install_by_crawl():
+    print("Start flask route crawl", flush=True)
+    data: dict = request.get_json()
+    artist_ids = data.get("artist_ids") or []
+    labels = data.get("labels") or []
+    if not artist_ids and not labels:
+        print("No id err", flush=True)
+        return jsonify({"error": "request must have artist_ids or labels"}), 400
+    return submit_job("install_crawl", install_preview_by_crawl, artist_ids=artist_ids, labels=labels)
 
 @app.route('/signatures/set', methods=['post'])
 def set_signatures():
     print("Start route /signatures", flush=True)
+    return submit_job("set_signatures", process_tracks_in_batches)
+
+@app.route('/signatures/resign', methods=['post'])
+def resign_signatures():
+    """Signs the missing tracks, then re-signs those with a signature of another version"""
+    print("Start route /signatures/resign", flush=True)
+    return submit_job("resign_signatures", process_tracks_in_batches, include_outdated=True)
+
+@app.route('/signatures/versions', methods=['get'])
+def signature_versions():
+    return jsonify({"current": SIGNATURE_VERSION, "versions": list_signature_versions()}), 200
+
+@app.route('/signatures/versions/<version>/activate', methods=['post'])
+def activate_signature_version(version):
+    force = request.args.get("force", "false").lower() in ("1", "true")
+    try:
+        coverage = get_signature_version_coverage(version)
+    except KeyError as ex:
+        return jsonify({"error": str(ex)}), 404
+    if coverage["missing"] and not force:
+        return jsonify({"error": f"version {version} is not computed for every track, run /signatures/resign or pass force=true", **coverage}), 409
+    return submit_job("activate_signature_version", switch_signature_version, version=version, force=force)
+
+@app.route('/signatures/failures', methods=['get'])
+def signature_failures():
+    """Tracks the backfill gave up on (all failed ones with dead_only=false)"""
+    limit = request.args.get("limit", 100, type=int)
+    dead_only = request.args.get("dead_only", "true").lower() not in ("0", "false")
+    return jsonify({"version": SIGNATURE_VERSION, "failures": list_signature_failures(limit=limit, dead_only=dead_only)}), 200
+
+@app.route('/signatures/failures/retry', methods=['post'])
+def retry_failures():
+    data: dict = request.get_json(silent=True) or {}
+    track_ids = data.get("track_ids")
+    if track_ids is not None and not isinstance(track_ids, list):
+        return jsonify({"error": "track_ids must be a list"}), 400
+    return jsonify({"version": SIGNATURE_VERSION, "requeued": retry_signature_failures(track_ids)}), 200
+
+@app.route('/jobs', methods=['get'])
+def list_jobs():
+    return jsonify({"jobs": job_manager.list_states()}), 200
+
+@app.route('/jobs/<job_id>', methods=['get'])
+def get_job(job_id):
+    state = job_manager.get_state(job_id)
+    if state is None:
+        return jsonify({"error": f"job {job_id} not found"}), 404
+    return jsonify(state), 200
+
+@app.route('/jobs/<job_id>', methods=['delete'])
+def cancel_job(job_id):
+    state = job_manager.cancel(job_id)
+    if state is None:
+        return jsonify({"error": f"job {job_id} not found"}), 404
+    return jsonify(state), 202
+
+@app.route('/similar/<int:track_id>', methods=['get'])
+def similar_tracks(track_id):
+    metric = request.args.get("metric", SIMILARITY_METRIC)
+    k = request.args.get("k", 20, type=int)
+    try:
+        tracks = find_similar_tracks(track_id, k=k, metric=metric)
+    except KeyError as ex:
+        return jsonify({"error": str(ex)}), 404
+    except ValueError as ex:
+        return jsonify({"error": str(ex)}), 400
+    return jsonify({"track_id": track_id, "metric": metric, "similar": tracks}), 200
+
+@app.route('/metrics', methods=['get'])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/debug/profile', methods=['post'])
+def profile():
+    """Samples the stacks of this worker for `seconds`, returns collapsed stacks for a flame graph"""
+    if not PROFILER_ENABLED:
+        return jsonify({"error": "profiler is disabled, set PROFILER_ENABLED=1"}), 404
+    seconds = min(request.args.get("seconds", 10.0, type=float), 300.0)
     try:
-        process_tracks_in_batches()
-    except Exception as ex:
-        print("Error when proccessing tracks", ex)
-        return jsonify({"error": ex}), 500
-    return '', 200
+        return Response(profiler.profile(seconds), mimetype="text/plain")
+    except RuntimeError as ex:
+        return jsonify({"error": str(ex)}), 409
 
 if __name__ == '__main__':
+    # Сервер разработки, в контейнере приложение запускается через gunicorn (gunicorn.conf.py)
     app.run(host='0.0.0.0', port=5000)
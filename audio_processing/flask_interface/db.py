@@ -1,16 +1,41 @@
+import os
+import threading
+
 import psycopg2
 import psycopg2.pool
 
 from . import config
 
 
+connection_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Pool of the current process, created on first use.
+    Connections can't cross fork: a worker preloaded by gunicorn opens its own pool
+    instead of sharing the master's sockets. Threaded, since job threads share it with requests.
+    """
+    global connection_pool, _pool_pid
+    with _pool_lock:
+        if connection_pool is None or _pool_pid != os.getpid():
+            connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                1, 20, **config.DATABASE_CONFIG
+            )
+            _pool_pid = os.getpid()
+        return connection_pool
 
-connection_pool = psycopg2.pool.SimpleConnectionPool(
-    1, 20, **config.DATABASE_CONFIG
-)
+def close_pool():
+    global connection_pool
+    with _pool_lock:
+        if connection_pool is not None and _pool_pid == os.getpid():
+            connection_pool.closeall()
+        connection_pool = None
 
 def get_connection():
-    return connection_pool.getconn()
+    return get_pool().getconn()
 
 def release_connection(conn):
-    connection_pool.putconn(conn)
\ No newline at end of file
+    get_pool().putconn(conn)
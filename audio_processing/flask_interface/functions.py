@@ -1,73 +1,183 @@
+import asyncio
+import csv
+import io
+import json
 import os
+import struct
 import sys
+import threading
 import time
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from features_extraction.audio_analysis import AudioProcessing, AudioTools
+from features_extraction.audio_analysis import AudioProcessing, AudioTools, ensure_warm, set_features_batch
+from features_extraction.feature_cache import FeatureCache
+from features_extraction.http_session import get_session
+from features_extraction.metrics import Counter, Histogram, registry
+from features_extraction.pipeline import Pipeline
+from features_extraction.signature_store import from_pgvector_binary, to_pgvector_binary
+from features_extraction.signature_transform import SignatureTransform
+from features_extraction.signature_version import get_params_hash, get_signature_params, get_signature_version
+from features_extraction.similarity_index import BaseSimilarityIndex, INDEX_TYPES
 from flask_interface.db import get_connection, release_connection
+from flask_interface.jobs import Job
 from features_extraction.api_interface import SpotifyApiInterface
-
-from typing import List, Tuple
-
-import concurrent.futures
-
-
-
-def install_preview_by_artist(artist_id):
+from features_extraction.spotify_crawler import crawl_to
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Кэш признаков включается переменной окружения, при пересчёте сигнатур трек не декодируется повторно
+feature_cache = FeatureCache(os.environ["FEATURE_CACHE_DIR"]) if os.environ.get("FEATURE_CACHE_DIR") else None
+
+def load_signature_transform(path: Optional[str]) -> Optional[SignatureTransform]:
+    """Fitted transform from SIGNATURE_TRANSFORM_PATH, without it signatures are min-max + DCT"""
+    if not path:
+        return None
+    transform = SignatureTransform.load(path)
+    if transform.feature_version != AudioProcessing.VERSION:
+        raise ValueError(f"Transform {transform.version} was fitted on features {transform.feature_version}, current are {AudioProcessing.VERSION}")
+    return transform
+
+
+signature_transform = load_signature_transform(os.environ.get("SIGNATURE_TRANSFORM_PATH"))
+
+# Версия сигнатур этого процесса: новые сигнатуры пишутся в track_signatures под ней,
+# в tracks.signature (по ней ищет go_backend) - только пока версия активна
+SIGNATURE_PARAMS = get_signature_params(AudioProcessing("").get_extraction_params(), signature_transform)
+SIGNATURE_PARAMS_HASH = get_params_hash(SIGNATURE_PARAMS)
+SIGNATURE_VERSION = os.environ.get("SIGNATURE_VERSION") or get_signature_version(SIGNATURE_PARAMS)
+SIGNATURE_DIM = SIGNATURE_PARAMS["reduction"]["dim"]
+
+SIGNATURE_CLAIM_TIMEOUT = os.environ.get("SIGNATURE_CLAIM_TIMEOUT", "15 minutes")
+# Сколько треков воркер пула обрабатывает одним батчем признаков, 1 - по одному треку
+SIGNATURE_TRACKS_PER_TASK = int(os.environ.get("SIGNATURE_TRACKS_PER_TASK", 1))
+# Стадии конвейера пересчёта: потоки загрузки, размер очередей между стадиями (по умолчанию от числа процессов),
+# предельное время загрузки и извлечения одного трека, батч записи в БД
+SIGNATURE_DOWNLOAD_WORKERS = int(os.environ.get("SIGNATURE_DOWNLOAD_WORKERS", 16))
+SIGNATURE_QUEUE_SIZE = int(os.environ.get("SIGNATURE_QUEUE_SIZE", 0)) or None
+SIGNATURE_DOWNLOAD_TIMEOUT = float(os.environ.get("SIGNATURE_DOWNLOAD_TIMEOUT", 60))
+SIGNATURE_EXTRACT_TIMEOUT = float(os.environ.get("SIGNATURE_EXTRACT_TIMEOUT", 120))
+SIGNATURE_WRITE_BATCH_SIZE = int(os.environ.get("SIGNATURE_WRITE_BATCH_SIZE", 100))
+SIGNATURE_WRITE_INTERVAL = float(os.environ.get("SIGNATURE_WRITE_INTERVAL", 5))
+# После стольких неудач трек больше не берётся в пересчёт для этой версии (signature_failures)
+SIGNATURE_MAX_ATTEMPTS = int(os.environ.get("SIGNATURE_MAX_ATTEMPTS", 3))
+
+SIMILARITY_INDEX_PATH = os.environ.get("SIMILARITY_INDEX_PATH", "similarity_index.npz")
+SIMILARITY_INDEX_TYPE = os.environ.get("SIMILARITY_INDEX_TYPE", "ivf")
+SIMILARITY_METRIC = os.environ.get("SIMILARITY_METRIC", "manhattan")
+# Как часто воркер проверяет, не переключил ли другой процесс активную версию сигнатур
+SIGNATURE_VERSION_CHECK_INTERVAL = float(os.environ.get("SIGNATURE_VERSION_CHECK_INTERVAL", 30))
+
+SIGNATURE_STAGE_SECONDS = Histogram("signature_stage_seconds", "Signature pipeline stages of one track: download, features, signature", ["stage"])
+AUDIO_STAGE_SECONDS = Histogram("audio_stage_seconds", "AudioProcessing stages of one track (load, resample, stft, hpss, ...)", ["stage"])
+SIGNATURES_TOTAL = Counter("signatures_total", "Tracks processed by the signature pipeline, by result", ["result"])
+FEATURE_CACHE_TOTAL = Counter("feature_cache_lookups_total", "Feature cache lookups, by result", ["result"])
+DB_WRITE_SECONDS = Histogram("db_write_seconds", "Batch writes to the database", ["table"])
+DB_ROWS_WRITTEN = Counter("db_rows_written_total", "Rows written to the database", ["table"])
+DB_WRITE_FAILURES = Counter("db_write_failures_total", "Failed batch writes to the database", ["table"])
+
+similarity_index: Optional[BaseSimilarityIndex] = None
+# Версия сигнатур загруженного индекса и время последней проверки активной версии
+similarity_index_version: Optional[str] = None
+similarity_index_checked_at = 0.0
+# mtime загруженного файла индекса: файл, пересобранный другим процессом после пересчёта, перечитывается
+similarity_index_mtime: Optional[float] = None
+similarity_index_lock = threading.Lock()
+
+CRAWLER_CONCURRENCY = int(os.environ.get("CRAWLER_CONCURRENCY", 8))
+
+
+def install_preview_by_artist(artist_id, job: Optional[Job] = None):
     interface = SpotifyApiInterface()
     album_list = interface.get_all_albums_by_atrist_id(artist_id=artist_id)
     album_links = interface.get_links_from_albums_list(album_list)
-    hrefs_to_preview = interface.get_data_for_tracks(album_links)
-    batch_size = 10
-    for i in range(0, len(hrefs_to_preview), batch_size):
-        batch = hrefs_to_preview[i:i+batch_size]
-        print(f"Processing batch {i // batch_size + 1}")
-        data = interface.get_preview_tracks_by_hrefs(batch)
-        
-        save_to_database(data)
-        
-        time.sleep(1)
-
-def install_preview_by_album(album_id):
+    # Треки берутся из ответов /v1/albums?ids= пачками по 20 альбомов, темп запросов держит rate limiter
+    tracks_preview = interface.get_preview_tracks_by_albums(album_links)
+    print(f"Fetched {len(tracks_preview)} tracks from {len(album_links)} albums", flush=True)
+
+    if job is not None:
+        job.check_cancelled()
+        job.increment("tracks_fetched", len(tracks_preview))
+    if tracks_preview:
+        save_to_database(data=tracks_preview)
+
+def install_preview_by_album(album_id, job: Optional[Job] = None):
     interface = SpotifyApiInterface()
     json_data = interface.get_preview_tracks_from_album(album_id=album_id)
     tracks_preview = interface.get_clean_data_from_preview_json(json_data=json_data.get("items"))
     
     print("Tracks preview data:", tracks_preview, flush=True)
-    
-    batch_size = 10
-    for i in range(0, len(tracks_preview), batch_size):
-        batch = tracks_preview[i:i+batch_size]
-        
-        if not batch:
-            print("Batch is empty", flush=True)
-            continue
 
-        save_to_database(data=batch)
-        time.sleep(1)
+    if job is not None:
+        job.check_cancelled()
+        job.increment("tracks_fetched", len(tracks_preview))
+    if tracks_preview:
+        save_to_database(data=tracks_preview)
+
+
+def install_preview_by_crawl(artist_ids: Iterable[str] = (), labels: Iterable[str] = (), concurrency: int = CRAWLER_CONCURRENCY,
+                             job: Optional[Job] = None) -> int:
+    """Crawls many artists / labels at once, tracks are saved while the crawl goes on"""
+    def save(tracks: List[dict]) -> None:
+        # JobCancelled отсюда останавливает и сам обход
+        if job is not None:
+            job.check_cancelled()
+        save_to_database(tracks)
+        if job is not None:
+            job.increment("tracks_fetched", len(tracks))
+
+    start = time.perf_counter()
+    total = asyncio.run(crawl_to(save, artist_ids=artist_ids, labels=labels, concurrency=concurrency))
+    elapsed = time.perf_counter() - start
+    print(f"Crawled {total} tracks in {elapsed:.1f}s", flush=True)
+    return total
+
+
+def copy_rows(cursor, table: str, columns: Iterable[str], rows: Iterable[tuple]) -> None:
+    """Streams rows into a table with one COPY instead of a statement per row"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+# Заголовок COPY (FORMAT binary): сигнатура, флаги, длина расширения
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\0" + struct.pack(">ii", 0, 0)
+PGCOPY_SIGNATURE_ROW = struct.Struct(">hiqi")
+
+
+def copy_signatures(cursor, table: str, signatures: Iterable[Tuple[int, np.ndarray]]) -> None:
+    """
+    COPY of (id BIGINT, signature vector) rows in binary format: float32 values go to pgvector as is,
+    without formatting them as text here and parsing it on the server
+    """
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    for track_id, signature in signatures:
+        vector = to_pgvector_binary(signature)
+        # 2 поля: bigint (8 байт) и vector
+        buffer.write(PGCOPY_SIGNATURE_ROW.pack(2, 8, track_id, len(vector)))
+        buffer.write(vector)
+    buffer.write(struct.pack(">h", -1))
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} (id, signature) FROM STDIN WITH (FORMAT binary)", buffer)
 
 
 def save_to_database(data):
     conn = None
     cursor = None
     try:
-        print("Starting save_to_database...", flush=True)
-
-        # Подключение к базе данных
+        start = time.perf_counter()
         conn = get_connection()
         cursor = conn.cursor()
-        print("Connected to the database successfully.", flush=True)
-
-        # Подготовка SQL запроса для вставки данных
-        insert_query = """
-        INSERT INTO tracks (title, artists, preview_url)
-        VALUES (%s, %s, %s)
-        ON CONFLICT (preview_url) DO NOTHING;
-        """
 
-        # Подготовка данных для вставки
+        # Строки копируются во временную таблицу и сливаются в tracks одним запросом
+        cursor.execute("""
+        CREATE TEMP TABLE tracks_staging (title TEXT, artists TEXT, preview_url TEXT) ON COMMIT DROP
+        """)
         records = [
             (
                 track['name'],
@@ -75,63 +185,131 @@ def save_to_database(data):
                 track['preview_url']
             )
             for track in data
+            if track.get('preview_url')
         ]
+        copy_rows(cursor, "tracks_staging", ("title", "artists", "preview_url"), records)
 
-        # Попытка вставить все записи батчем
-        cursor.executemany(insert_query, records)
+        # Длина title / artists ограничена varchar(64) в tracks, обрезаем вместо ошибки всего батча
+        cursor.execute("""
+        INSERT INTO tracks (title, artists, preview_url)
+        SELECT DISTINCT ON (preview_url) LEFT(title, 64), LEFT(artists, 64), preview_url
+        FROM tracks_staging
+        ON CONFLICT (preview_url) DO NOTHING
+        """)
+        inserted = cursor.rowcount
         conn.commit()
-        print(f"Batch insert completed. Inserted {cursor.rowcount} records into the database.", flush=True)
 
-        # Если ничего не было вставлено, попробовать по одной записи
-        if cursor.rowcount == 0:
-            print("No records were inserted in batch mode. Trying to insert records individually...", flush=True)
-            inserted_count = 0
+        elapsed = time.perf_counter() - start
+        DB_WRITE_SECONDS.observe(elapsed, table="tracks")
+        DB_ROWS_WRITTEN.inc(inserted, table="tracks")
+        print(f"Inserted {inserted} of {len(records)} tracks in {elapsed:.3f}s ({len(records) / elapsed if elapsed else 0:.0f} rows/s)", flush=True)
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        DB_WRITE_FAILURES.inc(table="tracks")
+        print("Error inserting into database:", e, flush=True)
+        # Батч целиком не записан: задача должна завершиться ошибкой, а не отчитаться об успехе
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
 
-            for idx, record in enumerate(records):
-                try:
-                    cursor.execute(insert_query, record)
-                    if cursor.rowcount > 0:
-                        inserted_count += 1
-                    print(f"Record {idx + 1}: title='{record[0]}', artists='{record[1]}', preview_url='{record[2]}' - Inserted successfully", flush=True)
-                except Exception as e:
-                    print(f"Error inserting record {idx + 1}: {e}", flush=True)
+def get_signature_column_dim(cursor) -> int:
+    """Dimension of tracks.signature: the ivfflat index needs a fixed vector(n), -1 for an unconstrained vector"""
+    cursor.execute("""
+    SELECT atttypmod FROM pg_attribute
+    WHERE attrelid = 'tracks'::regclass AND attname = 'signature'
+    """)
+    return cursor.fetchone()[0]
 
-            conn.commit()
-            print(f"Inserted {inserted_count} records into the database individually.", flush=True)
 
-    except Exception as e:
-        # Логирование ошибки
-        print("Error inserting into database:", e, flush=True)
+def register_signature_version() -> bool:
+    """
+    Registers SIGNATURE_VERSION with its parameters. A new version is inactive: only
+    switch_signature_version (/signatures/versions/<version>/activate) makes a version active.
+    :return: whether the version is active.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
 
+        cursor.execute("""
+        INSERT INTO signature_versions (version, params_hash, params, dim)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (version) DO NOTHING
+        """, (SIGNATURE_VERSION, SIGNATURE_PARAMS_HASH, json.dumps(SIGNATURE_PARAMS), SIGNATURE_DIM))
+        cursor.execute("SELECT version FROM signature_versions WHERE is_active")
+        active = cursor.fetchone()
+        conn.commit()
+        is_active = active is not None and active[0] == SIGNATURE_VERSION
+        if is_active:
+            print(f"Signature version {SIGNATURE_VERSION} (active)", flush=True)
+        else:
+            print(f"Signature version {SIGNATURE_VERSION} (inactive, active: {active[0] if active else None}), "
+                  f"activate it with POST /signatures/versions/{SIGNATURE_VERSION}/activate", flush=True)
+        return is_active
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
     finally:
-        # Закрытие курсора и соединения с базой данных
         if cursor:
             cursor.close()
-            print("Cursor closed.", flush=True)
         if conn:
             release_connection(conn)
-            print("Connection released.", flush=True)
-
-    print("Finished save_to_database.", flush=True)
 
 
-def get_tracks_without_signatures():
+def claim_tracks_without_signatures(after_id: int = 0, chunk_size: int = 100, outdated: bool = False) -> List[Tuple[int, str]]:
+    """
+    Claims the next chunk of tracks without a signature of SIGNATURE_VERSION, ordered by id after `after_id`:
+    tracks without any signature, or with `outdated` those whose signature is of another version.
+    Tracks that failed SIGNATURE_MAX_ATTEMPTS times for this version are left out.
+    Rows locked by another worker are skipped, a claim expires after SIGNATURE_CLAIM_TIMEOUT
+    so tracks of a crashed worker return to the queue.
+    """
     conn = None
     cursor = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
 
-        query = """
-        SELECT id, preview_url FROM tracks
-        WHERE signature IS NULL
+        query = f"""
+        UPDATE tracks
+        SET signature_claimed_at = now()
+        WHERE id IN (
+            SELECT id FROM tracks
+            WHERE signature IS {'NOT NULL' if outdated else 'NULL'}
+              AND id > %s
+              AND (signature_claimed_at IS NULL OR signature_claimed_at < now() - %s::interval)
+              AND NOT EXISTS (
+                  SELECT 1 FROM track_signatures
+                  WHERE track_signatures.track_id = tracks.id AND track_signatures.version = %s
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM signature_failures
+                  WHERE signature_failures.track_id = tracks.id AND signature_failures.version = %s
+                    AND signature_failures.attempts >= %s
+              )
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, preview_url
         """
 
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        cursor.execute(query, (after_id, SIGNATURE_CLAIM_TIMEOUT, SIGNATURE_VERSION, SIGNATURE_VERSION, SIGNATURE_MAX_ATTEMPTS, chunk_size))
+        rows = sorted(cursor.fetchall())
+        conn.commit()
         return rows
-    except Exception as e:
-        print(e)
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
     finally:
         if cursor:
             cursor.close()
@@ -139,38 +317,305 @@ def get_tracks_without_signatures():
             release_connection(conn)
 
 
-def get_signatures(track: Tuple[int, str]) -> Tuple[int, str]:
+def iter_tracks_without_signatures(chunk_size: int = 100, include_outdated: bool = False) -> Iterator[Tuple[int, str]]:
+    """
+    Drains the backlog chunk by chunk (keyset over id), only one chunk is held in memory.
+    Tracks without any signature go first: they are missing from search, an outdated one is only stale.
+    """
+    for outdated in ((False, True) if include_outdated else (False,)):
+        after_id = 0
+        while True:
+            rows = claim_tracks_without_signatures(after_id, chunk_size, outdated=outdated)
+            if not rows:
+                break
+            yield from rows
+            after_id = rows[-1][0]
+
+
+def download(url: str, timeout: Optional[float] = None) -> bytes:
+    """
+    The session timeouts limit connecting and every read, `timeout` limits the whole download:
+    a server sending a few bytes at a time doesn't hold a download thread forever.
+    """
+    with SIGNATURE_STAGE_SECONDS.time(stage="download"):
+        with get_session().get(url, stream=timeout is not None) as response:
+            response.raise_for_status()
+            if timeout is None:
+                return response.content
+            deadline = time.monotonic() + timeout
+            chunks = []
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Download of {url} took longer than {timeout}s")
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+
+def download_track(track: Tuple[int, str]) -> bytes:
+    return download(track[1], timeout=SIGNATURE_DOWNLOAD_TIMEOUT)
+
+
+def extract_features(audio: AudioProcessing) -> None:
+    with SIGNATURE_STAGE_SECONDS.time(stage="features"):
+        audio.set_features_base()
+        audio.set_features_advanced()
+
+
+def observe_audio_timings(audio: AudioProcessing) -> None:
+    for stage, seconds in audio.timings.items():
+        AUDIO_STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def get_signatures(track: Tuple[int, str], is_url: bool = True, data: Optional[bytes] = None) -> Tuple[int, np.ndarray]:
+    """Signature of one track, `data` is the already downloaded file"""
     track_id, url = track
     audio = AudioProcessing(url)
-    audio.load_file(is_url=True)
-    audio.set_features_base()
-    audio.set_features_advanced()
-    signature = audio.get_file_signature(normalize=True, normalization_type="min-max")
-    tools = AudioTools()
-    signature = tools.reduce_with_dct(signature, n_components=110)
-    return track_id, signature
+    if feature_cache is None and data is None:
+        audio.load_file(is_url=is_url)
+        extract_features(audio)
+    elif feature_cache is None:
+        audio.load_bytes(data)
+        extract_features(audio)
+    else:
+        if data is None and is_url:
+            data = download(url)
+        if feature_cache.load(audio, data):
+            FEATURE_CACHE_TOTAL.inc(result="hit")
+        else:
+            FEATURE_CACHE_TOTAL.inc(result="miss")
+            if data is None:
+                audio.load_file()
+            else:
+                audio.load_bytes(data)
+            extract_features(audio)
+            feature_cache.store(audio, data)
+    observe_audio_timings(audio)
+    return track_id, get_signature_from_features(audio)
+
+
+def get_signature_from_features(audio: AudioProcessing) -> np.ndarray:
+    with SIGNATURE_STAGE_SECONDS.time(stage="signature"):
+        if signature_transform is not None:
+            return signature_transform.apply(audio.get_file_signature())
+        signature = audio.get_file_signature(normalize=True, normalization_type="min-max")
+        tools = AudioTools()
+        return tools.reduce_with_dct(signature, n_components=110)
+
+
+def get_signatures_batch(tracks: List[Tuple[int, str]], is_url: bool = True,
+                         contents: Optional[List[Optional[bytes]]] = None) -> Tuple[List[Tuple[int, np.ndarray]], List[Tuple[Tuple[int, str], Exception]]]:
+    """
+    Signatures of several tracks in one pool task, features of the tracks missing from the cache
+    are extracted by a single set_features_batch call. Same signatures as get_signatures.
+    :param contents: already downloaded files of the tracks.
+    :return: (signatures, failures), a failure holds the track and its error.
+    """
+    signatures, failures, pending = [], [], []
+    for i, track in enumerate(tracks):
+        track_id, url = track
+        try:
+            audio = AudioProcessing(url)
+            data = contents[i] if contents is not None else None
+            if data is None and is_url:
+                data = download(url)
+            if feature_cache is not None:
+                if feature_cache.load(audio, data):
+                    FEATURE_CACHE_TOTAL.inc(result="hit")
+                    signatures.append((track_id, get_signature_from_features(audio)))
+                    continue
+                FEATURE_CACHE_TOTAL.inc(result="miss")
+            if data is None:
+                audio.load_file()
+            else:
+                audio.load_bytes(data)
+            pending.append((track, audio, data))
+        except Exception as ex:
+            failures.append((track, ex))
 
+    try:
+        # Время батча целиком: на трек приходится features_batch / размер батча
+        with SIGNATURE_STAGE_SECONDS.time(stage="features_batch"):
+            batch_timings = set_features_batch([audio for _, audio, _ in pending])
+        for stage, seconds in batch_timings.items():
+            AUDIO_STAGE_SECONDS.observe(seconds, stage=f"batch_{stage}")
+        extracted = pending
+    except Exception:
+        # Один неподходящий трек не должен ронять весь батч, считаем по одному
+        extracted = []
+        for track, audio, data in pending:
+            try:
+                extract_features(audio)
+                extracted.append((track, audio, data))
+            except Exception as ex:
+                failures.append((track, ex))
+
+    for track, audio, data in extracted:
+        try:
+            if feature_cache is not None:
+                feature_cache.store(audio, data)
+            observe_audio_timings(audio)
+            signatures.append((track[0], get_signature_from_features(audio)))
+        except Exception as ex:
+            failures.append((track, ex))
+    return signatures, failures
+
+
+def extract_signatures(batch: List[Tuple[Tuple[int, str], Optional[bytes]]], is_url: bool = True) -> Tuple[List[Tuple[int, np.ndarray]], List[Tuple[Tuple[int, str], Exception]]]:
+    """Extraction stage of the backfill pipeline: a task of (track, downloaded file) pairs"""
+    if len(batch) == 1:
+        track, data = batch[0]
+        try:
+            return [get_signatures(track, is_url=is_url, data=data)], []
+        except Exception as ex:
+            return [], [(track, ex)]
+    tracks, contents = zip(*batch)
+    return get_signatures_batch(list(tracks), is_url=is_url, contents=list(contents))
+
+
+def save_signatures_to_db(signatures: List[Tuple[int, np.ndarray]]):
+    conn = None
+    cursor = None
+    try:
+        start = time.perf_counter()
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        # FOR SHARE: переключение версии ждёт окончания записи и наоборот
+        cursor.execute("SELECT is_active FROM signature_versions WHERE version = %s FOR SHARE", (SIGNATURE_VERSION,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Signature version {SIGNATURE_VERSION} is not registered")
+        is_active = row[0]
+
+        cursor.execute("""
+        CREATE TEMP TABLE signatures_staging (id BIGINT, signature vector) ON COMMIT DROP
+        """)
+        copy_signatures(cursor, "signatures_staging", signatures)
+        cursor.execute("""
+        INSERT INTO track_signatures (track_id, version, signature)
+        SELECT signatures_staging.id, %s, signatures_staging.signature
+        FROM signatures_staging
+        JOIN tracks ON tracks.id = signatures_staging.id
+        ON CONFLICT (track_id, version) DO UPDATE
+        SET signature = EXCLUDED.signature, computed_at = now()
+        """, (SIGNATURE_VERSION,))
+        updated = cursor.rowcount
+        # tracks.signature хранит только активную версию: сигнатуры неактивной несравнимы с ней,
+        # даже при той же размерности. Новые треки станут искомыми после переключения
+        if is_active:
+            cursor.execute("""
+            UPDATE tracks
+            SET signature = signatures_staging.signature, signature_version = %s, signature_params_hash = %s
+            FROM signatures_staging
+            WHERE tracks.id = signatures_staging.id
+            """, (SIGNATURE_VERSION, SIGNATURE_PARAMS_HASH))
+        cursor.execute("""
+        DELETE FROM signature_failures
+        USING signatures_staging
+        WHERE signature_failures.track_id = signatures_staging.id AND signature_failures.version = %s
+        """, (SIGNATURE_VERSION,))
+        conn.commit()
+
+        elapsed = time.perf_counter() - start
+        DB_WRITE_SECONDS.observe(elapsed, table="signatures")
+        DB_ROWS_WRITTEN.inc(updated, table="signatures")
+        print(f"Inserted {updated} signatures into the database in {elapsed:.3f}s ({len(signatures) / elapsed if elapsed else 0:.0f} rows/s)", flush=True)
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        DB_WRITE_FAILURES.inc(table="signatures")
+        print("Error inserting into database:", e, flush=True)
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
+    # Индекс другой версии не смешивается с этими сигнатурами
+    if is_active and similarity_index is not None and similarity_index_version == SIGNATURE_VERSION:
+        similarity_index.add([track_id for track_id, _ in signatures], [sig for _, sig in signatures])
 
-def save_signatures_to_db(signatures: List[Tuple[int, str]]):
+
+def record_signature_failures(track_ids: List[int], stage: str, ex: Exception) -> None:
+    """Counts a failed attempt of the tracks for SIGNATURE_VERSION, after SIGNATURE_MAX_ATTEMPTS a track is a dead letter"""
     conn = None
     cursor = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
+        cursor.execute("""
+        INSERT INTO signature_failures (track_id, version, stage, error)
+        SELECT DISTINCT unnest(%s::bigint[]), %s, %s, LEFT(%s, 1000)
+        ON CONFLICT (track_id, version) DO UPDATE
+        SET attempts = signature_failures.attempts + 1, stage = EXCLUDED.stage, error = EXCLUDED.error, failed_at = now()
+        """, (list(track_ids), SIGNATURE_VERSION, stage, f"{type(ex).__name__}: {ex}"))
+        conn.commit()
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
 
-        update_query = """
-        UPDATE tracks
-        SET signature = %s
-        WHERE id = %s
-        """
 
-        records = [(sig, track_id) for track_id, sig in signatures]
+def list_signature_failures(limit: int = 100, dead_only: bool = True) -> List[dict]:
+    """Failed tracks of SIGNATURE_VERSION, the most recent first; dead_only - those no longer retried"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT f.track_id, t.preview_url, f.attempts, f.stage, f.error, f.failed_at
+        FROM signature_failures f
+        JOIN tracks t ON t.id = f.track_id
+        WHERE f.version = %s AND f.attempts >= %s
+        ORDER BY f.failed_at DESC
+        LIMIT %s
+        """, (SIGNATURE_VERSION, SIGNATURE_MAX_ATTEMPTS if dead_only else 0, limit))
+        rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
 
-        cursor.executemany(update_query, records)
+    return [
+        {
+            "id": track_id,
+            "preview_url": preview_url,
+            "attempts": attempts,
+            "stage": stage,
+            "error": error,
+            "failed_at": failed_at.isoformat() if failed_at else None,
+        }
+        for track_id, preview_url, attempts, stage, error, failed_at in rows
+    ]
+
+
+def retry_signature_failures(track_ids: Optional[List[int]] = None) -> int:
+    """Returns dead letters of SIGNATURE_VERSION (all or the given tracks) to the backfill queue"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        if track_ids is None:
+            cursor.execute("DELETE FROM signature_failures WHERE version = %s", (SIGNATURE_VERSION,))
+        else:
+            cursor.execute("DELETE FROM signature_failures WHERE version = %s AND track_id = ANY(%s)", (SIGNATURE_VERSION, list(track_ids)))
+        deleted = cursor.rowcount
         conn.commit()
-        print(f"Inserted {cursor.rowcount} signatures into the database.", flush=True)
-    except Exception as e:
-        print("Error inserting into database:", e)
+        return deleted
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
     finally:
         if cursor:
             cursor.close()
@@ -178,12 +623,362 @@ def save_signatures_to_db(signatures: List[Tuple[int, str]]):
             release_connection(conn)
 
 
-def process_tracks_in_batches(batch_size: int = 10):
-    tracks = get_tracks_without_signatures()
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for i in range(0, len(tracks), batch_size):
-            batch = tracks[i:i + batch_size]
-            futures = [executor.submit(get_signatures, track) for track in batch]
-            signatures = [f.result() for f in concurrent.futures.as_completed(futures)]
+def _init_signature_worker():
+    """Runs once in every pool process, so librosa/numba are loaded and compiled before the first track arrives"""
+    # Метрики процесса пула уходят родителю с результатами задач, файл снимка ему не нужен
+    registry.state_dir = None
+    ensure_warm()
+
+
+def process_tracks_in_batches(batch_size: int = SIGNATURE_WRITE_BATCH_SIZE, workers: Optional[int] = None, job: Optional[Job] = None,
+                              tracks_per_task: int = SIGNATURE_TRACKS_PER_TASK, include_outdated: bool = False,
+                              download_workers: int = SIGNATURE_DOWNLOAD_WORKERS):
+    """
+    Computes the missing signatures of SIGNATURE_VERSION, with include_outdated also re-signs
+    the tracks whose signature is of another version (after the missing ones).
+    Downloads, feature extraction and DB writes run as pipeline stages at the same time: a slow preview
+    holds one download thread, not a batch. A failed track is recorded in signature_failures.
+    """
+    is_active = register_signature_version()
+    tracks = iter_tracks_without_signatures(chunk_size=max(batch_size, 100), include_outdated=include_outdated)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    def write(signatures: List[Tuple[int, np.ndarray]]) -> None:
+        try:
             save_signatures_to_db(signatures)
-            time.sleep(1)
\ No newline at end of file
+        except Exception as ex:
+            # Батч не записан: треки считаются неудачными, исключение уходит в счётчик write конвейера
+            SIGNATURES_TOTAL.inc(len(signatures), result="failed")
+            if job is not None:
+                job.increment("errors", len(signatures))
+            try:
+                record_signature_failures([track_id for track_id, _ in signatures], "write", ex)
+            except Exception as record_ex:
+                print("Error recording failed signatures:", record_ex, flush=True)
+            raise
+        SIGNATURES_TOTAL.inc(len(signatures), result="ok")
+        if job is not None:
+            job.increment("signatures_computed", len(signatures))
+
+    def on_failure(track: Tuple[int, str], stage: str, ex: Exception) -> None:
+        SIGNATURES_TOTAL.inc(result="failed")
+        print(f"Error computing signature for track {track[0]} ({stage}): {ex}", flush=True)
+        if job is not None:
+            job.increment("errors")
+        record_signature_failures([track[0]], stage, ex)
+
+    pipeline = Pipeline(
+        extract=extract_signatures,
+        write=write,
+        download=download_track,
+        download_workers=download_workers,
+        extract_workers=workers,
+        items_per_task=tracks_per_task,
+        queue_size=SIGNATURE_QUEUE_SIZE,
+        write_batch_size=batch_size,
+        write_interval=SIGNATURE_WRITE_INTERVAL,
+        extract_timeout=SIGNATURE_EXTRACT_TIMEOUT,
+        on_failure=on_failure,
+        # Незаконченные захваченные треки вернутся в очередь по SIGNATURE_CLAIM_TIMEOUT
+        is_cancelled=(lambda: job.cancelled) if job is not None else None,
+        initializer=_init_signature_worker,
+    )
+    # Прогрев в родителе один раз: воркеры пула, созданные через fork, получают скомпилированный код
+    ensure_warm()
+    stats = pipeline.run(tracks)
+    processed = stats.get("extract_ok", 0)
+
+    # Сигнатуры неактивной версии в поиск не попадают до переключения
+    if processed and is_active:
+        rebuild_similarity_index()
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {processed} tracks in {elapsed:.1f}s: {processed / elapsed if elapsed else 0:.2f} tracks/s with {workers} workers, {stats}", flush=True)
+    return processed
+
+
+def build_similarity_index(version: Optional[str] = None) -> BaseSimilarityIndex:
+    """
+    Builds the index from every stored signature, rows are streamed through a server-side cursor.
+    Signatures of tracks.signature by default, of track_signatures for a given version.
+    """
+    conn = None
+    cursor = None
+    ids, vectors = [], []
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(name="similarity_index_build")
+        cursor.itersize = 10000
+        # vector_send отдаёт бинарную форму pgvector, без текста '[...]' и его разбора
+        if version is None:
+            cursor.execute("SELECT id, vector_send(signature) FROM tracks WHERE signature IS NOT NULL ORDER BY id")
+        else:
+            cursor.execute("SELECT track_id, vector_send(signature) FROM track_signatures WHERE version = %s ORDER BY track_id", (version,))
+        for track_id, signature in cursor:
+            ids.append(track_id)
+            vectors.append(from_pgvector_binary(signature))
+        conn.commit()
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
+    index_type = INDEX_TYPES[SIMILARITY_INDEX_TYPE]
+    index = index_type.build(ids, vectors, metric=SIMILARITY_METRIC) if ids else index_type(metric=SIMILARITY_METRIC)
+    print(f"Similarity index built: {len(index)} signatures of {version or 'tracks.signature'}, {SIMILARITY_INDEX_TYPE}/{SIMILARITY_METRIC}", flush=True)
+    return index
+
+
+def get_similarity_index_path(version: Optional[str]) -> str:
+    """similarity_index.npz -> similarity_index.<version>.npz, indexes of different versions live side by side"""
+    if version is None:
+        return SIMILARITY_INDEX_PATH
+    root, ext = os.path.splitext(SIMILARITY_INDEX_PATH)
+    return f"{root}.{version}{ext}"
+
+
+def get_active_signature_version() -> Optional[str]:
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM signature_versions WHERE is_active")
+        row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else None
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
+
+def get_file_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def load_similarity_index(version: Optional[str]) -> BaseSimilarityIndex:
+    path = get_similarity_index_path(version)
+    if os.path.exists(path):
+        return BaseSimilarityIndex.load(path)
+    index = build_similarity_index(version)
+    index.save(path)
+    return index
+
+
+def get_similarity_index() -> BaseSimilarityIndex:
+    """
+    Loads the persisted index of the active signature version once per process, or builds and saves it.
+    Every SIGNATURE_VERSION_CHECK_INTERVAL seconds the active version and the index file are re-checked,
+    so a switch or a backfill made by another process replaces the index here too.
+    """
+    global similarity_index, similarity_index_version, similarity_index_checked_at, similarity_index_mtime
+    with similarity_index_lock:
+        now = time.monotonic()
+        if similarity_index is None or now - similarity_index_checked_at >= SIGNATURE_VERSION_CHECK_INTERVAL:
+            try:
+                version = get_active_signature_version()
+            except Exception as ex:
+                if similarity_index is None:
+                    raise
+                # Без БД продолжаем отвечать по загруженному индексу
+                print("Error checking the active signature version:", ex, flush=True)
+                version = similarity_index_version
+            similarity_index_checked_at = now
+            path = get_similarity_index_path(version)
+            if similarity_index is None or version != similarity_index_version or get_file_mtime(path) != similarity_index_mtime:
+                similarity_index = load_similarity_index(version)
+                similarity_index_version = version
+                similarity_index_mtime = get_file_mtime(path)
+    return similarity_index
+
+
+def rebuild_similarity_index() -> BaseSimilarityIndex:
+    """
+    Rebuilds the persisted index of the active version from the DB after a backfill. The file is the only
+    shared state: a process only adds its own writes to its in-memory index and never saves it,
+    so workers don't overwrite each other's files with partial indexes.
+    """
+    global similarity_index, similarity_index_version, similarity_index_checked_at, similarity_index_mtime
+    version = get_active_signature_version()
+    index = build_similarity_index(version)
+    path = get_similarity_index_path(version)
+    index.save(path)
+    with similarity_index_lock:
+        similarity_index = index
+        similarity_index_version = version
+        similarity_index_checked_at = time.monotonic()
+        similarity_index_mtime = get_file_mtime(path)
+    return index
+
+
+def list_signature_versions() -> List[dict]:
+    """Registered versions with the number of tracks signed by each"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT v.version, v.params_hash, v.dim, v.is_active, v.created_at, v.activated_at, count(s.track_id)
+        FROM signature_versions v
+        LEFT JOIN track_signatures s ON s.version = v.version
+        GROUP BY v.version
+        ORDER BY v.created_at
+        """)
+        rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
+    return [
+        {
+            "version": version,
+            "params_hash": params_hash,
+            "dim": dim,
+            "is_active": is_active,
+            "created_at": created_at.isoformat() if created_at else None,
+            "activated_at": activated_at.isoformat() if activated_at else None,
+            "tracks": tracks,
+        }
+        for version, params_hash, dim, is_active, created_at, activated_at, tracks in rows
+    ]
+
+
+def get_signature_version_coverage(version: str) -> Dict[str, int]:
+    """
+    Tracks signed in `version` (rows of track_signatures) and tracks still missing a signature of it.
+    A track without any signature that failed SIGNATURE_MAX_ATTEMPTS times for `version` isn't missing:
+    it can't be signed, the switch leaves it unsearchable as it is now.
+    :raise KeyError: unknown version.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM signature_versions WHERE version = %s", (version,))
+        if cursor.fetchone() is None:
+            raise KeyError(f"Signature version {version} not found")
+        cursor.execute("SELECT count(*) FROM track_signatures WHERE version = %s", (version,))
+        signed = cursor.fetchone()[0]
+        cursor.execute("""
+        SELECT count(*)
+        FROM tracks
+        WHERE NOT EXISTS (
+            SELECT 1 FROM track_signatures
+            WHERE track_signatures.track_id = tracks.id AND track_signatures.version = %s
+        )
+        AND (signature IS NOT NULL OR NOT EXISTS (
+            SELECT 1 FROM signature_failures
+            WHERE signature_failures.track_id = tracks.id AND signature_failures.version = %s
+              AND signature_failures.attempts >= %s
+        ))
+        """, (version, version, SIGNATURE_MAX_ATTEMPTS))
+        missing = cursor.fetchone()[0]
+        conn.commit()
+        return {"signed": signed, "missing": missing}
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
+
+def switch_signature_version(version: str, force: bool = False, job: Optional[Job] = None) -> dict:
+    """
+    Makes `version` the one stored in tracks.signature and used for search. The index of the new version
+    is built beforehand, then tracks.signature is rewritten in one transaction and the index pointer swapped,
+    so readers see either the old version or the new one, never a mix.
+    Without `force`, tracks missing a signature of the new version (get_signature_version_coverage) block the switch.
+    :raise KeyError: unknown version. :raise ValueError: incomplete coverage.
+    """
+    global similarity_index, similarity_index_version, similarity_index_checked_at, similarity_index_mtime
+    coverage = get_signature_version_coverage(version)
+    if coverage["missing"] and not force:
+        raise ValueError(f"{coverage['missing']} tracks have no signature of version {version}, re-sign them first or force the switch")
+
+    # Индекс новой версии строится до переключения, поиск всё это время идёт по старому
+    index = build_similarity_index(version)
+    index.save(get_similarity_index_path(version))
+    if job is not None:
+        job.check_cancelled()
+
+    conn = None
+    cursor = None
+    try:
+        start = time.perf_counter()
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        # FOR UPDATE ждёт записи сигнатур, взявшие FOR SHARE, и не пускает новые до COMMIT
+        cursor.execute("SELECT version, dim FROM signature_versions WHERE is_active OR version = %s FOR UPDATE", (version,))
+        dim = next(row_dim for row_version, row_dim in cursor.fetchall() if row_version == version)
+
+        # ivfflat строится только по vector(n) фиксированной размерности: при смене размерности
+        # индекс пересоздаётся, tracks заблокирована до конца транзакции
+        rebuild_index = get_signature_column_dim(cursor) != dim
+        if rebuild_index:
+            cursor.execute("DROP INDEX IF EXISTS idx_tracks_signature_ivfflat")
+            cursor.execute(f"ALTER TABLE tracks ALTER COLUMN signature TYPE vector({int(dim)}) USING NULL")
+        cursor.execute("""
+        UPDATE tracks
+        SET signature = track_signatures.signature, signature_version = signature_versions.version,
+            signature_params_hash = signature_versions.params_hash
+        FROM track_signatures
+        JOIN signature_versions ON signature_versions.version = track_signatures.version
+        WHERE track_signatures.track_id = tracks.id AND track_signatures.version = %s
+        """, (version,))
+        updated = cursor.rowcount
+        # Треки без сигнатуры новой версии (force) уходят в очередь на пересчёт
+        cursor.execute("""
+        UPDATE tracks SET signature = NULL, signature_version = NULL, signature_params_hash = NULL
+        WHERE signature_version IS DISTINCT FROM %s AND (signature IS NOT NULL OR signature_version IS NOT NULL)
+        """, (version,))
+        cleared = cursor.rowcount
+        if rebuild_index:
+            cursor.execute("CREATE INDEX idx_tracks_signature_ivfflat ON tracks USING ivfflat (signature) WITH (lists='100')")
+        # Уникальный индекс по is_active проверяется построчно, поэтому снимаем и ставим флаг отдельно
+        cursor.execute("UPDATE signature_versions SET is_active = FALSE WHERE is_active AND version <> %s", (version,))
+        cursor.execute("""
+        UPDATE signature_versions SET is_active = TRUE, activated_at = now() WHERE version = %s AND NOT is_active
+        """, (version,))
+        conn.commit()
+        elapsed = time.perf_counter() - start
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            release_connection(conn)
+
+    with similarity_index_lock:
+        similarity_index = index
+        similarity_index_version = version
+        similarity_index_checked_at = time.monotonic()
+        similarity_index_mtime = get_file_mtime(get_similarity_index_path(version))
+
+    print(f"Switched to signature version {version} in {elapsed:.1f}s: {updated} tracks, {cleared} cleared", flush=True)
+    if job is not None:
+        job.increment("tracks_switched", updated)
+    return {"version": version, "tracks": updated, "cleared": cleared, "index_rebuilt": rebuild_index}
+
+
+def find_similar_tracks(track_id: int, k: int = 20, metric: Optional[str] = None) -> List[dict]:
+    index = get_similarity_index()
+    if track_id not in index:
+        raise KeyError(f"Track {track_id} has no signature in the index")
+    ids, distances = index.search_by_id(track_id, k=k, metric=metric)
+    return [{"id": int(i), "distance": float(d)} for i, d in zip(ids, distances)]
@@ -0,0 +1,270 @@
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from tempfile import NamedTemporaryFile
+from typing import Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Background job state, updated by the job function and read by /jobs/<id>"""
+
+    # Снимок состояния для других воркеров пишется не чаще раза в секунду
+    persist_interval = 1.0
+
+    def __init__(self, kind: str, params: dict, state_dir: Optional[str] = None) -> None:
+        self.id = uuid.uuid4().hex
+        # Процесс-владелец: по нему другие воркеры находят задачи убитого воркера
+        self.pid = os.getpid()
+        self.kind = kind
+        self.params = params
+        self.state_dir = state_dir
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.counters: Dict[str, int] = {"tracks_fetched": 0, "signatures_computed": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._persisted_at = 0.0
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+        self.persist()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancel_event.is_set() and self.state_dir and os.path.exists(get_cancel_path(self.state_dir, self.id)):
+            self._cancel_event.set()
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    def check_cancelled(self) -> None:
+        """Called by the job function between units of work"""
+        if self.cancelled:
+            raise JobCancelled(f"job {self.id} cancelled")
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def persist(self, force: bool = False) -> None:
+        if not self.state_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._persisted_at < self.persist_interval:
+            return
+        self._persisted_at = now
+        write_state(self.state_dir, self.as_dict())
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        processed = counters["tracks_fetched"] + counters["signatures_computed"]
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "pid": self.pid,
+            "params": self.params,
+            "status": self.status,
+            "cancel_requested": self._cancel_event.is_set(),
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": elapsed,
+            "counters": counters,
+            "throughput": processed / elapsed if elapsed else 0.0,
+        }
+
+
+def get_state_path(state_dir: str, job_id: str) -> str:
+    return os.path.join(state_dir, f"{job_id}.json")
+
+
+def get_cancel_path(state_dir: str, job_id: str) -> str:
+    return os.path.join(state_dir, f"{job_id}.cancel")
+
+
+def write_state(state_dir: str, state: dict) -> None:
+    # Через временный файл: читающий воркер не увидит недописанный снимок
+    with NamedTemporaryFile("w", dir=state_dir, suffix=".tmp", delete=False) as tmp_file:
+        json.dump(state, tmp_file, default=str)
+    os.replace(tmp_file.name, get_state_path(state_dir, state["job_id"]))
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobManager:
+    """
+    Runs jobs on an in-process thread pool.
+    The job function gets the Job as `job` keyword, reports progress through it and stops once cancelled.
+    Only the last max_finished finished jobs are kept.
+
+    With state_dir set, job snapshots and cancel requests go through files, so any pre-forked
+    worker can answer /jobs/<id> for a job running in another one.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 1000, state_dir: Optional[str] = None) -> None:
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_finished = max_finished
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.accepting = True
+        self._lock = threading.Lock()
+        self.fail_orphaned_jobs()
+
+    def submit(self, kind: str, func: Callable, **params) -> Job:
+        job = Job(kind, params, state_dir=self.state_dir)
+        with self._lock:
+            if not self.accepting:
+                raise RuntimeError("job manager is shutting down")
+            self.jobs[job.id] = job
+            self._prune()
+        job.persist(force=True)
+        self.executor.submit(self._run, job, func, params)
+        return job
+
+    def _run(self, job: Job, func: Callable, params: dict) -> None:
+        if job.cancelled:
+            job.status, job.finished_at = "cancelled", time.time()
+            job.persist(force=True)
+            return
+        job.status, job.started_at = "running", time.time()
+        job.persist(force=True)
+        try:
+            job.result = func(job=job, **params)
+            job.status = "cancelled" if job.cancelled else "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as ex:
+            print(f"Job {job.id} ({job.kind}) failed:", ex, flush=True)
+            job.status, job.error = "failed", str(ex)
+        finally:
+            job.finished_at = time.time()
+            job.persist(force=True)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job_id]
+            if self.state_dir:
+                for path in (get_state_path(self.state_dir, job_id), get_cancel_path(self.state_dir, job_id)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _load_state(self, job_id: str) -> Optional[dict]:
+        if not self.state_dir:
+            return None
+        try:
+            with open(get_state_path(self.state_dir, job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get_state(self, job_id: str) -> Optional[dict]:
+        """State of a job of this process, or the last snapshot written by another worker"""
+        job = self.get(job_id)
+        return job.as_dict() if job is not None else self._load_state(job_id)
+
+    def list_states(self) -> List[dict]:
+        if not self.state_dir:
+            return [job.as_dict() for job in self.list()]
+        states = [self._load_state(file[:-len(".json")]) for file in os.listdir(self.state_dir) if file.endswith(".json")]
+        return sorted((state for state in states if state), key=lambda state: state["created_at"])
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.get(job_id)
+        if job is not None:
+            if not job.is_finished:
+                job.cancel()
+            return job.as_dict()
+
+        state = self._load_state(job_id)
+        if state is not None and state["status"] in ("queued", "running"):
+            # Задача в другом воркере увидит файл при следующей проверке отмены
+            open(get_cancel_path(self.state_dir, job_id), "w").close()
+            state["cancel_requested"] = True
+        return state
+
+    def fail_orphaned_jobs(self) -> List[str]:
+        """
+        Marks failed the queued and running jobs of processes that no longer exist: a worker killed
+        before its jobs finished (SIGKILL after graceful_timeout, OOM) can't update their snapshots itself.
+        :return: ids of the jobs marked failed.
+        """
+        if not self.state_dir:
+            return []
+        failed = []
+        for state in self.list_states():
+            pid = state.get("pid")
+            if state["status"] not in ("queued", "running") or pid is None or pid == os.getpid() or is_process_alive(pid):
+                continue
+            state.update(status="failed", error=f"worker {pid} exited before the job finished", finished_at=time.time())
+            write_state(self.state_dir, state)
+            failed.append(state["job_id"])
+        if failed:
+            print(f"Marked {len(failed)} jobs of exited workers as failed: {failed}", flush=True)
+        return failed
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Graceful shutdown: stops taking new jobs and lets running ones finish within timeout,
+        whatever is still running after that is cancelled and marked failed, since the process
+        may be killed before the job notices the cancellation.
+        """
+        with self._lock:
+            self.accepting = False
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while any(not job.is_finished for job in self.list()):
+            if deadline is not None and time.monotonic() >= deadline:
+                # Задачи из очереди тоже отменятся сразу при старте
+                for job in self.list():
+                    job.cancel()
+                for job in self.list():
+                    if not job.is_finished:
+                        job.status, job.error, job.finished_at = "failed", "worker is shutting down", time.time()
+                        job.persist(force=True)
+                # Задачу, не заметившую отмену, не ждём: процесс всё равно будет убит
+                self.executor.shutdown(wait=False)
+                return
+            time.sleep(0.1)
+        self.executor.shutdown(wait=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        for job in self.list():
+            job.cancel()
+        self.executor.shutdown(wait=wait)
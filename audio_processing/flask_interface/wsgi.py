@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask_interface.app import app  # noqa: E402
+
+# similarity_service/audio_processing/
+#
+#   gunicorn -c gunicorn.conf.py flask_interface.wsgi:app
+#
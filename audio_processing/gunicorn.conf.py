@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import signal
+import time
+
+# similarity_service/audio_processing/
+#
+#   gunicorn -c gunicorn.conf.py flask_interface.wsgi:app
+#
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+
+# Поиск похожих треков и разбор JSON держат GIL, поэтому параллелизм по процессам,
+# потоки внутри воркера закрывают ожидание БД и сети
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = os.environ.get("WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WORKER_THREADS", 4))
+
+# librosa / numba / numpy и модули приложения импортируются один раз в мастере,
+# воркеры получают их через fork (copy-on-write)
+preload_app = True
+
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = 5
+max_requests = int(os.environ.get("MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Сколько арбитр ждёт воркер после SIGTERM до SIGKILL: сначала дообрабатываются запросы,
+# остаток уходит на фоновые задачи, прежде чем их отменить
+graceful_timeout = int(os.environ.get("JOB_DRAIN_TIMEOUT", 300))
+
+# Снимки задач общие для всех воркеров: /jobs/<id> может обработать любой из них
+os.environ.setdefault("JOBS_DIR", "/tmp/similarity_jobs")
+# Снимки метрик воркеров, /metrics суммирует их по всем воркерам
+os.environ.setdefault("METRICS_DIR", "/tmp/similarity_metrics")
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Счётчики прошлого запуска не должны попасть в новые, после перезапуска они начинаются с нуля
+    metrics_dir = os.environ["METRICS_DIR"]
+    if os.path.isdir(metrics_dir):
+        for file_name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, file_name))
+
+
+def when_ready(server):
+    # Импорт подмодулей librosa и JIT numba один раз в мастере, воркеры получают готовый код через fork
+    if os.environ.get("WARM_UP", "1") != "0":
+        from features_extraction.audio_analysis import warm_up
+        server.log.info("Warm-up: %s", warm_up())
+    if os.environ.get("PRELOAD_SIMILARITY_INDEX"):
+        from flask_interface.functions import get_similarity_index
+        get_similarity_index()
+    # Соединения мастера не должны достаться воркерам, каждый откроет свой пул
+    from flask_interface.db import close_pool
+    close_pool()
+
+
+def post_worker_init(worker):
+    # Отсчёт graceful_timeout арбитр начинает с SIGTERM, а не с worker_exit: запоминаем момент сигнала
+    def handle_exit(sig, frame):
+        worker.exit_requested_at = time.monotonic()
+        worker.handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_exit)
+    signal.siginterrupt(signal.SIGTERM, False)
+    # Задачи воркера, убитого до их завершения, иначе навсегда останутся "running"
+    from flask_interface.app import job_manager
+    job_manager.fail_orphaned_jobs()
+
+
+def worker_exit(server, worker):
+    from flask_interface.app import job_manager
+    # Часть graceful_timeout уже ушла на запросы, задачам остаётся время до SIGKILL с запасом
+    exit_requested_at = getattr(worker, "exit_requested_at", None)
+    elapsed = time.monotonic() - exit_requested_at if exit_requested_at is not None else 0.0
+    job_manager.drain(timeout=max(graceful_timeout - elapsed - 5, 0))
+    from features_extraction.metrics import registry
+    registry.persist()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from features_extraction.audio_analysis import ensure_warm
+from features_extraction.pipeline import Pipeline
+from flask_interface.functions import _init_signature_worker, extract_signatures
+
+# similarity_service/audio_processing/
+#
+#   python scripts/benchmark_backfill.py tests/computing/test_audios/similar --workers 1 2 4 8
+#   python scripts/benchmark_backfill.py tests/computing/test_audios/similar --workers 4 --tracks-per-task 1 8
+#
+
+
+def get_file_paths(folder_path):
+    return [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith(".mp3")]
+
+
+def benchmark(file_paths, workers: int, tracks_per_task: int = 1) -> float:
+    """Returns throughput of the backfill pipeline in tracks per second"""
+    tracks = list(enumerate(file_paths))
+    start = time.perf_counter()
+    # Те же стадии, что у process_tracks_in_batches, без загрузки и записи в БД
+    ensure_warm()
+    stats = Pipeline(partial(extract_signatures, is_url=False), write=lambda batch: None, extract_workers=workers,
+                     items_per_task=tracks_per_task, initializer=_init_signature_worker).run(tracks)
+    processed = stats.get("extract_ok", 0)
+    elapsed = time.perf_counter() - start
+    return processed / elapsed if elapsed else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Signature backfill scaling by worker count")
+    parser.add_argument("folder")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--tracks-per-task", type=int, nargs="+", default=[1],
+                        help="several values compare per-track extraction with batched set_features_batch")
+    args = parser.parse_args()
+
+    file_paths = get_file_paths(args.folder)[:args.limit]
+    print(f"{len(file_paths)} tracks")
+    base = None
+    for tracks_per_task in args.tracks_per_task:
+        for workers in sorted(set(args.workers)):
+            tracks_per_second = benchmark(file_paths, workers, tracks_per_task)
+            base = base or tracks_per_second
+            print(f"workers={workers:<3} tracks/task={tracks_per_task:<3} {tracks_per_second:.2f} tracks/s  x{tracks_per_second / base:.2f}")
@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from features_extraction.audio_analysis import AudioProcessing, AudioTools, RESAMPLING_POLICIES
+
+# similarity_service/audio_processing/
+#
+#   python scripts/benchmark_resampling.py tests/computing/test_audios --policies hq fast native
+#
+# Decode+resample time and full signature time per track for every policy,
+# and the drift of the stored (min-max + DCT) signature relative to the "hq" one.
+
+REFERENCE_POLICY = "hq"
+
+
+def get_file_paths(corpus_path):
+    file_paths = []
+    for root, _, files in os.walk(corpus_path):
+        file_paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith((".mp3", ".wav")))
+    return file_paths
+
+
+def compute_signature(file_path, policy):
+    audio = AudioProcessing(file_path, resampling=policy)
+    start = time.perf_counter()
+    audio.load_file()
+    audio.set_features_base()
+    audio.set_features_advanced()
+    signature = audio.get_file_signature(normalize=True, normalization_type="min-max")
+    signature = AudioTools().reduce_with_dct(signature, n_components=110)
+    return np.array(signature), audio.timings["load"], time.perf_counter() - start
+
+
+def benchmark(file_paths, policies):
+    results = {}
+    for policy in [REFERENCE_POLICY] + [p for p in policies if p != REFERENCE_POLICY]:
+        signatures, load_times, total_times = [], [], []
+        for file_path in file_paths:
+            signature, load_time, total_time = compute_signature(file_path, policy)
+            signatures.append(signature)
+            load_times.append(load_time)
+            total_times.append(total_time)
+        results[policy] = {
+            "signatures": np.array(signatures),
+            "load": float(np.mean(load_times)),
+            "total": float(np.mean(total_times)),
+        }
+
+    reference = results[REFERENCE_POLICY]["signatures"]
+    for policy, result in results.items():
+        drift = np.linalg.norm(result["signatures"] - reference, axis=1) / np.linalg.norm(reference, axis=1)
+        result["drift_mean"] = float(np.mean(drift))
+        result["drift_max"] = float(np.max(drift))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resampling policy speed vs signature drift")
+    parser.add_argument("corpus", nargs="?", default="tests/computing/test_audios")
+    parser.add_argument("--policies", nargs="+", default=list(RESAMPLING_POLICIES), choices=list(RESAMPLING_POLICIES))
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    file_paths = get_file_paths(args.corpus)[:args.limit]
+    if not file_paths:
+        raise ValueError(f"No audio files found in {args.corpus}")
+
+    # Первый трек прогревает numba, чтобы JIT не попал в замеры
+    compute_signature(file_paths[0], REFERENCE_POLICY)
+
+    print(f"{len(file_paths)} tracks\n")
+    print(f"{'policy':<16}{'load, s':>10}{'total, s':>10}{'drift mean':>12}{'drift max':>12}")
+    for policy, result in benchmark(file_paths, args.policies).items():
+        print(f"{policy:<16}{result['load']:>10.3f}{result['total']:>10.3f}{result['drift_mean']:>12.4f}{result['drift_max']:>12.4f}")
@@ -0,0 +1,138 @@
+import argparse
+import concurrent.futures
+import os
+import random
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from features_extraction.audio_analysis import AudioTools
+from features_extraction.http_session import get_session
+from features_extraction.similarity_index import INDEX_TYPES, BaseSimilarityIndex
+
+# similarity_service/audio_processing/
+#
+#   gunicorn -c gunicorn.conf.py flask_interface.wsgi:app
+#   python scripts/benchmark_serving.py http://localhost:5000 --concurrency 1 8 32 --similar-ids 1 2 3
+#
+# Index alone, in process: recall@k against an exact scan and per-query latency
+#
+#   python scripts/benchmark_serving.py --index ivf --vectors 1000000
+#   python scripts/benchmark_serving.py --index-path similarity_index.npz
+#
+
+
+def run(base_url: str, paths: List[str], concurrency: int, duration: float) -> dict:
+    """Closed loop load: `concurrency` clients send requests back to back for `duration` seconds"""
+    session = get_session()
+    deadline = time.perf_counter() + duration
+
+    def client(_) -> tuple:
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.get(base_url + random.choice(paths))
+                if response.status_code >= 500:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        return latencies, errors
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for client_latencies, _ in results for latency in client_latencies]) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "rps": len(latencies) / elapsed,
+        "p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "p95": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        "p99": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+    }
+
+
+def get_clustered_vectors(n: int, dim: int = 110, clusters: int = 1000, noise: float = 0.2, seed: int = 0) -> np.ndarray:
+    """Synthetic signatures: overlapping gaussian clusters, like tracks of similar styles"""
+    rng = np.random.default_rng(seed)
+    centers = rng.random((clusters, dim), dtype=np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        end = min(start + 100000, n)
+        vectors[start:end] = centers[rng.integers(0, clusters, end - start)] + noise * rng.standard_normal((end - start, dim), dtype=np.float32)
+    return vectors
+
+
+def benchmark_index(index: BaseSimilarityIndex, n_queries: int = 200, k: int = 20, seed: int = 0) -> dict:
+    """Queries are stored vectors with a small shift; recall@k is the share of the exact top k found"""
+    rng = np.random.default_rng(seed)
+    tools = AudioTools()
+    vectors, alive = index.vectors, index._alive[:len(index.ids)]
+    queries = vectors[rng.choice(np.flatnonzero(alive), n_queries, replace=False)] + 0.01
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        found = index.search(query, k)[0]
+        latencies.append(time.perf_counter() - start)
+        exact, _ = tools.get_top_k(query, vectors, k=k, metric=index.metric)
+        hits += len(set(found.tolist()) & set(index.ids[exact].tolist()))
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": hits / (k * n_queries),
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of /ping and /similar/<track_id>, or of the similarity index alone")
+    parser.add_argument("base_url", nargs="?")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--similar-ids", type=int, nargs="*", default=[])
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--index", choices=sorted(INDEX_TYPES), help="build an index over synthetic vectors")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--noise", type=float, default=0.2, help="spread of the synthetic clusters")
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--index-path", help="benchmark a persisted index")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.index or args.index_path:
+        start = time.perf_counter()
+        if args.index_path:
+            index = BaseSimilarityIndex.load(args.index_path)
+        else:
+            vectors = get_clustered_vectors(args.vectors, noise=args.noise)
+            params = {"n_probe": args.n_probe} if args.index == "ivf" else {}
+            index = INDEX_TYPES[args.index].build(np.arange(len(vectors)), vectors, **params)
+        print(f"{index.kind} {index.get_params()}: {len(index)} vectors, built/loaded in {time.perf_counter() - start:.1f}s")
+        stats = benchmark_index(index, n_queries=args.queries, k=args.k)
+        print(f"recall@{args.k}={stats['recall']:.3f}  p50={stats['p50']:.2f}ms p99={stats['p99']:.2f}ms")
+        sys.exit(0)
+    if not args.base_url:
+        parser.error("base_url is required without --index / --index-path")
+
+    endpoints = {"ping": ["/ping"]}
+    if args.similar_ids:
+        endpoints["similar"] = [f"/similar/{track_id}?k={args.k}" for track_id in args.similar_ids]
+
+    for name, paths in endpoints.items():
+        # Прогрев: загрузка индекса и соединения пула не должны попасть в замер
+        run(args.base_url, paths, concurrency=max(args.concurrency), duration=1.0)
+        for concurrency in args.concurrency:
+            stats = run(args.base_url, paths, concurrency, args.duration)
+            print(
+                f"{name:<8} concurrency={concurrency:<4} {stats['rps']:8.1f} req/s  "
+                f"p50={stats['p50']:.1f}ms p95={stats['p95']:.1f}ms p99={stats['p99']:.1f}ms  "
+                f"errors={stats['errors']}/{stats['requests']}"
+            )
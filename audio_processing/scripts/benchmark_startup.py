@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# similarity_service/audio_processing/
+#
+#   python scripts/benchmark_startup.py --runs 3
+#
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Выполняется в новом интерпретаторе, как в только что запущенном воркере
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.append(sys.argv[1])
+from features_extraction.audio_analysis import warm_up
+imported = time.perf_counter()
+first = warm_up()["total"]
+second = warm_up()["total"]
+# Воркер, порождённый через fork после прогрева родителя (gunicorn preload, пул сигнатур)
+import multiprocessing
+with multiprocessing.get_context("fork").Pool(1) as pool:
+    forked = pool.apply(warm_up)["total"]
+print(json.dumps({"import": imported - start, "first_signature": first, "next_signature": second, "forked_first_signature": forked}))
+"""
+
+
+def measure(numba_cache_dir: str) -> dict:
+    env = {**os.environ, "NUMBA_CACHE_DIR": numba_cache_dir}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, ROOT], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time and time to first signature of a fresh worker")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Первый запуск с пустым кэшем numba, дальше кэш уже заполнен
+        results = [("cold cache", measure(cache_dir))]
+        results += [("warm cache", measure(cache_dir)) for _ in range(args.runs)]
+
+    for name, timings in results:
+        print(
+            f"{name:<10} import={timings['import']:.2f}s  "
+            f"first signature={timings['first_signature']:.2f}s  next={timings['next_signature']:.2f}s  "
+            f"forked worker first signature={timings['forked_first_signature']:.2f}s"
+        )
@@ -0,0 +1,270 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# similarity_service/audio_processing/
+#
+#   python scripts/benchmark_suite.py tests/computing/test_audios --output baseline.json
+#   python scripts/benchmark_suite.py tests/computing/test_audios --configs baseline fast_resample hop_1024 --output run.json
+#   python scripts/benchmark_suite.py tests/computing/test_audios --config-file configs.json --output run.json
+#   python scripts/benchmark_suite.py --compare baseline.json run.json
+#
+# Corpus layout: identical/, different/, similar/. Labels of the similar groups are read from
+# <corpus>/groups.json ({"group": ["similar/example144.mp3", ...]}); without it every file of identical/
+# is one group, different/ and unlisted files are distractors.
+# Every configuration runs in a fresh process, so peak RSS and numba warm-up are per configuration.
+
+FOLDERS = ("identical", "different", "similar")
+
+# Параметры конфигурации: resampling - политика из RESAMPLING_POLICIES, sample_rate - своя частота
+# (soxr_hq), hop_length / n_fft, window - full | third (duration // 3 + 1, как в test_similar_tracks)
+# | excerpts:NxD, base / advanced - флаги set_features_base / set_features_advanced,
+# signature - dct (min-max + DCT 110, как в сервисе) | raw | transform:<path к SignatureTransform>
+DEFAULT_CONFIG = {
+    "resampling": "hq",
+    "sample_rate": None,
+    "hop_length": 512,
+    "n_fft": None,
+    "window": "third",
+    "base": {},
+    "advanced": {},
+    "signature": "dct",
+    "metric": "manhattan",
+}
+
+PRESETS = {
+    "baseline": {},
+    "fast_resample": {"resampling": "fast"},
+    "sr_22050": {"sample_rate": 22050},
+    "hop_1024": {"hop_length": 1024},
+    "excerpts": {"window": "excerpts:3x10"},
+    "full_track": {"window": "full"},
+    "base_only": {"advanced": None},
+    "no_tonnetz": {"advanced": {"use_tonnetz": False}},
+}
+
+RETRIEVAL_KS = (1, 5, 10)
+
+
+def get_corpus(corpus_path: str, labels_path: Optional[str] = None) -> List[dict]:
+    """[{"path", "name" (relative to the corpus), "label"}], sorted so that runs see the same order"""
+    if labels_path is None and os.path.exists(os.path.join(corpus_path, "groups.json")):
+        labels_path = os.path.join(corpus_path, "groups.json")
+    labels = {}
+    if labels_path:
+        with open(labels_path, encoding="utf-8") as f:
+            labels = {name: group for group, names in json.load(f).items() for name in names}
+
+    tracks = []
+    for folder in FOLDERS:
+        folder_path = os.path.join(corpus_path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in sorted(os.listdir(folder_path)):
+            if not file_name.endswith((".mp3", ".wav")):
+                continue
+            name = f"{folder}/{file_name}"
+            label = labels.get(name)
+            if label is None and not labels_path and folder == "identical":
+                label = "identical"
+            tracks.append({"path": os.path.join(folder_path, file_name), "name": name, "label": label})
+    return tracks
+
+
+def load_audio(audio_class, path: str, window: str):
+    audio = audio_class(path, resampling=audio_class.RESAMPLING)
+    if window == "full":
+        audio.load_file()
+    elif window == "third":
+        audio.load_file(audio.get_duration() // 3 + 1)
+    elif window.startswith("excerpts:"):
+        n_excerpts, excerpt_duration = window.split(":", 1)[1].split("x")
+        audio.load_file(excerpts=audio.get_excerpts(audio.get_duration(), int(n_excerpts), float(excerpt_duration)))
+    else:
+        raise ValueError(f"Unknown window {window}")
+    return audio
+
+
+def compute_signature(audio, config: dict, tools, transform) -> np.ndarray:
+    start = time.perf_counter()
+    if config["signature"] == "dct":
+        signature = audio.get_file_signature(normalize=True, normalization_type="min-max")
+        audio.timings["signature"] = time.perf_counter() - start
+        start = time.perf_counter()
+        signature = tools.reduce_with_dct(signature, n_components=110)
+        audio.timings["dct"] = time.perf_counter() - start
+    elif config["signature"] == "raw":
+        signature = audio.get_file_signature()
+        audio.timings["signature"] = time.perf_counter() - start
+    else:
+        signature = transform.apply(audio.get_file_signature())
+        audio.timings["signature"] = time.perf_counter() - start
+    return signature
+
+
+def run_config(name: str, config: dict, tracks: List[dict]) -> dict:
+    """Runs in a separate process: imports, warm-up and peak RSS belong to this configuration only"""
+    from features_extraction.audio_analysis import AudioProcessing, AudioTools, RESAMPLING_POLICIES, warm_up
+    from features_extraction.evaluation import evaluate_retrieval
+    from features_extraction.signature_transform import SignatureTransform
+
+    resampling = config["resampling"]
+    if config["sample_rate"]:
+        resampling = f"sr_{config['sample_rate']}"
+        RESAMPLING_POLICIES[resampling] = {"sr": config["sample_rate"], "res_type": "soxr_hq"}
+    audio_class = type("BenchmarkAudioProcessing", (AudioProcessing,), {
+        "SAMPLE_RATE": config["sample_rate"] or AudioProcessing.SAMPLE_RATE,
+        "HOP_LENGTH": config["hop_length"],
+        "N_FFT": config["n_fft"],
+        "RESAMPLING": resampling,
+    })
+    transform = None
+    if config["signature"].startswith("transform:"):
+        transform = SignatureTransform.load(config["signature"].split(":", 1)[1])
+    tools = AudioTools()
+
+    # JIT numba и импорт подмодулей librosa не должны попасть в замеры
+    warm_up()
+    rss_after_warm_up = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    signatures, labels, stages, errors = [], [], {}, []
+    start = time.perf_counter()
+    for track in tracks:
+        try:
+            audio = load_audio(audio_class, track["path"], config["window"])
+            audio.set_features_base(**config["base"])
+            if config["advanced"] is not None:
+                audio.set_features_advanced(**config["advanced"])
+            signature = compute_signature(audio, config, tools, transform)
+        except Exception as ex:
+            errors.append({"track": track["name"], "error": str(ex)})
+            continue
+        timings = dict(audio.timings)
+        timings["decode"] = timings["load"] - timings.get("resample", 0.0)
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+        signatures.append(signature)
+        labels.append(track["label"])
+    elapsed = time.perf_counter() - start
+
+    retrieval = {}
+    if signatures:
+        retrieval = evaluate_retrieval(np.stack(signatures), labels, ks=RETRIEVAL_KS, metric=config["metric"])
+    return {
+        "name": name,
+        "config": config,
+        "tracks": len(signatures),
+        "errors": errors,
+        "seconds": elapsed,
+        "tracks_per_second": len(signatures) / elapsed if elapsed else 0.0,
+        # ru_maxrss в килобайтах на Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "warm_rss_mb": rss_after_warm_up / 1024,
+        "stages": {
+            stage: {
+                "mean": float(np.mean(values)),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "total": float(np.sum(values)),
+            } for stage, values in sorted(stages.items())
+        },
+        "retrieval": retrieval,
+    }
+
+
+def get_environment() -> dict:
+    import librosa
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "librosa": librosa.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_results(results: List[dict], reference: Optional[dict] = None) -> None:
+    reference = reference or results[0]
+    metrics = [f"recall@{k}" for k in RETRIEVAL_KS] + ["map"]
+    header = f"{'config':<20}{'tracks/s':>10}{'x':>7}{'rss, MB':>9}" + "".join(f"{m:>11}" for m in metrics)
+    print(header)
+    for result in results:
+        speedup = result["tracks_per_second"] / reference["tracks_per_second"] if reference["tracks_per_second"] else 0.0
+        row = f"{result['name']:<20}{result['tracks_per_second']:>10.2f}{speedup:>7.2f}{result['peak_rss_mb']:>9.0f}"
+        row += "".join(f"{result['retrieval'].get(m, 0.0):>11.3f}" for m in metrics)
+        print(row)
+
+    stages = sorted({stage for result in results for stage in result["stages"]})
+    print(f"\n{'mean stage time, ms':<20}" + "".join(f"{result['name'][:12]:>13}" for result in results))
+    for stage in stages:
+        print(f"{stage:<20}" + "".join(
+            f"{result['stages'][stage]['mean'] * 1000:>13.1f}" if stage in result["stages"] else f"{'-':>13}"
+            for result in results
+        ))
+
+
+def compare_runs(paths: List[str]) -> None:
+    """Same configurations of several saved runs side by side, the first run is the reference"""
+    runs = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            runs.append(json.load(f))
+    for name in dict.fromkeys(result["name"] for run in runs for result in run["results"]):
+        found = [(path, next((r for r in run["results"] if r["name"] == name), None)) for path, run in zip(paths, runs)]
+        found = [(path, result) for path, result in found if result is not None]
+        print(f"\n== {name}")
+        print_results([{**result, "name": os.path.basename(path)} for path, result in found], reference=found[0][1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed, memory and retrieval quality of signature configurations")
+    parser.add_argument("corpus", nargs="?", default="tests/computing/test_audios")
+    parser.add_argument("--configs", nargs="+", default=["baseline"], choices=list(PRESETS))
+    parser.add_argument("--config-file", default=None, help='JSON {"name": {"hop_length": 1024, ...}} added to --configs')
+    parser.add_argument("--labels", default=None, help="groups of similar tracks, <corpus>/groups.json by default")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--output", default=None, help="JSON report")
+    parser.add_argument("--compare", nargs="+", default=None, help="compare saved JSON reports instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_runs(args.compare)
+        sys.exit()
+
+    configs: Dict[str, dict] = {name: PRESETS[name] for name in args.configs}
+    if args.config_file:
+        with open(args.config_file, encoding="utf-8") as f:
+            configs.update(json.load(f))
+
+    tracks = get_corpus(args.corpus, args.labels)[:args.limit]
+    if not tracks:
+        raise ValueError(f"No audio files found in {args.corpus}")
+    print(f"{len(tracks)} tracks, {sum(track['label'] is not None for track in tracks)} labelled\n")
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name, overrides in configs.items():
+        config = {**DEFAULT_CONFIG, **overrides}
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_config, (name, config, tracks)))
+
+    print_results(results)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "corpus": os.path.abspath(args.corpus),
+        "environment": get_environment(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
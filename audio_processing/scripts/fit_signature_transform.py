@@ -0,0 +1,75 @@
+import argparse
+import concurrent.futures
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from features_extraction.audio_analysis import AudioProcessing, ensure_warm
+from features_extraction.signature_store import SignatureStore, SignatureStoreWriter
+from features_extraction.signature_transform import SignatureTransform
+
+# similarity_service/audio_processing/
+#
+#   python scripts/fit_signature_transform.py signature_transform.npz --folder tests/computing/test_audios/similar --raw-store raw.sig
+#   python scripts/fit_signature_transform.py signature_transform.npz --raw-store raw.sig --n-components 32
+#   SIGNATURE_TRANSFORM_PATH=signature_transform.npz gunicorn -c gunicorn.conf.py flask_interface.wsgi:app
+#
+
+
+def get_file_paths(folder_path):
+    return [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith((".mp3", ".wav"))]
+
+
+def get_raw_signature(file_path: str) -> np.ndarray:
+    """Same features as the backfill, without normalization and DCT"""
+    audio = AudioProcessing(file_path)
+    audio.load_file()
+    audio.set_features_base()
+    audio.set_features_advanced()
+    return audio.get_file_signature()
+
+
+def extract_raw_signatures(file_paths, output_path: str, workers: int) -> SignatureStore:
+    writer = None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=ensure_warm) as executor:
+        futures = {executor.submit(get_raw_signature, file_path): track_id for track_id, file_path in enumerate(file_paths)}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                signature = future.result()
+            except Exception as ex:
+                print(f"Skipping {file_paths[futures[future]]}: {ex}")
+                continue
+            if writer is None:
+                writer = SignatureStoreWriter(output_path, dim=len(signature))
+            writer.add(futures[future], signature)
+    if writer is None:
+        raise ValueError("No signatures were extracted")
+    return writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the standardisation + PCA transform of signatures on a corpus")
+    parser.add_argument("output")
+    parser.add_argument("--raw-store", required=True, help="SignatureStore of raw signatures, written when --folder is given")
+    parser.add_argument("--folder", default=None, help="audio files to extract the raw signatures from")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--n-components", type=int, default=None)
+    parser.add_argument("--variance-threshold", type=float, default=0.95)
+    parser.add_argument("--no-whiten", action="store_true")
+    args = parser.parse_args()
+
+    if args.folder:
+        store = extract_raw_signatures(get_file_paths(args.folder), args.raw_store, args.workers)
+    else:
+        store = SignatureStore(args.raw_store)
+
+    transform = SignatureTransform.fit(
+        store.vectors, n_components=args.n_components, variance_threshold=args.variance_threshold,
+        whiten=not args.no_whiten, feature_version=AudioProcessing.VERSION,
+    )
+    transform.save(args.output)
+    retained = transform.explained_variance.sum() / np.var((store.vectors - transform.mean) / transform.scale, axis=0, ddof=1).sum()
+    print(f"{transform.version}: {len(store)} signatures, {transform.input_dim} -> {transform.n_components} dims, {retained:.1%} variance retained")
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from audio_processing.features_extraction.audio_analysis import AudioTools
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_audio_tools.py -v
+#
+
+tools = AudioTools()
+
+PAIRWISE = {
+    "cosine": tools.get_cos_similarity,
+    "euclidean": tools.get_euclidean_distance,
+    "manhattan": tools.get_manhattan_distance,
+    "chebyshev": tools.get_chebyshev_distance,
+    "minkowski": tools.get_minkowski_distance,
+    "correlation": tools.get_correlation_distance,
+}
+
+
+@pytest.fixture
+def signatures():
+    return np.random.default_rng(0).random((200, 110)).astype(np.float32)
+
+
+@pytest.mark.parametrize("metric", AudioTools.BATCH_METRICS)
+def test_batch_distances_match_pairwise(signatures, metric):
+    query = signatures[7] + 0.1
+    expected = [PAIRWISE[metric](query.astype(float), row.astype(float)) for row in signatures]
+    np.testing.assert_allclose(tools.get_batch_distances(query, signatures, metric=metric), expected, rtol=1e-4, atol=1e-4)
+
+    matrix = tools.get_batch_distances(signatures[:3], signatures, metric=metric)
+    assert matrix.shape == (3, 200)
+    np.testing.assert_allclose(matrix[1], tools.get_batch_distances(signatures[1], signatures, metric=metric), rtol=1e-4, atol=1e-2)
+
+
+def test_top_k(signatures):
+    indices, distances = tools.get_top_k(signatures[42], signatures, k=5)
+    full = tools.get_batch_distances(signatures[42], signatures)
+    assert indices[0] == 42
+    np.testing.assert_array_equal(indices, np.argsort(full, kind="stable")[:5])
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_top_k_rejects_query_matrix(signatures):
+    with pytest.raises(ValueError):
+        tools.get_top_k(signatures[:2], signatures, k=5)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from audio_processing.features_extraction.evaluation import evaluate_retrieval
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_evaluation.py -v
+#
+
+
+def test_perfect_groups():
+    signatures = np.array([[0.0], [0.1], [5.0], [5.1], [10.0]], dtype=np.float32)
+    result = evaluate_retrieval(signatures, ["a", "a", "b", "b", None], ks=(1, 3))
+    assert result == {"recall@1": 1.0, "recall@3": 1.0, "map": 1.0, "queries": 4}
+
+
+def test_recall_and_average_precision():
+    # Для запроса 0 ранжирование: 1 (a), 3 (distractor), 2 (a)
+    signatures = np.array([[0.0], [1.0], [3.0], [2.0]], dtype=np.float32)
+    result = evaluate_retrieval(signatures, ["a", "a", "a", None], ks=(1, 2))
+    # 0: [1, 3, 2] -> recall@1 1/2, AP (1/1 + 2/3) / 2
+    # 1: [0, 3, 2] -> recall@1 1/2, AP (1/1 + 2/3) / 2
+    # 2: [3, 1, 0] -> recall@1 0, AP (1/2 + 2/3) / 2
+    assert result["queries"] == 3
+    assert result["recall@1"] == pytest.approx(1 / 3)
+    assert result["recall@2"] == pytest.approx(1 / 2)
+    assert result["map"] == pytest.approx(((1 + 2 / 3) + (1 + 2 / 3) + (1 / 2 + 2 / 3)) / 6)
+
+
+def test_no_labelled_pairs():
+    result = evaluate_retrieval(np.eye(3, dtype=np.float32), ["a", None, "b"])
+    assert result["queries"] == 0 and result["map"] == 0.0
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import soundfile
+
+from audio_processing.features_extraction.audio_analysis import AudioProcessing
+from audio_processing.features_extraction.feature_cache import FeatureCache
+from audio_processing.tests.test_feature_engine import make_signal
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_feature_cache.py -v
+#
+
+
+def test_cached_features_give_same_signature(tmp_path):
+    path = str(tmp_path / "track.wav")
+    soundfile.write(path, make_signal(seconds=4), 22050)
+    cache = FeatureCache(str(tmp_path / "cache"))
+
+    audio = AudioProcessing(path)
+    assert not cache.load(audio, duration=3)
+    audio.load_file(duration=3)
+    audio.set_features_base()
+    audio.set_features_advanced()
+    cache.store(audio, duration=3)
+
+    cached = AudioProcessing(path)
+    assert cache.load(cached, duration=3)
+    assert cached.y is None
+    np.testing.assert_allclose(cached.get_file_signature(), audio.get_file_signature(), rtol=1e-6)
+
+    assert not cache.load(AudioProcessing(path), duration=2)
+    assert not cache.load(AudioProcessing(path, resampling="fast"), duration=3)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = FeatureCache(str(tmp_path), max_bytes=3500)
+    features = {"mfcc": np.zeros((20, 10), dtype=np.float32)}
+    for i, key in enumerate(["aa1", "bb2", "cc3"]):
+        cache.put(key, features)
+        os.utime(cache._get_path(key), (i, i))
+
+    assert cache.get("aa1") is not None
+    cache.put("dd4", features)
+
+    assert cache.get("bb2") is None
+    assert cache.get("aa1") is not None
+    assert cache.get("dd4") is not None
+
+
+def test_put_does_not_scan_directory_every_time(tmp_path, monkeypatch):
+    from audio_processing.features_extraction import feature_cache as feature_cache_module
+
+    cache = FeatureCache(str(tmp_path), max_bytes=10 * 1024 ** 2, rescan_interval=50)
+    scans = []
+    walk = feature_cache_module.os.walk
+    monkeypatch.setattr(feature_cache_module.os, "walk", lambda *args: scans.append(args) or walk(*args))
+    features = {"mfcc": np.zeros((20, 10), dtype=np.float32)}
+    for i in range(100):
+        cache.put(f"{i:04x}", features)
+    # Первая запись и каждая rescan_interval-я
+    assert len(scans) == 2
+
+    cache.max_bytes = 20 * 1100
+    for i in range(100, 110):
+        cache.put(f"{i:04x}", features)
+    assert cache._size <= cache.max_bytes
+    assert sum(len(files) for _, _, files in walk(str(tmp_path))) <= 20
+
+
+def test_entry_removed_during_get_is_a_miss(tmp_path, monkeypatch):
+    from audio_processing.features_extraction import feature_cache as feature_cache_module
+
+    cache = FeatureCache(str(tmp_path))
+    cache.put("aa1", {"mfcc": np.zeros((20, 10), dtype=np.float32)})
+    load = np.load
+
+    def load_then_evict(path, *args, **kwargs):
+        # Другой процесс вытесняет запись, пока эта её читает
+        entry = load(path, *args, **kwargs)
+        os.remove(path)
+        return entry
+
+    monkeypatch.setattr(feature_cache_module.np, "load", load_then_evict)
+    assert cache.get("aa1") is None
+
+
+def test_truncated_entry_is_a_miss_and_removed(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    cache.put("aa1", {"mfcc": np.zeros((20, 10), dtype=np.float32)})
+    path = cache._get_path("aa1")
+    with open(path, "rb") as f:
+        data = f.read()
+    for size in (0, len(data) // 2):
+        with open(path, "wb") as f:
+            f.write(data[:size])
+        assert cache.get("aa1") is None
+        assert not os.path.exists(path)
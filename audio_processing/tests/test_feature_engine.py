@@ -0,0 +1,98 @@
+import librosa
+import numpy as np
+import pytest
+
+from audio_processing.features_extraction.audio_analysis import AudioProcessing
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_feature_engine.py -v
+#
+
+SR = 15500
+
+
+def make_signal(seconds=6, seed=0) -> np.ndarray:
+    """Synthetic 'track': two tones, a gated tone and some noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SR * seconds) / SR
+    y = 0.4 * np.sin(2 * np.pi * 220 * t) \
+        + 0.2 * np.sin(2 * np.pi * 330 * t) * (np.sin(2 * np.pi * 2 * t) > 0) \
+        + 0.05 * rng.standard_normal(t.size)
+    return y.astype(np.float32)
+
+
+@pytest.fixture
+def loaded_audio():
+    audio = AudioProcessing("synthetic")
+    audio.y, audio.sr = make_signal(), SR
+    return audio
+
+
+def test_shared_stft_features_match_librosa(loaded_audio):
+    y, sr = loaded_audio.y, loaded_audio.sr
+    loaded_audio.set_features_base(use_chromagram=False, use_tempo=False)
+    loaded_audio.set_features_advanced(use_zcr=False, use_tonnetz=False)
+
+    np.testing.assert_allclose(loaded_audio.mfcc, librosa.feature.mfcc(y=y, sr=sr, hop_length=512), rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(loaded_audio.mel_spectrogram, librosa.feature.melspectrogram(y=y, sr=sr), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(loaded_audio.spectral_centroid, librosa.feature.spectral_centroid(y=y, sr=sr), rtol=1e-5)
+    np.testing.assert_allclose(loaded_audio.spectral_bandwidth, librosa.feature.spectral_bandwidth(y=y, sr=sr), rtol=1e-5)
+
+
+def test_intermediates_are_computed_once(loaded_audio):
+    stft_magnitude = loaded_audio.get_stft_magnitude()
+    loaded_audio.set_features_base(use_chromagram=False)
+    loaded_audio.set_features_advanced(use_zcr=False, use_tonnetz=False)
+    assert loaded_audio.get_stft_magnitude() is stft_magnitude
+    assert loaded_audio.mel_spectrogram is loaded_audio.get_mel_power()
+
+
+def test_hpss_stage_is_shared(loaded_audio):
+    y, sr = loaded_audio.y, loaded_audio.sr
+    loaded_audio.set_features_base()
+    stft_harmonic = loaded_audio.stft_harmonic
+    loaded_audio.set_features_advanced()
+
+    assert loaded_audio.stft_harmonic is stft_harmonic
+    np.testing.assert_allclose(loaded_audio.tonnetz, librosa.feature.tonnetz(chroma=loaded_audio.chromagram, sr=sr))
+
+    # Хромаграмма без istft -> stft отличается от старого пути только на краях кадров
+    y_harmonic, _ = librosa.effects.hpss(y)
+    chroma = librosa.feature.chroma_stft(y=y_harmonic, sr=sr)
+    np.testing.assert_allclose(loaded_audio.chromagram.mean(axis=1), chroma.mean(axis=1), atol=5e-3)
+
+    for stage in ("stft", "hpss", "mel", "onset", "mfcc", "chroma", "tempo", "spectral", "zcr", "tonnetz"):
+        assert stage in loaded_audio.timings
+
+
+def test_warm_up_runs_every_stage():
+    from audio_processing.features_extraction import audio_analysis
+
+    timings = audio_analysis.warm_up(seconds=2)
+    assert {"load", "stft", "hpss", "tempo", "total"} <= set(timings)
+    assert audio_analysis._warmed_up
+
+
+def test_batch_features_match_per_track_path():
+    from audio_processing.features_extraction.audio_analysis import set_features_batch
+
+    # Два трека одной длины (общий HPSS) и два короче, с нулевым дополнением в батче
+    signals = [make_signal(4, seed=0), make_signal(4, seed=1), make_signal(3, seed=2)[:-123], make_signal(2, seed=3)]
+    expected = []
+    for y in signals:
+        audio = AudioProcessing("synthetic")
+        audio.y, audio.sr = y, SR
+        audio.set_features_base()
+        audio.set_features_advanced()
+        expected.append(audio.get_file_signature())
+
+    batch = []
+    for y in signals:
+        audio = AudioProcessing("synthetic")
+        audio.y, audio.sr = y, SR
+        batch.append(audio)
+    set_features_batch(batch)
+
+    for audio, signature in zip(batch, expected):
+        np.testing.assert_allclose(audio.get_file_signature(), signature, rtol=1e-6)
@@ -0,0 +1,48 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from audio_processing.features_extraction import http_session
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_http_session.py -v
+#
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_reuses_connections(server_url):
+    session = http_session.get_session()
+    assert http_session.get_session() is session
+
+    before = http_session.get_pool_stats()
+    for _ in range(5):
+        assert session.get(server_url, proxies={"http": None}).content == b"ok"
+    after = http_session.get_pool_stats()
+
+    assert after["requests"] - before["requests"] == 5
+    assert after["connections"] - before["connections"] == 1
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from audio_processing.flask_interface.jobs import JobManager, write_state
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_jobs.py -v
+#
+
+
+def wait_finished(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_reports_progress_and_result():
+    manager = JobManager(max_workers=1)
+
+    def work(n, job=None):
+        for _ in range(n):
+            job.increment("signatures_computed")
+        return n
+
+    job = wait_finished(manager.submit("set_signatures", work, n=5))
+    state = job.as_dict()
+    assert state["status"] == "succeeded"
+    assert state["result"] == 5
+    assert state["counters"]["signatures_computed"] == 5
+    assert manager.get(job.id) is job
+    manager.shutdown()
+
+
+def test_running_job_is_cancelled():
+    manager = JobManager(max_workers=1)
+    started = threading.Event()
+
+    def work(job=None):
+        started.set()
+        while True:
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    job = manager.submit("install_crawl", work)
+    # Вторая задача ждёт в очереди и отменяется до старта
+    queued = manager.submit("install_crawl", work)
+    started.wait(1)
+    manager.cancel(queued.id)
+    manager.cancel(job.id)
+
+    assert wait_finished(job).status == "cancelled"
+    assert wait_finished(queued).status == "cancelled"
+    assert queued.started_at is None
+    manager.shutdown()
+
+
+def test_failed_job_keeps_error():
+    manager = JobManager(max_workers=1)
+
+    def work(job=None):
+        raise ConnectionError("Unknown error: 500")
+
+    job = wait_finished(manager.submit("install_artist", work))
+    assert job.status == "failed"
+    assert job.error == "Unknown error: 500"
+    manager.shutdown()
+
+
+def test_other_worker_reads_and_cancels_job(tmp_path):
+    # Два менеджера с общим каталогом ведут себя как два воркера gunicorn
+    worker, other = JobManager(max_workers=1, state_dir=str(tmp_path)), JobManager(max_workers=1, state_dir=str(tmp_path))
+    started = threading.Event()
+
+    def work(job=None):
+        started.set()
+        while True:
+            job.increment("tracks_fetched")
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    job = worker.submit("install_crawl", work)
+    started.wait(1)
+    assert other.get_state(job.id)["status"] == "running"
+    assert other.cancel(job.id)["cancel_requested"]
+
+    assert wait_finished(job).status == "cancelled"
+    assert other.get_state(job.id)["status"] == "cancelled"
+    assert other.get_state("missing") is None
+    worker.shutdown()
+    other.shutdown()
+
+
+def test_drain_finishes_running_jobs_and_rejects_new_ones():
+    manager = JobManager(max_workers=1)
+
+    def work(job=None):
+        time.sleep(0.2)
+        return "done"
+
+    job = manager.submit("set_signatures", work)
+    manager.drain(timeout=5)
+    assert job.status == "succeeded"
+    with pytest.raises(RuntimeError):
+        manager.submit("set_signatures", work)
+
+
+def test_drain_timeout_marks_stuck_jobs_failed(tmp_path):
+    manager = JobManager(max_workers=1, state_dir=str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+
+    def work(job=None):
+        # Не проверяет отмену, как задача, застрявшая в вызове
+        started.set()
+        release.wait(5)
+
+    job = manager.submit("set_signatures", work)
+    started.wait(1)
+    start = time.monotonic()
+    manager.drain(timeout=0.2)
+    assert time.monotonic() - start < 2
+    assert JobManager(state_dir=str(tmp_path)).get_state(job.id)["status"] == "failed"
+    release.set()
+
+
+def test_jobs_of_exited_worker_are_marked_failed(tmp_path):
+    import subprocess
+    import sys
+
+    # Воркер, который был убит, не дописав снимки своих задач
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    dead_pid = int(exited.stdout)
+    worker = JobManager(max_workers=1, state_dir=str(tmp_path))
+    release = threading.Event()
+    alive = worker.submit("set_signatures", lambda job=None: release.wait(5))
+    orphan = worker.submit("set_signatures", lambda job=None: None)
+    state = orphan.as_dict()
+    state.update(status="running", pid=dead_pid)
+    write_state(str(tmp_path), state)
+
+    other = JobManager(max_workers=1, state_dir=str(tmp_path))
+    assert other.get_state(orphan.id)["status"] == "failed"
+    assert str(dead_pid) in other.get_state(orphan.id)["error"]
+    assert other.get_state(alive.id)["status"] in ("queued", "running")
+    release.set()
+    worker.shutdown()
+    other.shutdown()
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import soundfile
+
+from audio_processing.features_extraction.audio_analysis import AudioProcessing
+from audio_processing.tests.test_feature_engine import make_signal
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_loading.py -v
+#
+
+
+@pytest.fixture
+def wav_file(tmp_path):
+    path = tmp_path / "track.wav"
+    soundfile.write(path, make_signal(seconds=4), 22050)
+    return str(path)
+
+
+def test_load_bytes_matches_load_file(wav_file):
+    from_file = AudioProcessing(wav_file)
+    from_file.load_file()
+
+    with open(wav_file, "rb") as f:
+        from_memory = AudioProcessing(wav_file)
+        from_memory.load_bytes(f.read())
+
+    assert from_memory.sr == from_file.sr
+    np.testing.assert_array_equal(from_memory.y, from_file.y)
+
+
+def test_load_bytes_rejects_garbage():
+    audio = AudioProcessing("garbage")
+    with pytest.raises(ValueError):
+        audio.load_bytes(b"not an audio file")
+
+
+def test_native_rate_uses_rate_aware_frames(wav_file):
+    audio = AudioProcessing(wav_file, resampling="native")
+    audio.load_file()
+    assert audio.sr == 22050
+    assert audio.hop_length == round(AudioProcessing.HOP_LENGTH * 22050 / AudioProcessing.SAMPLE_RATE)
+
+    audio.set_features_base()
+    audio.set_features_advanced()
+    reference = AudioProcessing(wav_file)
+    reference.load_file()
+    reference.set_features_base()
+    reference.set_features_advanced()
+    assert len(audio.get_file_signature()) == len(reference.get_file_signature())
+
+
+def test_unknown_resampling_policy():
+    with pytest.raises(ValueError):
+        AudioProcessing("track.mp3", resampling="best")
+
+
+def test_excerpts_decode_only_requested_windows(tmp_path):
+    path = str(tmp_path / "track.mp3")
+    signal = make_signal(seconds=40)
+    soundfile.write(path, signal, 22050, format="MP3", bitrate_mode="CONSTANT")
+    audio = AudioProcessing(path)
+    assert audio.get_duration() == pytest.approx(len(signal) / 22050, abs=0.1)
+
+    excerpts = audio.get_excerpts(audio.get_duration(), n_excerpts=3, excerpt_duration=4)
+    assert excerpts[0][0] == 0 and excerpts[-1][0] + 4 == pytest.approx(audio.get_duration())
+    audio.load_file(excerpts=excerpts)
+    assert len(audio.y) == pytest.approx(3 * 4 * AudioProcessing.SAMPLE_RATE, rel=1e-3)
+
+    audio.load_file(offset=10, duration=5)
+    assert len(audio.y) == pytest.approx(5 * AudioProcessing.SAMPLE_RATE, rel=1e-3)
+
+
+def test_mp3_duration_skips_id3_artwork(tmp_path):
+    from mutagen.id3 import APIC, ID3
+
+    path = str(tmp_path / "track.mp3")
+    signal = make_signal(seconds=10)
+    soundfile.write(path, signal, 22050, format="MP3", bitrate_mode="CONSTANT")
+    tags = ID3()
+    # Обложка из байтов, похожих на заголовки кадров MPEG
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="cover", data=(b"\xff\xfb\x10\x00" + bytes(200)) * 2000))
+    tags.save(path)
+    assert AudioProcessing(path).get_duration() == pytest.approx(len(signal) / 22050, abs=0.1)
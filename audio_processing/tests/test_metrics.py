@@ -0,0 +1,91 @@
+import multiprocessing
+import threading
+
+from audio_processing.features_extraction.metrics import Counter, Histogram, Registry, SamplingProfiler
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_metrics.py -v
+#
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    requests = Counter("spotify_retries_total", "Retried requests", ["reason"], registry=registry)
+    latency = Histogram("db_write_seconds", "Batch writes", ["table"], registry=registry, buckets=(0.1, 1.0))
+    Counter("unused_total", "Never incremented", registry=registry)
+
+    requests.inc(reason="rate_limit")
+    requests.inc(2, reason="rate_limit")
+    latency.observe(0.05, table="signatures")
+    latency.observe(0.5, table="signatures")
+    latency.observe(3.0, table="signatures")
+
+    lines = registry.render().splitlines()
+    assert '# TYPE spotify_retries_total counter' in lines
+    assert 'spotify_retries_total{reason="rate_limit"} 3' in lines
+    assert '# TYPE unused_total counter' in lines
+    assert 'db_write_seconds_bucket{table="signatures",le="0.1"} 1' in lines
+    assert 'db_write_seconds_bucket{table="signatures",le="1"} 2' in lines
+    assert 'db_write_seconds_bucket{table="signatures",le="+Inf"} 3' in lines
+    assert 'db_write_seconds_sum{table="signatures"} 3.55' in lines
+    assert 'db_write_seconds_count{table="signatures"} 3' in lines
+
+
+def _pool_task(n):
+    for _ in range(n):
+        _pool_counter.inc(result="ok")
+    return n, _pool_registry.drain()
+
+
+_pool_registry = Registry()
+_pool_counter = Counter("signatures_total", "Processed tracks", ["result"], registry=_pool_registry)
+
+
+def test_pool_metrics_are_merged_in_parent():
+    _pool_counter.inc(result="ok")
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        # Значение родителя до fork не уходит обратно из процессов пула
+        for n, snapshot in pool.map(_pool_task, [2, 3, 4]):
+            _pool_registry.merge(snapshot)
+    assert _pool_counter.values[("ok",)] == 10
+
+
+def _worker(state_dir):
+    registry = Registry(state_dir=state_dir)
+    counter = Counter("signatures_total", "Processed tracks", ["result"], registry=registry)
+    counter.inc(5, result="ok")
+    registry.persist()
+
+
+def test_render_sums_workers_snapshots(tmp_path):
+    registry = Registry(state_dir=str(tmp_path), persist_interval=3600)
+    counter = Counter("signatures_total", "Processed tracks", ["result"], registry=registry)
+    counter.inc(result="ok")
+    process = multiprocessing.get_context("fork").Process(target=_worker, args=(str(tmp_path),))
+    process.start()
+    process.join()
+
+    assert 'signatures_total{result="ok"} 6' in registry.render().splitlines()
+    # Собственные значения процесса не удваиваются его же файлом
+    registry.persist()
+    assert 'signatures_total{result="ok"} 6' in registry.render().splitlines()
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler_sees_busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy_loop, args=(stop,))
+    thread.start()
+    try:
+        collapsed = SamplingProfiler(interval=0.005).profile(0.2)
+    finally:
+        stop.set()
+        thread.join()
+    assert "_busy_loop (test_metrics.py:" in collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and stack
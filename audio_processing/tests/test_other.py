@@ -1,31 +1,16 @@
 import datetime
 import sys
 import os
-from sklearn.decomposition import PCA
 import numpy as np
 from pydub.audio_segment import AudioSegment
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from audio_processing.features_extraction.audio_analysis import AudioProcessing
+from audio_processing.features_extraction.signature_transform import determine_optimal_components
 # from audio_processing.tests.test_similar_tracks import get_signatures
 from audio_processing.tests.conftest import PATH_SIMILAR
 
-def determine_optimal_components(signature_matrix: np.ndarray, variance_threshold: float = 0.95) -> int:
-    """
-    Определяет оптимальное количество компонент PCA, чтобы сохранить заданную долю дисперсии.
-    
-    :param signature_matrix: матрица векторов признаков всех аудиофайлов.
-    :param variance_threshold: доля общей дисперсии, которую нужно сохранить.
-    :return: оптимальное количество компонент.
-    """
-
-    pca = PCA()
-    pca.fit(signature_matrix)
-    cumulative_variance = np.cumsum(pca.explained_variance_ratio_)
-    n_components = np.searchsorted(cumulative_variance, variance_threshold) + 1
-    return n_components
-
 # signatures = get_signatures()
 # signatures_list = list(signatures.values())
 # signature_matrix = np.array(signatures_list).astype('float32')
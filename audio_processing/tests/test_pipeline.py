@@ -0,0 +1,125 @@
+import threading
+import time
+
+from audio_processing.features_extraction.pipeline import Pipeline
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_pipeline.py -v
+#
+
+
+def square(batch):
+    """extract: квадраты, 3 - ошибка, 7 - зависает"""
+    results, failures = [], []
+    for item, data in batch:
+        try:
+            if item == 3:
+                raise ValueError("bad track")
+            if item == 7:
+                time.sleep(30)
+            results.append((item, (data if data is not None else item) ** 2))
+        except Exception as ex:
+            failures.append((item, ex))
+    return results, failures
+
+
+def test_items_flow_through_all_stages():
+    written, failed = [], []
+
+    def download(item):
+        if item == 5:
+            raise ConnectionError("preview is gone")
+        return item
+
+    pipeline = Pipeline(square, written.append, download=download, download_workers=3, extract_workers=2, items_per_task=2,
+                        write_batch_size=4, extract_timeout=1.0, on_failure=lambda item, stage, ex: failed.append((item, stage, type(ex))))
+    stats = pipeline.run(range(10))
+
+    results = sorted(result for batch in written for result in batch)
+    assert results == [(i, i * i) for i in range(10) if i not in (3, 5, 7)]
+    assert all(len(batch) <= 4 for batch in written)
+    assert sorted(failed) == [(3, "extract", ValueError), (5, "download", ConnectionError), (7, "extract", TimeoutError)]
+    assert stats == {"download_ok": 9, "download_failed": 1, "extract_ok": 7, "extract_failed": 2, "write_ok": 7}
+
+
+def test_slow_writer_holds_back_upstream_stages():
+    taken, written = [0], [0]
+
+    def items():
+        for i in range(40):
+            taken[0] += 1
+            yield i
+
+    def write(batch):
+        time.sleep(0.05)
+        written[0] += len(batch)
+        # Всё, что может быть взято сверх записанного: очереди, задачи в полёте, текущие загрузки и батч писателя
+        assert taken[0] - written[0] <= 2 * 2 + 2 * 2 + 2 + 2 + 2
+
+    pipeline = Pipeline(square, write, extract_workers=2, queue_size=2, download_workers=2, write_batch_size=2, write_interval=0.01,
+                        extract_timeout=0.5)
+    stats = pipeline.run(items())
+    assert written[0] == 38 and stats["extract_failed"] == 2
+
+
+def test_cancel_stops_taking_items():
+    cancelled = threading.Event()
+    written = []
+
+    def write(batch):
+        written.extend(batch)
+        cancelled.set()
+
+    pipeline = Pipeline(square, write, extract_workers=1, download_workers=1, write_batch_size=1, is_cancelled=cancelled.is_set)
+    stats = pipeline.run(i for i in range(1000) if i not in (3, 7))
+    assert 0 < stats["write_ok"] < 100
+
+
+def fail_all(batch):
+    raise RuntimeError("decoder crashed")
+
+
+def run_in_thread(pipeline, items, timeout=30.0):
+    outcome = {}
+
+    def target():
+        try:
+            outcome["stats"] = pipeline.run(items)
+        except BaseException as ex:
+            outcome["error"] = ex
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "pipeline hangs"
+    return outcome
+
+
+def test_failing_stages_dont_hang():
+    def write(batch):
+        raise RuntimeError("database is down")
+
+    failed = []
+    pipeline = Pipeline(fail_all, write, extract_workers=1, download_workers=3, queue_size=1,
+                        on_failure=lambda item, stage, ex: failed.append(item))
+    assert run_in_thread(pipeline, range(20))["stats"] == {"download_ok": 20, "extract_failed": 20}
+
+    pipeline = Pipeline(square, write, extract_workers=1, download_workers=3, queue_size=1, write_batch_size=2, extract_timeout=0.5)
+    stats = run_in_thread(pipeline, range(20))["stats"]
+    assert stats["write_failed"] == 18 and "write_ok" not in stats
+
+
+class Abort(BaseException):
+    pass
+
+
+def test_aborted_run_stops_every_stage():
+    def on_failure(item, stage, ex):
+        # BaseException не перехватывается конвейером и прерывает run посреди работы
+        if stage == "extract":
+            raise Abort()
+
+    pipeline = Pipeline(fail_all, lambda batch: None, extract_workers=1, download_workers=4, queue_size=1, on_failure=on_failure)
+    outcome = run_in_thread(pipeline, range(100))
+    assert isinstance(outcome["error"], Abort)
@@ -0,0 +1,77 @@
+import struct
+
+import numpy as np
+import pytest
+
+from audio_processing.features_extraction.audio_analysis import AudioTools
+from audio_processing.features_extraction.signature_store import (
+    SignatureStore, SignatureStoreWriter, from_bytes, from_pgvector_binary, to_bytes, to_pgvector_binary,
+)
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_signature_store.py -v
+#
+
+
+@pytest.fixture
+def signatures():
+    return np.random.default_rng(0).random((50, 110)).astype(np.float32)
+
+
+def test_binary_round_trip(signatures):
+    data = to_bytes(signatures[0])
+    assert len(data) == 110 * 4
+    np.testing.assert_array_equal(from_bytes(data), signatures[0])
+    np.testing.assert_array_equal(AudioTools().deserialize_signature(AudioTools().serialize_signature(signatures[0])), signatures[0])
+
+
+def test_pgvector_binary_layout():
+    data = to_pgvector_binary(np.array([1.0, -2.5], dtype=np.float32))
+    assert data == struct.pack(">hhff", 2, 0, 1.0, -2.5)
+    result = from_pgvector_binary(memoryview(data))
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, [1.0, -2.5])
+
+
+def test_reduce_with_dct_keeps_float32(signatures):
+    reduced = AudioTools().reduce_with_dct(signatures[0], n_components=20)
+    assert reduced.dtype == np.float32 and reduced.shape == (20,)
+    # Матрица сигнатур сокращается построчно тем же вызовом
+    np.testing.assert_array_equal(AudioTools().reduce_with_dct(signatures, n_components=20)[0], reduced)
+
+
+def test_store_lookup_by_track_id(tmp_path, signatures):
+    path = str(tmp_path / "signatures.sig")
+    ids = np.arange(1000, 1050)[::-1]
+    with SignatureStoreWriter(path, dim=110) as writer:
+        writer.add_many(ids[:40], signatures[:40])
+        for track_id, signature in zip(ids[40:], signatures[40:]):
+            writer.add(track_id, signature)
+        # Повторная запись id перекрывает прежнюю
+        writer.add(1049, signatures[10])
+
+    store = SignatureStore(path)
+    assert len(store) == 51 and store.dim == 110
+    assert isinstance(store.vectors, np.memmap)
+    np.testing.assert_array_equal(store.get(1048), signatures[1])
+    np.testing.assert_array_equal(store.get(1049), signatures[10])
+    assert store.get(5) is None and 5 not in store and 1000 in store
+
+    found, matrix = store.get_many([1001, 7, 1002])
+    assert found.tolist() == [1001, 1002]
+    np.testing.assert_array_equal(matrix, signatures[[48, 47]])
+
+
+def test_store_writer_failure_keeps_previous_file(tmp_path, signatures):
+    path = str(tmp_path / "signatures.sig")
+    SignatureStoreWriter(path, dim=110).close()
+    assert len(SignatureStore(path)) == 0
+    assert SignatureStore(path).get(1) is None
+
+    with pytest.raises(ValueError):
+        with SignatureStoreWriter(path, dim=110) as writer:
+            writer.add(1, signatures[0])
+            writer.add(2, signatures[0][:50])
+    assert len(SignatureStore(path)) == 0
+    assert [p.name for p in tmp_path.iterdir()] == ["signatures.sig"]
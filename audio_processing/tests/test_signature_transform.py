@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from audio_processing.features_extraction.signature_transform import SignatureTransform, determine_optimal_components
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_signature_transform.py -v
+#
+
+
+@pytest.fixture
+def raw_signatures():
+    # 8 скрытых факторов в 40 признаках разного масштаба, как темп в BPM рядом со средними MFCC
+    rng = np.random.default_rng(0)
+    latent = rng.normal(size=(500, 8))
+    mixing = rng.normal(size=(8, 40))
+    scales = np.logspace(-2, 3, 40)
+    return ((latent @ mixing + 0.01 * rng.normal(size=(500, 40))) * scales + 100).astype(np.float32)
+
+
+def test_apply_is_standardisation_then_whitened_pca(raw_signatures):
+    transform = SignatureTransform.fit(raw_signatures, n_components=8, feature_version="v 1.3.0")
+    projected = transform.apply(raw_signatures)
+    assert projected.dtype == np.float32 and projected.shape == (500, 8)
+
+    standardized = (raw_signatures - raw_signatures.mean(axis=0)) / raw_signatures.std(axis=0)
+    expected = standardized @ transform.components.T / np.sqrt(transform.explained_variance)
+    np.testing.assert_allclose(projected, expected, atol=1e-3)
+    # После whitening компоненты некоррелированы и с единичной дисперсией
+    np.testing.assert_allclose(np.cov(projected, rowvar=False), np.eye(8), atol=1e-3)
+    np.testing.assert_allclose(transform.apply(raw_signatures[3]), projected[3], atol=1e-5)
+
+
+def test_components_chosen_by_variance(raw_signatures):
+    standardized = (raw_signatures - raw_signatures.mean(axis=0)) / raw_signatures.std(axis=0)
+    assert determine_optimal_components(standardized, variance_threshold=0.99) == 8
+    assert SignatureTransform.fit(raw_signatures, variance_threshold=0.99).n_components == 8
+
+
+def test_matches_sklearn_pca(raw_signatures):
+    decomposition = pytest.importorskip("sklearn.decomposition")
+    standardized = (raw_signatures - raw_signatures.mean(axis=0)) / raw_signatures.std(axis=0)
+    pca = decomposition.PCA(n_components=5).fit(standardized)
+    transform = SignatureTransform.fit(raw_signatures, n_components=5, whiten=False)
+    np.testing.assert_allclose(transform.explained_variance, pca.explained_variance_, rtol=1e-4)
+    np.testing.assert_allclose(np.abs(transform.components), np.abs(pca.components_), atol=1e-4)
+
+
+def test_save_and_load_keep_version(tmp_path, raw_signatures):
+    path = str(tmp_path / "transform.npz")
+    transform = SignatureTransform.fit(raw_signatures, n_components=6, feature_version="v 1.3.0")
+    transform.save(path)
+
+    loaded = SignatureTransform.load(path)
+    assert loaded.version == transform.version and loaded.version.startswith("pca6w-")
+    assert loaded.feature_version == "v 1.3.0"
+    np.testing.assert_array_equal(loaded.apply(raw_signatures), transform.apply(raw_signatures))
+
+    refit = SignatureTransform.fit(raw_signatures[:400], n_components=6)
+    assert refit.version != transform.version
+    with pytest.raises(ValueError):
+        transform.apply(raw_signatures[:, :30])
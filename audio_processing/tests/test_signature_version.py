@@ -0,0 +1,36 @@
+import numpy as np
+
+from audio_processing.features_extraction.audio_analysis import AudioProcessing
+from audio_processing.features_extraction.signature_transform import SignatureTransform
+from audio_processing.features_extraction.signature_version import get_params_hash, get_signature_params, get_signature_version
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_signature_version.py -v
+#
+
+
+def test_version_is_stable_and_fits_column():
+    params = get_signature_params(AudioProcessing("a.mp3").get_extraction_params())
+    same = get_signature_params(AudioProcessing("b.mp3").get_extraction_params())
+    version = get_signature_version(params)
+    assert version == get_signature_version(same)
+    assert version.startswith("1.3.0-dct110-") and len(version) <= 64
+    assert get_params_hash(params) == get_params_hash(same)
+
+
+def test_any_parameter_changes_the_version():
+    base = get_signature_params(AudioProcessing("a.mp3").get_extraction_params())
+    fast = get_signature_params(AudioProcessing("a.mp3", resampling="fast").get_extraction_params())
+    shorter = get_signature_params(AudioProcessing("a.mp3").get_extraction_params(), n_components=64)
+    versions = {get_signature_version(params) for params in (base, fast, shorter)}
+    assert len(versions) == 3
+
+
+def test_transform_version_in_label():
+    rng = np.random.default_rng(0)
+    transform = SignatureTransform.fit(rng.normal(size=(50, 8)), n_components=3, feature_version=AudioProcessing.VERSION)
+    params = get_signature_params(AudioProcessing("a.mp3").get_extraction_params(), transform)
+    assert params["reduction"]["dim"] == 3
+    assert get_signature_version(params).startswith(f"1.3.0-{transform.version}-")
+    assert len(get_signature_version(params)) <= 64
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import numpy as np
+import psycopg2
+import pytest
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_signature_versions_db.py -v
+#
+# Runs against the database of flask_interface/config.py, skipped without it.
+# Creates its own track and version and removes them afterwards.
+#
+
+# Модули сервиса импортируются так же, как в контейнере: от audio_processing/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip("flask_interface.config", reason="needs flask_interface/config.py with DATABASE_CONFIG")
+
+from flask_interface import functions  # noqa: E402
+
+from features_extraction.similarity_index import BruteForceIndex  # noqa: E402
+
+TRACK_ID = 9_000_000_000_000 + os.getpid()
+INACTIVE_VERSION = f"test-inactive-{os.getpid()}"
+
+
+def execute(query, params=()):
+    conn = functions.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if cursor.description else None
+        conn.commit()
+        return rows
+    finally:
+        functions.release_connection(conn)
+
+
+@pytest.fixture
+def inactive_version(monkeypatch):
+    try:
+        rows = execute("""
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'tracks'::regclass AND attname = 'signature'
+        """)
+    except psycopg2.OperationalError as ex:
+        pytest.skip(f"database unavailable: {ex}")
+    # Та же размерность, что у активной версии: несовместимость видна только по версии
+    dim = rows[0][0] if rows[0][0] > 0 else functions.SIGNATURE_DIM
+    execute("INSERT INTO tracks (id, preview_url) VALUES (%s, 'test://inactive')", (TRACK_ID,))
+    execute("INSERT INTO signature_versions (version, dim, is_active) VALUES (%s, %s, FALSE)", (INACTIVE_VERSION, dim))
+    monkeypatch.setattr(functions, "SIGNATURE_VERSION", INACTIVE_VERSION)
+    monkeypatch.setattr(functions, "SIGNATURE_PARAMS_HASH", None)
+    yield dim
+    execute("DELETE FROM tracks WHERE id = %s", (TRACK_ID,))
+    execute("DELETE FROM signature_versions WHERE version = %s", (INACTIVE_VERSION,))
+
+
+def test_inactive_version_write_is_not_searchable(inactive_version, monkeypatch):
+    active_version = functions.get_active_signature_version()
+    active_index = BruteForceIndex.build([1], np.zeros((1, inactive_version), dtype=np.float32))
+    monkeypatch.setattr(functions, "similarity_index", active_index)
+    monkeypatch.setattr(functions, "similarity_index_version", active_version)
+
+    functions.save_signatures_to_db([(TRACK_ID, np.ones(inactive_version, dtype=np.float32))])
+
+    # Сигнатура сохранена, но только среди версий
+    assert execute("SELECT 1 FROM track_signatures WHERE track_id = %s AND version = %s", (TRACK_ID, INACTIVE_VERSION))
+    # Поиск Go идёт по tracks.signature
+    assert execute("SELECT signature, signature_version FROM tracks WHERE id = %s", (TRACK_ID,)) == [(None, None)]
+    # Индекс поиска в памяти и построенный заново
+    assert TRACK_ID not in active_index
+    if active_version is not None:
+        assert TRACK_ID not in functions.build_similarity_index(active_version)
@@ -2,19 +2,20 @@ import concurrent.futures
 import datetime
 import sys
 import os
-import re
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 import concurrent
 import numpy as np
-from typing import List
+from typing import List, Optional
 
 from mutagen.easyid3 import EasyID3
 from mutagen.mp3 import MP3
 
 from audio_processing.tests.conftest import PATH_SIMILAR
 from audio_processing.features_extraction.audio_analysis import AudioProcessing, AudioTools
+from audio_processing.features_extraction.feature_cache import FeatureCache
+from audio_processing.features_extraction.signature_store import SignatureStore, SignatureStoreWriter
 
 audio_tools = AudioTools()
 
@@ -24,7 +25,8 @@ def process_audio_file(file_path: str,
                        normalization_type="z-score", 
                        features_to_use=None,
                        reduce_dimension=False,
-                       n_components=50) -> str:
+                       n_components=50,
+                       cache: Optional[FeatureCache] = None) -> np.ndarray:
     """
     Process a single audio file, extract the features and return the signature.
     
@@ -36,13 +38,11 @@ def process_audio_file(file_path: str,
     :param reduce_dimension: size reduction flag.
     :param abbreviation_method: split method("top_features", "aggregate", "dct").
     :param param_short: Parameters for the flexibility method. Examples: 'top_n': int | 'block_size': int | 'n_components': int
-    :return: formatted signature string.
+    :param cache: feature cache, on a hit the audio is not decoded at all.
+    :return: float32 signature.
     """
     audio = AudioProcessing(file_path)
     duration = audio.get_duration()
-    
-    # Load half of the duration of the audio file
-    audio.load_file(duration // 3 + 1)
 
     if features_to_use is None:
         features_to_use = {
@@ -53,6 +53,13 @@ def process_audio_file(file_path: str,
             "use_tempo": True
         }
 
+    cache_params = {"duration": duration // 3 + 1, "use_advanced": use_advanced, **features_to_use}
+    if cache is not None and cache.load(audio, **cache_params):
+        return get_signature(audio, normalize, normalization_type, reduce_dimension, n_components)
+
+    # Load half of the duration of the audio file
+    audio.load_file(duration // 3 + 1)
+
     audio.set_features_base(
         use_mfcc=features_to_use.get("use_mfcc", True),
         use_chromagram=features_to_use.get("use_chromagram", True),
@@ -68,70 +75,71 @@ def process_audio_file(file_path: str,
             use_tonnetz=features_to_use.get("use_tonnetz", True)
         )
 
+    if cache is not None:
+        cache.store(audio, **cache_params)
+
+    return get_signature(audio, normalize, normalization_type, reduce_dimension, n_components)
+
+
+def get_signature(audio: AudioProcessing, normalize, normalization_type, reduce_dimension, n_components) -> np.ndarray:
     signature = audio.get_file_signature(normalize=normalize, normalization_type=normalization_type)
 
     if reduce_dimension:
         signature = audio_tools.reduce_with_dct(signature, n_components)
 
-    
-    return f"{os.path.basename(file_path)}\t{signature}"
+    return signature
 
 
 
 def write_signatures_to_file(file_paths: List[str], output_file_path: str, 
                              use_advanced=False, normalize=False, normalization_type="z-score", 
                              features_to_use=None,
-                             reduce_dimension=False, n_component=50):
-    """Function to process files and write signatures to a file"""
+                             reduce_dimension=False, n_component=50, cache: Optional[FeatureCache] = None):
+    """
+    Function to process files and write signatures to a SignatureStore file,
+    the track id of a file is its position in file_paths (see get_file_paths)
+    """
     print("Running function write_signatures_to_file")
-    
-    with open(output_file_path, "w") as f:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(
-                    process_audio_file, 
-                    file_path, 
-                    use_advanced, 
-                    normalize, 
-                    normalization_type, 
-                    features_to_use,
-                    reduce_dimension,
-                    n_component,
-                ) for file_path in file_paths
-            ]
-            
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    result = future.result()
-                    f.write(result + "\n")
-                except Exception as exc:
-                    print(f"Error processing file: {exc}")
 
+    writer = None
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = {
+            executor.submit(
+                process_audio_file,
+                file_path,
+                use_advanced,
+                normalize,
+                normalization_type,
+                features_to_use,
+                reduce_dimension,
+                n_component,
+                cache,
+            ): track_id for track_id, file_path in enumerate(file_paths)
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                signature = future.result()
+                if writer is None:
+                    writer = SignatureStoreWriter(output_file_path, dim=len(signature))
+                writer.add(futures[future], signature)
+            except Exception as exc:
+                print(f"Error processing file: {exc}")
 
-def get_file_paths(folder_path):
-    """Get all mp3 file paths from the folder"""
-    return [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(".mp3")]
+    if writer is not None:
+        writer.close()
 
 
-def get_signatures(file_path="signatures.txt"):
-    """Читает сигнатуры из файла"""
-    signatures = {}
-    signature_cleaner = re.compile(r'[^\deE.,\-]')
+def get_file_paths(folder_path):
+    """Get all mp3 file paths from the folder, sorted so that track ids in the signature store are stable"""
+    return sorted(os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(".mp3"))
 
-    with open(file_path, "r", encoding="utf-8") as file:
-        for line in file:
-            line = line.strip().split(maxsplit=1)
-            if len(line) > 1:
-                track_name = line[0]
-                cleaned_signature = signature_cleaner.sub('', line[1])
-                try:
-                    signature_values = [float(value) for value in cleaned_signature.split(',') if value]
-                    signatures[track_name] = signature_values
-                except ValueError as e:
-                    print(f"Skipping line due to error convert: {line}")
-                    print(f"Error: {e}")
 
-    return signatures
+def get_signatures(file_path="signatures.sig", folder_path=PATH_SIMILAR):
+    """Читает сигнатуры из файла, имя трека находится по его id в get_file_paths(folder_path)"""
+    store = SignatureStore(file_path)
+    file_paths = get_file_paths(folder_path)
+    return {os.path.basename(file_paths[track_id]): signature for track_id, signature in store.items()}
 
 
 def calculate_distances(signatures, reference_track_name=None):
@@ -145,18 +153,16 @@ def calculate_distances(signatures, reference_track_name=None):
     if reference_track_name not in signatures:
         raise ValueError(f"Трек {reference_track_name} не найден в сигнатурах.")
     
-    reference_signature = np.array(signatures[reference_track_name])
-    
-    dist_info = {}
-    for track_name, signature_values in signatures.items():
-        if track_name == reference_track_name:
-            continue
-        audio_tool = AudioTools()
-        # get_cos_similarity | get_manhattan_distance
-        dist = audio_tool.get_manhattan_distance(reference_signature, np.array(signature_values))
-        dist_info[track_name] = dist
-    
-    return dist_info
+    other_track_names = [track_name for track_name in track_names if track_name != reference_track_name]
+    if not other_track_names:
+        return {}
+
+    reference_signature = signatures[reference_track_name]
+    signature_matrix = np.stack([signatures[track_name] for track_name in other_track_names])
+
+    # cosine | manhattan | euclidean ...
+    distances = audio_tools.get_batch_distances(reference_signature, signature_matrix, metric="manhattan")
+    return dict(zip(other_track_names, distances.tolist()))
 
 
 def get_track_title(file_path):
@@ -172,23 +178,24 @@ def get_track_title(file_path):
         return {'title': 'Unknown', 'artist': 'Unknown'}
 
 
-def print_sorted_alg_results(output_file_path="signatures.txt", reference_track_name=None):
+def print_sorted_alg_results(output_file_path="signatures.sig", reference_track_name=None, folder_path=PATH_SIMILAR):
     """Выводит отсортированные результаты алгоритма"""
-    signatures = get_signatures(output_file_path)
+    signatures = get_signatures(output_file_path, folder_path)
     dist_info = calculate_distances(signatures, reference_track_name)
     
     sorted_dist_info = dict(sorted(dist_info.items(), key=lambda item: item[1]))
     
     for track_name, dist in sorted_dist_info.items():
-        track_normal_name = get_track_title(os.path.join(PATH_SIMILAR, track_name))
+        track_normal_name = get_track_title(os.path.join(folder_path, track_name))
         print(f"{track_name}: {track_normal_name['title']}\nDistance: {dist}\n")
 
 
 def start_tests(output_file_path: str, with_load: bool, folder_path: str,
                 use_advanced=False, normalize=False, normalization_type="z-score", features_to_use=None,
-                reduce_dimension=False, reference_track_name=None, n_components=50):
+                reduce_dimension=False, reference_track_name=None, n_components=50, feature_cache_dir=None):
     """Основная функция для запуска тестов"""
-    
+    cache = FeatureCache(feature_cache_dir) if feature_cache_dir else None
+
     if with_load:
         if not output_file_path:
             raise ValueError("The specified output file path is empty")
@@ -203,13 +210,14 @@ def start_tests(output_file_path: str, with_load: bool, folder_path: str,
             normalization_type=normalization_type, 
             features_to_use=features_to_use,
             reduce_dimension=reduce_dimension,
-            n_component=n_components
+            n_component=n_components,
+            cache=cache
         )
     else:
         print(f"Signatures loaded from {output_file_path}")
     
     print("Starting distance calculation and printing results...\n")
-    print_sorted_alg_results(output_file_path, reference_track_name)
+    print_sorted_alg_results(output_file_path, reference_track_name, folder_path)
 
 
 def run_multiple_tests():
@@ -219,7 +227,7 @@ def run_multiple_tests():
     """
 
     folder_path = PATH_SIMILAR
-    output_file_path = "signatures.txt"
+    output_file_path = "signatures.sig"
 
     print("Running test: Custom feature selection...")
     custom_features = {
@@ -261,6 +269,7 @@ def run_multiple_tests():
         reduce_dimension=True,
         n_components=110,
         reference_track_name=reference_track_name,
+        feature_cache_dir="feature_cache",
     )
     
 
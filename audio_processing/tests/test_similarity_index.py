@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from audio_processing.features_extraction.similarity_index import BaseSimilarityIndex, BruteForceIndex, HNSWIndex, IVFIndex
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_similarity_index.py -v
+#
+
+
+@pytest.fixture(scope="module")
+def clustered_signatures():
+    rng = np.random.default_rng(0)
+    centers = rng.random((20, 110))
+    vectors = centers[rng.integers(0, 20, 3000)] + 0.05 * rng.standard_normal((3000, 110))
+    return np.arange(3000) + 100, vectors.astype(np.float32)
+
+
+def get_recall(index, reference, vectors, k=10, n_queries=30):
+    hits = 0
+    for query in vectors[:n_queries] + 0.01:
+        hits += len(set(index.search(query, k)[0]) & set(reference.search(query, k)[0]))
+    return hits / (k * n_queries)
+
+
+@pytest.mark.parametrize("index_type, params, min_recall", [
+    (IVFIndex, {"n_lists": 20, "n_probe": 4}, 0.95),
+    (HNSWIndex, {"m": 8, "ef_construction": 50}, 0.8),
+])
+def test_approximate_index_recall(clustered_signatures, index_type, params, min_recall):
+    ids, vectors = clustered_signatures
+    reference = BruteForceIndex.build(ids, vectors)
+    index = index_type.build(ids, vectors, **params)
+    assert get_recall(index, reference, vectors) >= min_recall
+
+
+@pytest.mark.parametrize("index_type", [BruteForceIndex, IVFIndex, HNSWIndex])
+def test_save_load_and_incremental_insert(tmp_path, clustered_signatures, index_type):
+    ids, vectors = clustered_signatures
+    index = index_type.build(ids[:1000], vectors[:1000])
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = BaseSimilarityIndex.load(path)
+    assert type(loaded) is index_type and len(loaded) == 1000
+    np.testing.assert_array_equal(loaded.search(vectors[5], 5)[0], index.search(vectors[5], 5)[0])
+
+    loaded.add(ids[1000:1001], vectors[1000:1001])
+    assert loaded.search(vectors[1000], 1)[0][0] == ids[1000]
+
+    # Новая сигнатура трека заменяет старую
+    loaded.add(ids[:1], vectors[2000:2001])
+    assert len(loaded) == 1001
+    assert ids[0] in loaded.search(vectors[2000], 3)[0]
+    assert ids[0] not in loaded.search_by_id(ids[0], 10)[0]
+
+
+def test_other_metric_is_exact(clustered_signatures):
+    ids, vectors = clustered_signatures
+    index = IVFIndex.build(ids, vectors, n_lists=20, n_probe=1)
+    reference = BruteForceIndex.build(ids, vectors, metric="cosine")
+    np.testing.assert_array_equal(index.search(vectors[3], 10, metric="cosine")[0], reference.search(vectors[3], 10)[0])
+
+
+@pytest.mark.parametrize("metric", ["manhattan", "euclidean", "cosine"])
+def test_ivf_trained_with_index_metric(clustered_signatures, metric):
+    ids, vectors = clustered_signatures
+    reference = BruteForceIndex.build(ids, vectors, metric=metric)
+    index = IVFIndex.build(ids, vectors, metric=metric, n_lists=20, n_probe=4)
+    assert get_recall(index, reference, vectors) >= 0.95
+
+
+def test_ivf_retrains_as_catalogue_grows(tmp_path):
+    rng = np.random.default_rng(1)
+    centers = rng.random((40, 110))
+    vectors = (centers[rng.integers(0, 40, 5000)] + 0.05 * rng.standard_normal((5000, 110))).astype(np.float32)
+    ids = np.arange(5000)
+
+    index = IVFIndex.build(ids[:2000], vectors[:2000], n_probe=4)
+    assert index.trained_size == 2000 and len(index.centroids) == 45
+
+    # Меньше retrain_factor - только распределение по старым ячейкам
+    index.add(ids[2000:3500], vectors[2000:3500])
+    assert index.trained_size == 2000
+    index.add(ids[3500:], vectors[3500:])
+    assert index.trained_size == 5000 and len(index.centroids) == 71
+    assert sum(len(index._get_list(cell)) for cell in range(len(index.centroids))) == 5000
+
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    assert BaseSimilarityIndex.load(path).trained_size == 5000
+    reference = BruteForceIndex.build(ids, vectors)
+    assert get_recall(index, reference, vectors[2000:]) >= 0.9
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from audio_processing.features_extraction import api_interface, token_cache
+from audio_processing.features_extraction.api_interface import RateLimiter, SpotifyApiInterface
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_spotify_api.py -v
+#
+
+
+class _Response:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self.payload
+
+
+class _Session:
+    """Answers like the Web API batch endpoints and records every call"""
+
+    def __init__(self, rate_limited=0):
+        self.calls = []
+        self.rate_limited = rate_limited
+
+    def request(self, method, url, headers=None, params=None, proxies=None):
+        self.calls.append((url, params))
+        if self.rate_limited:
+            self.rate_limited -= 1
+            return _Response(429, headers={"Retry-After": "0"})
+        ids = params["ids"].split(",")
+        if url.endswith("/v1/albums"):
+            return _Response(200, {"albums": [
+                {"tracks": {"items": [_track(f"{album_id}-{i}") for i in range(10)], "next": None}}
+                for album_id in ids
+            ]})
+        return _Response(200, {"tracks": [_track(track_id) for track_id in ids]})
+
+
+def _track(track_id):
+    return {"artists": [{"name": "artist"}], "name": track_id, "preview_url": f"https://p.scdn.co/{track_id}"}
+
+
+@pytest.fixture
+def interface(monkeypatch):
+    monkeypatch.setenv("CLIENT_ID", "id")
+    monkeypatch.setenv("CLIENT_SECRET", "secret")
+    monkeypatch.setattr(api_interface, "rate_limiter", RateLimiter(rate=1000))
+    monkeypatch.setattr(token_cache, "_token_caches", {})
+    monkeypatch.setattr(api_interface.BaseSpotifyApiInterface, "_fetch_token", lambda self: ("Bearer token", 3600))
+    interface = SpotifyApiInterface()
+    interface.proxies = {}
+    return interface
+
+
+def test_tracks_are_fetched_in_batches(interface, monkeypatch):
+    session = _Session()
+    monkeypatch.setattr(api_interface, "get_session", lambda: session)
+
+    hrefs = [f"https://api.spotify.com/v1/tracks/{i}" for i in range(120)]
+    tracks = interface.get_preview_tracks_by_hrefs(hrefs)
+
+    assert [track["name"] for track in tracks] == [str(i) for i in range(120)]
+    assert len(session.calls) == 3
+
+
+def test_album_tracks_come_from_album_payloads(interface, monkeypatch):
+    session = _Session(rate_limited=1)
+    monkeypatch.setattr(api_interface, "get_session", lambda: session)
+
+    retries = api_interface.SPOTIFY_RETRIES.values.get(("rate_limit",), 0)
+    albums = [f"https://api.spotify.com/v1/albums/a{i}" for i in range(25)]
+    tracks = interface.get_preview_tracks_by_albums(albums)
+
+    assert len(tracks) == 250
+    # 429 повторяется, затем две пачки по 20 и 5 альбомов
+    assert len(session.calls) == 3
+    assert api_interface.SPOTIFY_RETRIES.values[("rate_limit",)] == retries + 1
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+    limiter.pause(0.1)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from audio_processing.features_extraction import api_interface, token_cache
+from audio_processing.features_extraction.api_interface import RateLimiter
+from audio_processing.features_extraction.spotify_crawler import crawl_to
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_spotify_crawler.py -v
+#
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def _track(track_id):
+    return {"artists": [{"name": "artist"}], "name": track_id, "preview_url": f"https://p.scdn.co/{track_id}"}
+
+
+class _Session:
+    """Artist with 70 albums over two pages, every album has 60 tracks over two pages"""
+
+    def __init__(self):
+        self.calls = []
+
+    def request(self, method, url, headers=None, params=None, proxies=None):
+        self.calls.append(url)
+        if url.endswith("/albums") and "/artists/" in url:
+            return _Response({"items": [{"id": f"a{i}"} for i in range(50)], "next": url + "?offset=50"})
+        if "/artists/" in url:
+            return _Response({"items": [{"id": f"a{i}"} for i in range(50, 70)], "next": None})
+        if "/search" in url:
+            return _Response({"albums": {"items": [{"id": "a0"}, {"id": "label"}], "next": None}})
+        if url.endswith("/v1/albums"):
+            return _Response({"albums": [
+                {"tracks": {"items": [_track(f"{album_id}-{i}") for i in range(50)], "next": f"{url}/{album_id}/tracks?offset=50"}}
+                for album_id in params["ids"].split(",")
+            ]})
+        album_id = url.rsplit("/", 2)[1]
+        return _Response({"items": [_track(f"{album_id}-{i}") for i in range(50, 60)], "next": None})
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setenv("CLIENT_ID", "id")
+    monkeypatch.setenv("CLIENT_SECRET", "secret")
+    monkeypatch.setattr(api_interface, "rate_limiter", RateLimiter(rate=10000))
+    monkeypatch.setattr(token_cache, "_token_caches", {})
+    monkeypatch.setattr(api_interface.BaseSpotifyApiInterface, "_fetch_token", lambda self: ("Bearer token", 3600))
+    monkeypatch.setattr(api_interface.BaseSpotifyApiInterface, "_prepare_request", lambda self: None)
+    session = _Session()
+    monkeypatch.setattr(api_interface, "get_session", lambda: session)
+    return session
+
+
+def test_crawl_follows_pages_and_streams_batches(session):
+    saved = []
+    total = asyncio.run(crawl_to(saved.append, artist_ids=["artist"], labels=["label"], concurrency=4, batch_size=600))
+
+    tracks = [track["name"] for batch in saved for track in batch]
+    assert total == len(tracks) == 71 * 60
+    assert len(set(tracks)) == len(tracks)
+    # Сохранение идёт пачками по ходу обхода, а не одним списком в конце
+    assert len(saved) > 1
+    # 2 страницы альбомов артиста, 1 поиск, 4 + 1 запроса /albums?ids=, 71 вторая страница треков
+    assert len(session.calls) == 2 + 1 + 5 + 71
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from audio_processing.features_extraction.token_cache import FileTokenBackend, TokenCache
+
+# similarity_service/
+#
+#   pytest audio_processing/tests/test_token_cache.py -v
+#
+
+
+class _Fetcher:
+    def __init__(self, expires_in=3600, delay=0.0):
+        self.calls = 0
+        self.expires_in = expires_in
+        self.delay = delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return f"Bearer {self.calls}", self.expires_in
+
+
+def test_concurrent_callers_share_one_token():
+    fetch = _Fetcher(delay=0.05)
+    cache = TokenCache("client", fetch)
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(cache.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetch.calls == 1
+    assert set(tokens) == {"Bearer 1"}
+
+
+def test_token_is_refreshed_in_background_before_expiry():
+    fetch = _Fetcher(expires_in=10, delay=0.05)
+    cache = TokenCache("client", fetch, refresh_margin=60)
+    assert cache.get() == "Bearer 1"
+
+    # Токен близок к истечению: возвращается текущий, новый запрашивается в фоне
+    start = time.monotonic()
+    assert cache.get() == "Bearer 1"
+    assert time.monotonic() - start < 0.05
+    time.sleep(0.2)
+    assert cache.get() in ("Bearer 2", "Bearer 3")
+
+
+def test_rejected_token_is_replaced_once():
+    fetch = _Fetcher()
+    cache = TokenCache("client", fetch)
+    rejected = cache.get()
+    cache.invalidate(rejected)
+    assert cache.get() == "Bearer 2"
+    # Повторный 401 со старым токеном не сбрасывает уже новый
+    cache.invalidate(rejected)
+    assert cache.get() == "Bearer 2"
+    assert fetch.calls == 2
+
+
+def test_file_backend_shares_token_between_caches(tmp_path):
+    backend = FileTokenBackend(str(tmp_path / "token.json"))
+    fetch = _Fetcher()
+    TokenCache("client", fetch, backend=backend).get()
+
+    other = TokenCache("client", _Fetcher(), backend=backend)
+    assert other.get() == "Bearer 1"
+    assert fetch.calls == 1
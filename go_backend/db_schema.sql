@@ -86,12 +86,62 @@ CREATE TABLE public.tracks (
     title character varying(64),
     preview_url text NOT NULL,
     signature public.vector(110),
-    artists character varying(64)
+    artists character varying(64),
+    signature_claimed_at timestamp with time zone,
+    signature_version character varying(64),
+    signature_params_hash character varying(40)
 );
 
 
 ALTER TABLE public.tracks OWNER TO postgres;
 
+--
+-- Name: signature_failures; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.signature_failures (
+    track_id bigint NOT NULL,
+    version character varying(64) NOT NULL,
+    attempts integer DEFAULT 1 NOT NULL,
+    stage character varying(16) NOT NULL,
+    error text,
+    failed_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.signature_failures OWNER TO postgres;
+
+--
+-- Name: signature_versions; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.signature_versions (
+    version character varying(64) NOT NULL,
+    params_hash character varying(40),
+    params jsonb,
+    dim integer NOT NULL,
+    is_active boolean DEFAULT false NOT NULL,
+    created_at timestamp with time zone DEFAULT now() NOT NULL,
+    activated_at timestamp with time zone
+);
+
+
+ALTER TABLE public.signature_versions OWNER TO postgres;
+
+--
+-- Name: track_signatures; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.track_signatures (
+    track_id bigint NOT NULL,
+    version character varying(64) NOT NULL,
+    signature public.vector NOT NULL,
+    computed_at timestamp with time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.track_signatures OWNER TO postgres;
+
 --
 -- Name: tracks_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
 --
@@ -172,6 +222,30 @@ ALTER TABLE ONLY public.schema_migrations
     ADD CONSTRAINT schema_migrations_pkey PRIMARY KEY (version);
 
 
+--
+-- Name: signature_failures signature_failures_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.signature_failures
+    ADD CONSTRAINT signature_failures_pkey PRIMARY KEY (track_id, version);
+
+
+--
+-- Name: signature_versions signature_versions_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.signature_versions
+    ADD CONSTRAINT signature_versions_pkey PRIMARY KEY (version);
+
+
+--
+-- Name: track_signatures track_signatures_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.track_signatures
+    ADD CONSTRAINT track_signatures_pkey PRIMARY KEY (track_id, version);
+
+
 --
 -- Name: tracks tracks_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
 --
@@ -212,6 +286,20 @@ ALTER TABLE ONLY public.users
     ADD CONSTRAINT users_username_key UNIQUE (username);
 
 
+--
+-- Name: idx_signature_versions_active; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE UNIQUE INDEX idx_signature_versions_active ON public.signature_versions USING btree ((true)) WHERE is_active;
+
+
+--
+-- Name: idx_track_signatures_version; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_track_signatures_version ON public.track_signatures USING btree (version, track_id);
+
+
 --
 -- Name: idx_tracks_signature_ivfflat; Type: INDEX; Schema: public; Owner: postgres
 --
@@ -219,6 +307,45 @@ ALTER TABLE ONLY public.users
 CREATE INDEX idx_tracks_signature_ivfflat ON public.tracks USING ivfflat (signature) WITH (lists='100');
 
 
+--
+-- Name: idx_tracks_without_signature; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX idx_tracks_without_signature ON public.tracks USING btree (id) WHERE (signature IS NULL);
+
+
+--
+-- Name: signature_failures signature_failures_track_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.signature_failures
+    ADD CONSTRAINT signature_failures_track_id_fkey FOREIGN KEY (track_id) REFERENCES public.tracks(id) ON DELETE CASCADE;
+
+
+--
+-- Name: signature_failures signature_failures_version_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.signature_failures
+    ADD CONSTRAINT signature_failures_version_fkey FOREIGN KEY (version) REFERENCES public.signature_versions(version) ON DELETE CASCADE;
+
+
+--
+-- Name: track_signatures track_signatures_track_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.track_signatures
+    ADD CONSTRAINT track_signatures_track_id_fkey FOREIGN KEY (track_id) REFERENCES public.tracks(id) ON DELETE CASCADE;
+
+
+--
+-- Name: track_signatures track_signatures_version_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.track_signatures
+    ADD CONSTRAINT track_signatures_version_fkey FOREIGN KEY (version) REFERENCES public.signature_versions(version) ON DELETE CASCADE;
+
+
 --
 -- PostgreSQL database dump complete
 --
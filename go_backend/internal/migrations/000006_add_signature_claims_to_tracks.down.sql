@@ -0,0 +1,4 @@
+DROP INDEX IF EXISTS idx_tracks_without_signature;
+
+ALTER TABLE tracks
+DROP COLUMN IF EXISTS signature_claimed_at;
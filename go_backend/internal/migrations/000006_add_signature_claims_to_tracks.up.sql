@@ -0,0 +1,4 @@
+ALTER TABLE tracks
+ADD COLUMN IF NOT EXISTS signature_claimed_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_tracks_without_signature ON tracks (id) WHERE signature IS NULL;
@@ -0,0 +1,7 @@
+DROP TABLE IF EXISTS track_signatures;
+
+DROP TABLE IF EXISTS signature_versions;
+
+ALTER TABLE tracks
+DROP COLUMN IF EXISTS signature_params_hash,
+DROP COLUMN IF EXISTS signature_version;
@@ -0,0 +1,40 @@
+CREATE TABLE IF NOT EXISTS signature_versions (
+    version VARCHAR(64) PRIMARY KEY,
+    params_hash VARCHAR(40),
+    params JSONB,
+    dim INTEGER NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    activated_at TIMESTAMP WITH TIME ZONE
+);
+
+-- tracks.signature holds the vectors of the only active version
+CREATE UNIQUE INDEX IF NOT EXISTS idx_signature_versions_active ON signature_versions ((TRUE)) WHERE is_active;
+
+-- Every computed version side by side, dimensions may differ between versions
+CREATE TABLE IF NOT EXISTS track_signatures (
+    track_id BIGINT NOT NULL REFERENCES tracks (id) ON DELETE CASCADE,
+    version VARCHAR(64) NOT NULL REFERENCES signature_versions (version) ON DELETE CASCADE,
+    signature VECTOR NOT NULL,
+    computed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (track_id, version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_track_signatures_version ON track_signatures (version, track_id);
+
+ALTER TABLE tracks
+    ADD COLUMN IF NOT EXISTS signature_version VARCHAR(64),
+    ADD COLUMN IF NOT EXISTS signature_params_hash VARCHAR(40);
+
+-- Signatures computed before versioning: parameters unknown, kept as the active "legacy" version
+INSERT INTO signature_versions (version, dim, is_active, activated_at)
+SELECT 'legacy', 110, TRUE, now()
+WHERE EXISTS (SELECT 1 FROM tracks WHERE signature IS NOT NULL)
+ON CONFLICT (version) DO NOTHING;
+
+UPDATE tracks SET signature_version = 'legacy'
+WHERE signature IS NOT NULL AND signature_version IS NULL;
+
+INSERT INTO track_signatures (track_id, version, signature)
+SELECT id, 'legacy', signature FROM tracks WHERE signature IS NOT NULL
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,11 @@
+-- Dead letters of the signature backfill: a track that failed SIGNATURE_MAX_ATTEMPTS times
+-- for a version is no longer claimed for it
+CREATE TABLE IF NOT EXISTS signature_failures (
+    track_id BIGINT NOT NULL REFERENCES tracks (id) ON DELETE CASCADE,
+    version VARCHAR(64) NOT NULL REFERENCES signature_versions (version) ON DELETE CASCADE,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    stage VARCHAR(16) NOT NULL,
+    error TEXT,
+    failed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (track_id, version)
+);
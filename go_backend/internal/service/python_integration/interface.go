@@ -4,6 +4,7 @@ import (
 	"encoding/json"
 	"fmt"
 	"log"
+	"time"
 
 	a "github.com/hibiken/asynq"
 	"github.com/ilyaDyb/similarity_service/config/asynq"
@@ -38,7 +39,8 @@ func InstallTracksByAlbum(artistId string) error {
 }
 
 func SetSignatures() error {
-	task := a.NewTask("python:set_signatures", []byte{})
+	// The handler waits for the background backfill, which outlasts the default asynq timeout
+	task := a.NewTask("python:set_signatures", []byte{}, a.Timeout(12*time.Hour))
 	_, err := asynq.Client.Enqueue(task)
 	if err != nil {
 		return fmt.Errorf("failed to enqueue task: %s", err.Error())
@@ -14,6 +14,15 @@ import (
 	"github.com/hibiken/asynq"
 )
 
+const jobPollInterval = 5 * time.Second
+
+type pythonJob struct {
+	JobId    string         `json:"job_id"`
+	Status   string         `json:"status"`
+	Error    string         `json:"error"`
+	Counters map[string]int `json:"counters"`
+}
+
 type PythonService struct {
 	apiBaseUrl string
 	client     *http.Client
@@ -62,11 +71,16 @@ func (s *PythonService) InstallTracksByArtistHandler(ctx context.Context, task *
 	}
 	defer resp.Body.Close()
 	
-	if resp.StatusCode != http.StatusOK {
+	if resp.StatusCode != http.StatusOK && resp.StatusCode != http.StatusAccepted {
 		log.Printf("Error: received non-OK status code %d from Python API\n", resp.StatusCode)
 		return fmt.Errorf("API responded with status code %d", resp.StatusCode)
 	}
 
+	if err := s.waitForJob(ctx, resp); err != nil {
+		log.Println(err.Error())
+		return err
+	}
+
 	log.Println("Successfully installed tracks for album:", input.ArtistId)
 	return nil
 }
@@ -108,24 +122,34 @@ func (s *PythonService) InstallTracksByAlbumHandler(ctx context.Context, task *a
 	}
 	defer resp.Body.Close()
 	
-	if resp.StatusCode != http.StatusOK {
+	if resp.StatusCode != http.StatusOK && resp.StatusCode != http.StatusAccepted {
 		log.Printf("Error: received non-OK status code %d from Python API\n", resp.StatusCode)
 		return fmt.Errorf("API responded with status code %d", resp.StatusCode)
 	}
 
+	if err := s.waitForJob(ctx, resp); err != nil {
+		log.Println(err.Error())
+		return err
+	}
+
 	log.Println("Successfully installed tracks for album:", input.AlbumId)
 	return nil
 }
 
 func (s *PythonService) SetSignatures(ctx context.Context, task *asynq.Task) error {
-	resp, err := http.Post(fmt.Sprintf("%s/signatures/set", s.apiBaseUrl), "application/json", bytes.NewBuffer([]byte{}))
+	resp, err := s.client.Post(fmt.Sprintf("%s/signatures/set", s.apiBaseUrl), "application/json", bytes.NewBuffer([]byte{}))
 	if err != nil {
 		return err
 	}
 	defer resp.Body.Close()
 
-	if resp.StatusCode != http.StatusOK {
+	if resp.StatusCode != http.StatusOK && resp.StatusCode != http.StatusAccepted {
 		log.Printf("error: received non-OK status code %d from Python API\n", resp.StatusCode)
+		return fmt.Errorf("API responded with status code %d", resp.StatusCode)
+	}
+
+	if err := s.waitForJob(ctx, resp); err != nil {
+		log.Println(err.Error())
 		return err
 	}
 
@@ -144,4 +168,61 @@ func (s *PythonService) TestRequest(ctx context.Context, task *asynq.Task) error
 	}
 	log.Println(string(body))
 	return nil
-}
\ No newline at end of file
+}
+
+// waitForJob polls /jobs/<id> of a 202 response until the background job ends,
+// so the task keeps its result without holding the request open.
+func (s *PythonService) waitForJob(ctx context.Context, resp *http.Response) error {
+	if resp.StatusCode != http.StatusAccepted {
+		return nil
+	}
+	var job pythonJob
+	if err := json.NewDecoder(resp.Body).Decode(&job); err != nil {
+		return fmt.Errorf("failed to decode job: %s", err.Error())
+	}
+
+	ticker := time.NewTicker(jobPollInterval)
+	defer ticker.Stop()
+	for {
+		select {
+		case <-ctx.Done():
+			return ctx.Err()
+		case <-ticker.C:
+		}
+
+		req, err := http.NewRequestWithContext(ctx, "GET", fmt.Sprintf("%s/jobs/%s", s.apiBaseUrl, job.JobId), nil)
+		if err != nil {
+			return fmt.Errorf("failed to create request: %s", err.Error())
+		}
+		jobResp, err := s.client.Do(req)
+		if err != nil {
+			log.Println("Failed to poll job:", err.Error())
+			continue
+		}
+		// A 404 means the job is gone (pruned, or a worker restart without JOBS_DIR): it will never finish
+		if jobResp.StatusCode != http.StatusOK {
+			jobResp.Body.Close()
+			return fmt.Errorf("job %s: polling responded with status code %d", job.JobId, jobResp.StatusCode)
+		}
+		// A fresh value, so a response without a status doesn't keep the previous one
+		var state pythonJob
+		err = json.NewDecoder(jobResp.Body).Decode(&state)
+		jobResp.Body.Close()
+		if err != nil {
+			return fmt.Errorf("failed to decode job: %s", err.Error())
+		}
+
+		switch state.Status {
+		case "queued", "running":
+		case "succeeded":
+			log.Printf("Job %s finished: %v\n", job.JobId, state.Counters)
+			return nil
+		case "failed":
+			return fmt.Errorf("job %s failed: %s", job.JobId, state.Error)
+		case "cancelled":
+			return fmt.Errorf("job %s cancelled", job.JobId)
+		default:
+			return fmt.Errorf("job %s has unknown status %q", job.JobId, state.Status)
+		}
+	}
+}